@@ -0,0 +1,7 @@
+"""
+Benchmarks for the hot paths of the heater interface.
+Run from the repository root:
+
+    python -m Benchmarks.bench                    # run and compare against Benchmarks/baseline.json
+    python -m Benchmarks.bench --save-baseline    # run and store the results as new baseline
+"""
@@ -0,0 +1,389 @@
+"""
+Benchmark runner. Measures protocol encode/decode throughput, the per-batch cost of the GUI side
+of the acquisition loop, plot updates and CSV export, writes the results as JSON and compares them
+against a baseline stored on the same machine with --save-baseline (results of different hosts are
+not comparable). Exits with status 1 if a gated result regressed beyond the tolerance, or with
+--require-baseline (for CI) if there is no baseline to compare against. Worst-case times are reported
+for information only, they vary too much between runs to be gated.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from Benchmarks import fakes
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+
+
+def timed(fn, *args):
+    """Run fn once and return the elapsed time in seconds"""
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def best_of(repeat, fn, *args):
+    return min(timed(fn, *args) for _ in range(repeat))
+
+
+def result(value, unit, better, gate=True):
+    return {"value": value, "unit": unit, "better": better, "gate": gate}
+
+
+def bench_encode(results):
+    from pycomm import Comm, MSG
+
+    comm = Comm()
+    comm.ser = fakes.FakeSerial()
+    n = 50000
+
+    def encode():
+        for i in range(n):
+            comm.add_variable_token(float(i), MSG.T_SETPOINT)
+            if comm.tx_buf_pos > 100:
+                comm.transmit()
+        comm.transmit()
+
+    t = best_of(3, encode)
+    results["comm_encode"] = result(n / t, "tokens/s", "higher")
+
+    def post():
+        for i in range(n):
+            comm.post(MSG.PID_P, float(i))
+            comm.post(MSG.PID_I, float(i))
+            comm.post(MSG.ACK)
+            comm.flush()
+
+    t = best_of(3, post)
+    results["comm_post_flush"] = result(3*n / t, "tokens/s", "higher")
+
+
+def bench_decode(results):
+    from pycomm import Comm
+    from simulator import VirtualHeater
+
+    # Realistic telemetry: batches of 10 temperature/current samples plus status
+    sim = VirtualHeater(samples_per_batch=10)
+    stream = b''.join(sim.step(i * 0.01) for i in range(2000))
+
+    comm = Comm()
+    comm.ser = fakes.FakeSerial()
+
+    def decode():
+        comm.ser.rx_data[:] = stream
+        count = 0
+        for rxm in comm.read_messages():
+            comm.schemas.decode(rxm)
+            count += 1
+        return count
+
+    tokens = decode()
+    t = best_of(3, decode)
+    results["comm_decode"] = result(tokens / t, "tokens/s", "higher")
+
+
+def bench_handle_serial(results, heater):
+    from pycomm import MSG
+
+    batch = 30
+    ring = heater.device.ring
+    samples = []
+    for i in range(batch):
+        samples.append((float(i), MSG.T_ACTUAL, 20.0 + i))
+        samples.append((float(i), MSG.CURRENT, 1.0))
+    samples.append((float(batch), MSG.STATUS, 1))
+
+    def handle():
+        for _ in range(200):
+            for sample in samples:
+                ring.push(sample)
+            heater.handle_Serial()
+
+    heater.clear_plot()
+    t = best_of(3, handle)
+    results["handle_serial_batch"] = result(t / 200 * 1e6, "us/batch", "lower")
+
+    from commands import Command, Outcome
+
+    acked = Command(MSG.T_SETPOINT, 25.0, 0.5, 0)
+    acked.future.set_result(Outcome.ACK)
+    rejected = Command(MSG.START, None, 0.5, 0)
+    rejected.future.set_result(Outcome.NACK)
+
+    def ack():
+        for _ in range(10000):
+            heater.command_done(heater.device, acked)
+            heater.command_done(heater.device, rejected)
+
+    t = best_of(3, ack)
+    results["handle_ack_nack"] = result(t / 20000 * 1e6, "us/call", "lower")
+
+
+def bench_update_plot(results, heater):
+    import numpy as np
+
+    # Redraw after every sample instead of at most cfg.plot_refresh_rate times per second, so every
+    # timed iteration does the work of a frame
+    refresh_rate = heater.cfg.plot_refresh_rate
+    heater.cfg.plot_refresh_rate = float("inf")
+
+    device = heater.device
+    for n in (10000, 100000, 1000000):
+        # Prefill the record with n samples
+        heater.clear_plot()
+        device.temperature.extend(np.full(n, 20.0))
+        device.setpoint.extend(np.full(n, 25.0))
+        device.timestamp.extend(np.arange(n, dtype=float))
+        device.status_history.extend(np.ones(n, dtype=np.int32))
+        device.current.extend(np.full(n // 2, 1.5))
+        device.current_timestamp.extend(np.arange(0, n, 2, dtype=float))
+        heater.rebuild_Plot()
+
+        # Three runs of 1000 samples, each followed by a plot update and a redraw
+        runs = []
+        for run in range(3):
+            times = []
+            for i in range(run*1000, (run + 1)*1000):
+                device.temperature.append(20.0)
+                device.setpoint.append(25.0)
+                device.timestamp.append(float(n + i))
+                device.status_history.append(1)
+                if i % 2 == 0:
+                    device.current.append(1.5)
+                    device.current_timestamp.append(float(n + i))
+
+                t0 = time.perf_counter()
+                heater.update_Plot()
+                heater.refresh_Plot()
+                times.append(time.perf_counter() - t0)
+            runs.append(times)
+
+        samples = [t for times in runs for t in times]
+        mean = statistics.median(sum(times) / len(times) for times in runs)
+        results[f"update_plot_{n}_mean"] = result(mean * 1e6, "us/sample", "lower")
+        results[f"update_plot_{n}_median"] = result(statistics.median(samples) * 1e6, "us/sample", "lower")
+        results[f"update_plot_{n}_max"] = result(max(samples) * 1e6, "us/sample", "lower", gate=False)
+
+    heater.cfg.plot_refresh_rate = refresh_rate
+    heater.clear_plot()
+
+
+def bench_save_plot(results, heater):
+    import numpy as np
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            device = heater.device
+            for n in (10000, 100000):
+                heater.clear_plot()
+                device.temperature.extend(np.full(n, 20.0))
+                device.setpoint.extend(np.full(n, 25.0))
+                device.timestamp.extend(np.arange(n, dtype=float))
+                device.status_history.extend(np.ones(n))
+
+                # Current at a different rate, rows are aligned by timestamp
+                device.current.extend(np.full(n // 2, 1.0))
+                device.current_timestamp.extend(np.arange(n // 2) * 2.0 + 0.5)
+
+                t = best_of(2, heater.save_plot)
+                results[f"save_plot_{n}"] = result(t * 1e3, "ms", "lower")
+        finally:
+            os.chdir(cwd)
+            heater.clear_plot()
+
+
+def bench_replay(results, heater):
+    from capture import TraceWriter, RX
+    from simulator import VirtualHeater
+
+    # Trace of 2000 batches of simulated telemetry, replayed as fast as possible through Comm, the I/O
+    # thread of the DeviceManager and handle_Serial()
+    sim = VirtualHeater(samples_per_batch=10)
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "trace.dht")
+        trace = TraceWriter(filename)
+        for i in range(2000):
+            trace.write(RX, sim.step(i * 0.01))
+        trace.close()
+
+        def replay():
+            device = heater.manager.add("replay", f"replay://{filename}?speed=max")
+            heater.manager.connect(device)
+            heater.show_device(device)
+            try:
+                deadline = time.monotonic() + 60.0
+                while len(device.temperature) < 2000*10 and time.monotonic() < deadline:
+                    heater.handle_Serial()
+                    time.sleep(0.001)
+            finally:
+                heater.manager.remove("replay")
+                heater.show_device(heater.manager["bench"])
+
+        heater.manager.start()
+        try:
+            t = best_of(3, replay)
+        finally:
+            heater.manager.stop()
+        results["replay_trace"] = result(2000 / t, "batches/s", "higher")
+
+
+def bench_clock(results, heater):
+    n = 100000
+
+    def stamp():
+        for _ in range(n):
+            heater.timebase()
+
+    t = best_of(3, stamp)
+    results["timebase_call"] = result(t / n * 1e9, "ns/call", "lower")
+
+
+def bench_log(results):
+    from logger import mvLogger
+
+    # Firmware flooding the same error, and distinct messages. The log is rendered every 100 messages like
+    # once per frame
+    def flood(distinct):
+        log = mvLogger(parent="Log Window")
+        for i in range(100000):
+            log.log_debug(f"Error {i}" if distinct else "Error")
+            if i % 100 == 99:
+                log.render()
+
+    results["log_flood_repeated"] = result(best_of(3, flood, False) / 100000 * 1e6, "us/message", "lower")
+    results["log_flood_distinct"] = result(best_of(3, flood, True) / 100000 * 1e6, "us/message", "lower")
+
+
+def bench_startup(results):
+    import subprocess
+
+    # Fresh interpreter per run, so imports are not cached. The startup of the GUI against the stubs covers the
+    # Python side: imports, building the widgets and the work done before and after the first frame
+    code = ("import sys; sys.path.insert(0, sys.argv[1]); from Benchmarks import fakes; fakes.install(); "
+            "from startup import timer; import heater; heater.run(); "
+            "print(timer.elapsed('imports'), timer.elapsed('first frame'), timer.elapsed('fonts and icons'))")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for _ in range(5):
+        output = subprocess.run([sys.executable, "-c", code, root], capture_output=True, text=True, check=True).stdout
+        runs.append([float(t) for t in output.split()])
+
+    imports, first_frame, complete = (min(r[i] for r in runs) for i in range(3))
+    results["startup_imports"] = result(imports * 1e3, "ms", "lower")
+    results["startup_first_frame"] = result(first_frame * 1e3, "ms", "lower")
+    results["startup_complete"] = result(complete * 1e3, "ms", "lower")
+
+
+def bench_record(results):
+    import numpy as np
+    from record import ChunkedArray
+
+    # Memory of the full record per temperature sample: temperature, setpoint, timestamp, current and its timestamp
+    n = 1000000
+    columns = [ChunkedArray(np.float32), ChunkedArray(np.float32), ChunkedArray(np.float64),
+               ChunkedArray(np.float32), ChunkedArray(np.float64)]
+
+    def append():
+        for column in columns:
+            column.clear()
+        for i in range(n):
+            for column in columns:
+                column.append(i)
+
+    t = best_of(1, append)
+    results["record_append"] = result(n * len(columns) / t, "values/s", "higher")
+    results["record_memory"] = result(sum(c.nbytes for c in columns) / n, "bytes/sample", "lower")
+
+
+def run():
+    heater = fakes.import_heater()
+    results = {}
+
+    bench_encode(results)
+    bench_decode(results)
+    bench_handle_serial(results, heater)
+    bench_update_plot(results, heater)
+    bench_save_plot(results, heater)
+    bench_replay(results, heater)
+    bench_clock(results, heater)
+    bench_record(results)
+    bench_log(results)
+    bench_startup(results)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print results next to the baseline. Returns the names of regressed benchmarks"""
+    regressions = []
+    print(f"{'benchmark':<28}{'result':>16}{'baseline':>16}{'change':>10}  unit")
+    for name, res in results.items():
+        value = res["value"]
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<28}{value:>16.2f}{'-':>16}{'':>10}  {res['unit']}")
+            continue
+
+        base = base["value"]
+        change = (value - base) / base if base else 0.0
+        regressed = change < -tolerance if res["better"] == "higher" else change > tolerance
+        if not res.get("gate", True):
+            regressed = False
+            flag = "  (info)"
+        else:
+            flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<28}{value:>16.2f}{base:>16.2f}{change:>+10.1%}  {res['unit']}{flag}")
+        if regressed:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the diamond heater interface")
+    parser.add_argument("--output", default=RESULTS, help="file to write the results to (JSON)")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline to compare against (JSON)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--require-baseline", action="store_true", help="fail if there is no baseline")
+    args = parser.parse_args()
+
+    results = run()
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        compare(results, {}, args.tolerance)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        if args.require_baseline:
+            return 1
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
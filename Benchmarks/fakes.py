@@ -0,0 +1,115 @@
+"""
+Stand-ins for the serial port and DearPyGui, so the interface code can be benchmarked without
+hardware or a window.
+"""
+
+import contextlib
+import os
+import sys
+import types
+
+# Interface modules are imported as top-level modules, like in __main__.py
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "DiamonHeaterInterface")
+
+
+class FakeSerial:
+    """In-memory serial port. Bytes put into rx_data are read by Comm, written bytes are counted"""
+
+    def __init__(self):
+        self.rx_data = bytearray()
+        self.is_open = True
+        self.timeout = 0
+        self.bytes_written = 0
+        self.writes = 0
+        self.reads = 0
+
+    @property
+    def in_waiting(self):
+        return len(self.rx_data)
+
+    def read(self, n=1):
+        self.reads += 1
+        data = bytes(self.rx_data[:n])
+        del self.rx_data[:n]
+        return data
+
+    def write(self, data):
+        self.writes += 1
+        self.bytes_written += len(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        self.rx_data.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+# Container items used as context managers
+_CONTAINERS = {"window", "child_window", "group", "menu", "menu_bar", "plot", "font_registry", "texture_registry",
+               "item_handler_registry", "theme", "theme_component", "table", "table_row"}
+
+
+class _FakeDpg(types.ModuleType):
+    """dearpygui.dearpygui replacement: every function is a no-op, get_value returns 0.0.
+    Items are 1000 x 500 pixels, axes span 0 to 1 and images are one transparent pixel.
+    The render loop ends immediately"""
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name in _CONTAINERS:
+            return lambda *args, **kwargs: contextlib.nullcontext()
+        if name == "load_image":
+            return lambda *args, **kwargs: (1, 1, 4, [0.0, 0.0, 0.0, 0.0])
+        if name == "get_value":
+            return lambda *args, **kwargs: 0.0
+        if name == "get_item_rect_size":
+            return lambda *args, **kwargs: [1000, 500]
+        if name == "get_axis_limits":
+            return lambda *args, **kwargs: [0.0, 1.0]
+        return lambda *args, **kwargs: None
+
+
+class NullLog:
+    """mvLogger replacement that discards all messages"""
+
+    def _log(self, message, level):
+        pass
+
+    def log(self, message):
+        pass
+
+    log_debug = log_info = log_warning = log_error = log_critical = log
+
+    def render(self):
+        pass
+
+
+def install():
+    """Make the interface modules importable and replace dearpygui with a stub"""
+    if PACKAGE_DIR not in sys.path:
+        sys.path.insert(0, PACKAGE_DIR)
+
+    dpg = _FakeDpg("dearpygui.dearpygui")
+    package = types.ModuleType("dearpygui")
+    package.dearpygui = dpg
+    sys.modules["dearpygui"] = package
+    sys.modules["dearpygui.dearpygui"] = dpg
+
+
+def import_heater():
+    """Import heater.py against the stubs, with a silent logger and a device on a fake serial port
+    selected in the GUI"""
+    install()
+    import heater
+    heater.log = NullLog()
+    heater.init_acquisition()
+
+    device = heater.manager.add("bench")
+    device.comm.ser = FakeSerial()
+    heater.show_device(device)
+    return heater
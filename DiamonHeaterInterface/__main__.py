@@ -1,3 +1,17 @@
-from heater import run
+import os
+import sys
 
-run()
\ No newline at end of file
+# Modules of the interface import each other as top-level modules, also when run with python -m DiamonHeaterInterface
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Imported first, startup phases are timed from here
+from startup import timer
+
+if "--headless" in sys.argv[1:]:
+    # Acquisition and recording only, DearPyGui is not imported
+    from headless import main
+    main([arg for arg in sys.argv[1:] if arg != "--headless"])
+else:
+    timer.enabled = timer.enabled or "--startup-profile" in sys.argv[1:]
+    from heater import run
+    run()
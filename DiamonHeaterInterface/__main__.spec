@@ -5,32 +5,33 @@ a = Analysis(
     ['__main__.py'],
     pathex=['.'],
     binaries=[],
+    # Only the fonts in use, every bundled file is unpacked or scanned at startup
     datas=[('Icons', 'Icons'),
-           ('Fonts', 'Fonts'),
+           ('Fonts/fonts-DSEG_v046/DSEG7-Classic/DSEG7Classic-Regular.ttf', 'Fonts/fonts-DSEG_v046/DSEG7-Classic'),
+           ('Fonts/arial/arial.ttf', 'Fonts/arial'),
     ],  
-    hiddenimports=['heater'],  # Add heater back to hiddenimports so it can be imported
+    hiddenimports=['heater', 'headless'],  # Add heater and headless back to hiddenimports so they can be imported
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['tkinter', 'matplotlib', 'PIL'],  # Installed with the requirements, but not used by the interface
     noarchive=False,
     optimize=0,
 )
 pyz = PYZ(a.pure)
 
+# One-folder build: a one-file executable unpacks itself into a temporary directory on every start.
+# UPX is off, compressed libraries are decompressed on every start as well
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='Diamond Heater',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -39,3 +40,12 @@ exe = EXE(
     entitlements_file=None,
     icon='Icons/Icon.ico', 
 )
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='Diamond Heater',
+)
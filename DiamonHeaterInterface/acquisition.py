@@ -0,0 +1,173 @@
+"""
+Background serial acquisition.
+The I/O thread of the DeviceManager reads the serial ports, decodes incoming messages continuously,
+timestamps them on arrival and pushes them into a preallocated ring buffer. The GUI drains the
+ring buffer once per rendered frame, so slow frames do not delay reading or timestamping.
+"""
+
+import threading
+import time
+from pycomm import MSG
+from metrics import metrics
+
+# Pipeline metrics, see metrics.py
+TOKENS_IN     = metrics.counter("acquisition.tokens_in")
+DECODE_TIME   = metrics.histogram("acquisition.decode_time", "s")    # Decoding of the bytes of one read
+RING_OVERRUNS = metrics.counter("acquisition.ring_overruns")
+ACK_INTERVAL  = metrics.histogram("watchdog.ack_interval", "s")      # Time between watchdog ACKs of a device
+
+
+class SampleRing:
+    """Preallocated single-producer/single-consumer ring buffer.
+
+    The producer only writes head, the consumer only writes tail. Each index is a single
+    attribute store, so no lock is needed between the acquisition thread and the GUI.
+    """
+
+    def __init__(self, size=65536):
+        self.size = size
+        self.slots = [None] * size
+        self.head = 0       # Total number of pushed samples (producer)
+        self.tail = 0       # Total number of drained samples (consumer)
+        self.overruns = 0   # Samples dropped because the ring was full
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def push(self, sample):
+        head = self.head
+        if head - self.tail >= self.size:
+            self.overruns += 1
+            RING_OVERRUNS.inc()
+            return False
+
+        self.slots[head % self.size] = sample
+        self.head = head + 1
+        return True
+
+    def drain(self):
+        """Remove and return all samples pushed so far, oldest first"""
+        head = self.head
+        tail = self.tail
+        if head == tail:
+            return []
+
+        i = tail % self.size
+        j = head % self.size
+        if i < j:
+            samples = self.slots[i:j]
+        else:
+            samples = self.slots[i:] + self.slots[:j]
+
+        self.tail = head
+        return samples
+
+
+class Acquisition:
+    """Decodes the messages received by a Comm instance into a SampleRing.
+
+    Every sample in the ring is a tuple (time, msg, value). For ACK and NACK, value is the
+    message id of the acknowledged command, which also completes the pending command of
+    the Comm instance (see commands.py). After every complete batch (MSG_END) the
+    watchdog of the controller is fed with an ACK, as it is periodically by Watchdog
+    (see watchdog.py).
+    """
+
+    def __init__(self, comm, clock=time.time, ring_size=65536):
+        self.comm = comm
+        self.clock = clock                  # Timestamp source for received samples
+        self.ring = SampleRing(ring_size)
+
+        self._ack = None                    # ACK/NACK waiting for the command id
+        self._discarded = 0                 # Bytes discarded by the framed decoder so far
+        self._t_ack = None                  # time.perf_counter() of the last watchdog ACK
+        self._ack_gap = 0.0                 # Longest time between two watchdog ACKs since take_ack_gap()
+        self._ack_lock = threading.Lock()   # Guards _t_ack and _ack_gap, unlike tx_lock never held while writing
+
+    def drain(self):
+        return self.ring.drain()
+
+    def poll(self, min_bytes=0):
+        """Read and decode everything waiting on the port. Returns the number of bytes read"""
+        try:
+            n = self.comm.read_available(min_bytes)
+            if n:
+                self.process(self.clock())
+            return n
+
+        except Exception as e:
+            self.ring.push((self.clock(), MSG.ERROR_MSG, f"Serial communication failed: {e}"))
+            raise
+
+    def feed_watchdog(self, lock_timeout=-1):
+        """Send an ACK to feed the watchdog of the controller. Queued commands go out in the same frame.
+        Raises TimeoutError if another thread holds the transmit buffer for longer than lock_timeout seconds"""
+        if not self.comm.tx_lock.acquire(timeout=lock_timeout):
+            raise TimeoutError("Transmit buffer is busy")
+        try:
+            self.comm.post(MSG.ACK)
+            self.comm.flush()
+
+            now = time.perf_counter()
+            with self._ack_lock:
+                if self._t_ack is not None:
+                    gap = now - self._t_ack
+                    ACK_INTERVAL.observe(gap)
+                    self._ack_gap = max(self._ack_gap, gap)
+                self._t_ack = now
+        finally:
+            self.comm.tx_lock.release()
+
+    def take_ack_gap(self):
+        """Longest time between two watchdog ACKs since the last call, including the time since the last ACK,
+        so a port that fails every write keeps growing the gap"""
+        with self._ack_lock:
+            gap, self._ack_gap = self._ack_gap, 0.0
+            if self._t_ack is not None:
+                gap = max(gap, time.perf_counter() - self._t_ack)
+        return gap
+
+    def check_commands(self):
+        """Post again the commands whose acknowledgement is overdue, fail those out of retries"""
+        for command in self.comm.pending.expire():
+            try:
+                self.comm.post(command.msg, command.data)
+            except Exception:
+                # Urgent command could not be written. Not sent, it fails at its next deadline
+                pass
+
+    def process(self, t):
+        """Decode all complete messages in the receive buffer, timestamped with t"""
+        t0 = time.perf_counter()
+        n = 0
+        for rxm in self.comm.rx.messages():
+            self._handle(rxm, t)
+            n += 1
+        TOKENS_IN.inc(n)
+        DECODE_TIME.observe(time.perf_counter() - t0)
+
+        # Report corrupted data skipped by the framed decoder
+        discarded = getattr(self.comm.rx, "discarded", 0)
+        if discarded != self._discarded:
+            self.ring.push((t, MSG.ERROR_MSG, f"Discarded {discarded - self._discarded} corrupted bytes"))
+            self._discarded = discarded
+
+    def _handle(self, rxm, t):
+        # Message following an ACK/NACK names the acknowledged command
+        if self._ack is not None:
+            self.comm.pending.complete(rxm.msg, self._ack == MSG.ACK)
+            self.ring.push((t, self._ack, rxm.msg))
+            self._ack = None
+
+        elif rxm.msg == MSG.ACK or rxm.msg == MSG.NACK:
+            self._ack = rxm.msg
+
+        elif rxm.msg == MSG.MSG_END:
+            # Acknowledge reception and feed the watchdog. If the controller does not receive this Ack over five seconds, it resets
+            self.feed_watchdog()
+
+        else:
+            # Controller was reset and forgot the commands it did not acknowledge yet
+            if rxm.msg == MSG.RESET:
+                self.comm.pending.cancel()
+            self.ring.push((t, rxm.msg, self.comm.schemas.decode(rxm)))
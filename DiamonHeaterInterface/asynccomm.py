@@ -0,0 +1,183 @@
+"""
+asyncio transport for the pycomm protocol.
+AsyncComm has the same token API as Comm. Received data is read when the event loop reports the
+serial file descriptor as readable, so several ports can share one event loop without threads or
+polling. Ports without a file descriptor (Windows COM ports, pyserial loop://) fall back to polling.
+Commands sent with request() are completed by their ACK/NACK and retried while messages() is iterated.
+"""
+
+import asyncio
+import io
+import os
+import time
+from pycomm import Comm, MSG, BYTES_OUT, FRAMES_OUT
+from capture import TX
+
+
+class AsyncComm(Comm):
+    """Serial communication driven by an asyncio event loop.
+
+    Usage:
+        comm = AsyncComm()
+        await comm.open("/dev/ttyACM0")
+        comm.add_variable_token(25.0, MSG.T_SETPOINT)
+        await comm.send()
+        async for msg in comm.messages():
+            ...
+
+    Acknowledged commands (START, STOP, T_SETPOINT) can be awaited while messages() runs:
+        command = comm.request(MSG.T_SETPOINT, 25.0)
+        await comm.send()
+        outcome = await command
+    """
+
+    def __init__(self, port=None, baud_rate=115200, write_timeout=1, poll_interval=0.01, framed=False):
+        # Reads never block, data is only read when it is available
+        super().__init__(port=None, baud_rate=baud_rate, timeout=0, write_timeout=write_timeout, framed=framed)
+
+        self.poll_interval = poll_interval  # Read interval for ports without a file descriptor
+        self.loop = None
+        self.fd = None                      # Registered file descriptor, None when polling
+
+        self._data = asyncio.Event()        # Set when new bytes were read into the decoder
+        self._error = None                  # Exception raised while reading in the reader callback
+        self._send_lock = asyncio.Lock()    # Keeps frames of concurrent send() calls in one piece
+        self._ack = None                    # ACK/NACK waiting for the command id
+        self._port = port
+
+    async def open(self, port=None):
+        """Open the port and register it with the running event loop"""
+        if port is None:
+            port = self._port
+
+        self.detach()
+        self.connect(port)
+        self._port = port
+        self.loop = asyncio.get_running_loop()
+        self._error = None
+        self._ack = None
+
+        try:
+            fd = self.ser.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            fd = None
+
+        if fd is not None:
+            self.fd = fd
+            self.loop.add_reader(fd, self._on_readable)
+
+    def detach(self):
+        """Unregister the port from the event loop"""
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.fd = None
+
+    def disconnect(self):
+        self.detach()
+        super().disconnect()
+
+    def close(self):
+        self.detach()
+        super().close()
+
+    def _on_readable(self):
+        try:
+            self.read_available(1)
+        except Exception as e:
+            # Port was closed or unplugged. Stop watching it and let messages() raise
+            self._error = e
+            self.detach()
+        self._data.set()
+
+    async def messages(self):
+        """Asynchronously yield every received message. The message following an ACK/NACK names the
+        acknowledged command and completes its pending command, see request()"""
+        while True:
+            # Cleared before the decoder is drained, so data read by the reader callback from now on
+            # (e.g. while awaiting check_commands()) ends the wait below
+            self._data.clear()
+            for rxm in self.rx.messages():
+                if self._ack is not None:
+                    self.pending.complete(rxm.msg, self._ack == MSG.ACK)
+                    self._ack = None
+                elif rxm.msg == MSG.ACK or rxm.msg == MSG.NACK:
+                    self._ack = rxm.msg
+                yield rxm
+
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+
+            await self.check_commands()
+
+            # Wake up for the next deadline of a pending command
+            timeout = None
+            deadline = self.pending.next_deadline()
+            if deadline is not None:
+                timeout = max(deadline - time.perf_counter(), 0.0)
+
+            if self.fd is None:
+                if self.read_available() == 0:
+                    await asyncio.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+            else:
+                try:
+                    await asyncio.wait_for(self._data.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def check_commands(self):
+        """Send again the commands whose acknowledgement is overdue, fail those out of retries"""
+        retry = self.pending.expire()
+        if retry:
+            for command in retry:
+                self.post(command.msg, command.data)
+            await self.send()
+
+    async def recv(self):
+        """Return the next received message"""
+        async for rxm in self.messages():
+            return rxm
+
+    async def send(self):
+        """Transmit queued commands and the contents of the transmit buffer without blocking the event loop"""
+        async with self._send_lock:
+            done = False
+            while not done:
+                with self.tx_lock:
+                    done = self.pack_outbox()
+                    frame = self.take_frame()
+
+                if frame:
+                    await self._write(frame)
+
+    async def _write(self, frame):
+        FRAMES_OUT.inc()
+        BYTES_OUT.inc(len(frame))
+        if self.capture is not None:
+            self.capture.write(TX, frame)
+
+        if self.fd is None:
+            self.ser.write(frame)
+            return
+
+        # Port is opened non-blocking, write what fits and wait until the rest can be written
+        view = memoryview(frame)
+        while view:
+            try:
+                n = os.write(self.fd, view)
+            except BlockingIOError:
+                n = 0
+            view = view[n:]
+            if view:
+                await self._writable()
+
+    def _writable(self):
+        future = self.loop.create_future()
+
+        def on_writable():
+            self.loop.remove_writer(self.fd)
+            if not future.done():
+                future.set_result(None)
+
+        self.loop.add_writer(self.fd, on_writable)
+        return future
@@ -0,0 +1,225 @@
+"""
+Raw serial capture and replay.
+A TraceWriter records every chunk of bytes read from (and written to) the serial port by Comm, with a
+monotonic timestamp. ReplaySerial is a serial port that plays the received bytes of a trace back, either
+in real time, faster, or as fast as they are read. Comm and the GUI open it like any other port:
+
+    replay://path/to/trace.dht                 real time
+    replay://path/to/trace.dht?speed=100       100x faster
+    replay://path/to/trace.dht?speed=max       as fast as possible
+
+Trace layout: file header (magic, version, flags, wall time at start) followed by one record per chunk
+(nanoseconds since the start, direction, length) and its bytes.
+"""
+
+import threading
+import time
+from bisect import bisect_right
+from itertools import accumulate
+from struct import Struct
+from urllib.parse import parse_qs
+import serial
+
+MAGIC = b'DHTRACE\n'
+VERSION = 1
+
+FILE_HEADER = Struct('<8sHBd')      # magic, version, flags, wall time at start
+CHUNK_HEADER = Struct('<QBI')       # nanoseconds since start, direction, length
+
+FLAG_FRAMED = 0b1                   # Stream uses frames with sync marker and CRC
+
+# Direction of a chunk
+RX = 0                              # Received from the controller
+TX = 1                              # Sent by the host
+
+REPLAY_SCHEME = "replay://"
+
+
+class TraceWriter:
+    """Appends chunks to a trace file. Thread-safe, receiving and sending may happen in different threads"""
+
+    def __init__(self, filename, framed=False):
+        self.filename = filename
+        self.chunks = 0
+        self.bytes = 0
+
+        self._lock = threading.Lock()
+        self._t_start = time.monotonic_ns()
+        self._file = open(filename, 'wb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, FLAG_FRAMED if framed else 0, time.time()))
+
+    def write(self, direction, data):
+        t = time.monotonic_ns() - self._t_start
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(CHUNK_HEADER.pack(t, direction, len(data)))
+            self._file.write(data)
+            self.chunks += 1
+            self.bytes += len(data)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Trace:
+    """Trace file read into memory. Chunks are (nanoseconds since start, direction, data) with data
+    being a view into the file contents"""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as file:
+            self.data = file.read()
+
+        if len(self.data) < FILE_HEADER.size:
+            raise ValueError(f"{filename} is not a trace file")
+        magic, version, flags, self.started = FILE_HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a trace file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported trace file version {version}")
+        self.framed = bool(flags & FLAG_FRAMED)
+
+        view = memoryview(self.data)
+        self.chunks = []
+        pos = FILE_HEADER.size
+        while pos + CHUNK_HEADER.size <= len(self.data):
+            t, direction, length = CHUNK_HEADER.unpack_from(self.data, pos)
+            pos += CHUNK_HEADER.size
+            if pos + length > len(self.data):
+                break   # Capture was cut off
+            self.chunks.append((t, direction, view[pos:pos + length]))
+            pos += length
+
+    def received(self):
+        """Chunks received from the controller"""
+        return [chunk for chunk in self.chunks if chunk[1] == RX]
+
+
+def parse_replay_url(url):
+    """Return filename and speed of a replay:// URL. Speed None means as fast as possible"""
+    path, _, query = url[len(REPLAY_SCHEME):].partition('?')
+    speed = parse_qs(query).get('speed', ['1'])[-1]
+    if speed == 'max':
+        return path, None
+
+    speed = float(speed)
+    return path, speed if speed > 0 else None
+
+
+class ReplaySerial(serial.SerialBase):
+    """Serial port that receives the bytes of a trace. Written bytes are discarded.
+    With a speed, chunks become readable at their recorded time divided by the speed. Without, all remaining
+    chunks are readable at once, up to MAX_WAITING bytes, like the input buffer of a very fast port"""
+
+    MAX_WAITING = 65536     # Bytes readable at once without speed, so one read does not overrun the sample ring
+
+    def open(self):
+        if self._port is None:
+            raise serial.SerialException("Port must be configured before it can be used.")
+        if self.is_open:
+            raise serial.SerialException("Port is already open.")
+
+        self.filename, self.speed = parse_replay_url(self._port)
+        try:
+            trace = Trace(self.filename)
+        except (OSError, ValueError) as e:
+            raise serial.SerialException(f"Could not open trace {self.filename}: {e}")
+
+        chunks = trace.received()
+        self._times = [t for t, _, _ in chunks]
+        self._chunks = [data for _, _, data in chunks]
+        self._ends = list(accumulate(len(data) for data in self._chunks))
+        self._index = 0         # Next chunk to read
+        self._offset = 0        # Bytes of the next chunk already read
+        self._t_start = time.monotonic_ns()
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def _reconfigure_port(self):
+        pass
+
+    @property
+    def done(self):
+        """All chunks of the trace were read"""
+        return self._index == len(self._chunks)
+
+    def _available(self):
+        """Number of chunks that are due"""
+        if self.speed is None:
+            consumed = self._ends[self._index - 1] if self._index else 0
+            n = bisect_right(self._ends, consumed + self._offset + self.MAX_WAITING, self._index)
+            return min(max(n, self._index + 1), len(self._chunks))
+        elapsed = (time.monotonic_ns() - self._t_start) * self.speed
+        return bisect_right(self._times, elapsed)
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        n = self._available()
+        if n <= self._index:
+            return 0
+        consumed = self._ends[self._index - 1] if self._index else 0
+        return self._ends[n - 1] - consumed - self._offset
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        data = bytearray()
+        while len(data) < size:
+            n = self._available()
+            while self._index < n and len(data) < size:
+                chunk = self._chunks[self._index]
+                count = min(len(chunk) - self._offset, size - len(data))
+                data += chunk[self._offset:self._offset + count]
+                self._offset += count
+                if self._offset == len(chunk):
+                    self._index += 1
+                    self._offset = 0
+
+            if len(data) == size or self.done:
+                break
+            if self.speed is None:
+                continue
+
+            # Wait for the next chunk, up to the timeout
+            wait = (self._times[self._index] / self.speed - (time.monotonic_ns() - self._t_start)) / 1e9
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                wait = min(wait, remaining)
+            time.sleep(max(wait, 0))
+
+        return bytes(data)
+
+    def write(self, data):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        return len(data)
+
+    def reset_input_buffer(self):
+        # The trace is the input, there are no stale bytes to drop
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+
+def serial_for_url(url, *args, **kwargs):
+    """serial.serial_for_url() that also knows replay:// URLs"""
+    if isinstance(url, str) and url.startswith(REPLAY_SCHEME):
+        do_not_open = kwargs.pop('do_not_open', False)
+        port = ReplaySerial(None, *args, **kwargs)
+        port.port = url
+        if not do_not_open:
+            port.open()
+        return port
+    return serial.serial_for_url(url, *args, **kwargs)
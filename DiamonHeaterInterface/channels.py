@@ -0,0 +1,126 @@
+"""
+Live plot series of the acquisition record.
+A Channel names one plotted series and the record columns of a device it is drawn from. LiveSeries binds
+a set of channels to a device and decimates them with one MinMaxPyramid per time column, so all channels
+sampled at the temperature timestamps (temperature, setpoint, status bits) share the update and query
+cost of a single pyramid. Adding a channel is one entry in the channel list.
+"""
+
+import numpy as np
+from pyramid import MinMaxPyramid
+
+
+class BitColumn:
+    """One bit of an integer column (e.g. status_history) as 0/1, shifted by level so several bits can be
+    stacked on one axis. Reads like a ChunkedArray column of the record"""
+
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, column, bit, level=0.0):
+        self.column = column
+        self.bit = bit
+        self.level = level
+
+    def __len__(self):
+        return len(self.column)
+
+    def slice(self, start, stop):
+        return ((self.column.slice(start, stop) >> self.bit) & 1).astype(self.dtype) + self.level
+
+
+class Channel:
+    """Plotted series: values over x, both given as names of record columns of a Device.
+    With bit, values is an integer column and the series shows that bit, drawn at level when clear
+    and level + 1 when set"""
+
+    def __init__(self, name, x, values, axis="y_axis", bit=None, level=0.0):
+        self.name = name
+        self.tag = f"{name} Series"     # DearPyGui tag of the line series
+        self.x = x
+        self.values = values
+        self.axis = axis                # Tag of the y-axis the series belongs to
+        self.bit = bit
+        self.level = level
+
+    def columns(self, device):
+        values = getattr(device, self.values)
+        if self.bit is not None:
+            values = BitColumn(values, self.bit, self.level)
+        return getattr(device, self.x), values
+
+
+class LiveSeries:
+    """Channels of the plot bound to the record of a device.
+
+    update() merges new samples into the pyramids, refresh() returns the series to redraw: all of them
+    after the x-range changed, otherwise only those of time columns that received samples.
+    """
+
+    def __init__(self, channels, chunk_size=1024):
+        self.channels = list(channels)
+        self.chunk_size = chunk_size
+        self.bind(None)
+
+    def bind(self, device):
+        """Draw the channels from the record of device. None shows empty series"""
+        self.device = device
+        self.groups = []        # (pyramid, channels) per time column
+        if device is not None:
+            by_x = {}
+            for channel in self.channels:
+                by_x.setdefault(channel.x, []).append(channel)
+            for channels in by_x.values():
+                columns = [channel.columns(device) for channel in channels]
+                pyramid = MinMaxPyramid(columns[0][0], [values for _, values in columns], self.chunk_size)
+                pyramid.update()
+                self.groups.append((pyramid, channels))
+
+        self._dirty = set(range(len(self.groups)))
+        self._range = None
+        self._empty = True      # Series were never drawn since binding
+
+    def clear(self):
+        """Forget the merged samples, after the record was cleared"""
+        for pyramid, _ in self.groups:
+            pyramid.clear()
+        self._dirty = set(range(len(self.groups)))
+
+    def update(self):
+        """Merge the samples appended to the record since the last update"""
+        for i, (pyramid, _) in enumerate(self.groups):
+            merged = len(pyramid)
+            pyramid.update()
+            if len(pyramid) != merged:
+                self._dirty.add(i)
+
+    def x_range(self):
+        """First and last x-value over all channels"""
+        ranges = [pyramid.x_range() for pyramid, _ in self.groups if len(pyramid)]
+        if not ranges:
+            return 0.0, 0.0
+        return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+    def refresh(self, x_range, max_points, force=False):
+        """Return (channel, x, y) of the series to redraw for the x-range, with at most about max_points
+        points each, as contiguous arrays. Returns an empty list if nothing changed since the last call"""
+        if self.device is None:
+            if not (force or self._empty):
+                return []
+            self._empty = False
+            empty = np.empty(0)
+            return [(channel, empty, empty) for channel in self.channels]
+
+        if force or x_range != self._range or self._empty:
+            groups = range(len(self.groups))
+        else:
+            groups = sorted(self._dirty)
+        self._dirty.clear()
+        self._range = x_range
+        self._empty = False
+
+        series = []
+        for i in groups:
+            pyramid, channels = self.groups[i]
+            x, values = pyramid.query(x_range[0], x_range[1], max_points)
+            series.extend((channel, x, np.ascontiguousarray(y)) for channel, y in zip(channels, values))
+        return series
@@ -0,0 +1,212 @@
+"""
+Tracking of commands acknowledged by the controller (START, STOP, T_SETPOINT).
+Every command sent with Comm.request() is kept in a table of pending commands until the ACK or NACK naming
+its message id arrives. The protocol carries no sequence numbers, so an acknowledgement completes the oldest
+pending command of its message id, which matches the order in which the controller replies. Several commands
+can be in flight at the same time. A command without reply is sent again when its deadline expires, up to
+its number of retries, and then fails with a timeout.
+
+Completion can be waited for from any thread (Command.wait()), awaited in asyncio (await command) or handled
+by a callback. Callbacks are called by run_callbacks(), i.e. by Device.update() in the thread processing the
+received samples, not in the I/O thread.
+"""
+
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from enum import Enum
+from metrics import metrics
+
+ROUND_TRIP = metrics.histogram("commands.round_trip", "s")  # From the last transmission of a command to its ACK/NACK
+RETRIES    = metrics.counter("commands.retries")
+TIMEOUTS   = metrics.counter("commands.timeouts")
+NACKS      = metrics.counter("commands.nacks")
+
+
+class Outcome(Enum):
+    ACK = "acknowledged"
+    NACK = "rejected"
+    TIMEOUT = "not acknowledged"
+    SUPERSEDED = "superseded"       # Replaced by a newer command of the same message id before it was sent
+    CANCELLED = "cancelled"         # Port closed or controller reset while waiting
+
+
+class Command:
+    """A command waiting for its acknowledgement. The result of future is its Outcome"""
+
+    def __init__(self, msg, data, timeout, retries, callback=None):
+        self.msg = msg
+        self.data = data
+        self.timeout = timeout          # Seconds to wait for the reply to each transmission
+        self.retries = retries          # Transmissions after the first one
+        self.callback = callback        # Called as callback(command) once completed, see run_callbacks()
+
+        self.attempts = 0               # Transmissions so far
+        self.sent = False               # Transmitted since the last (re)post
+        self.t_sent = None              # time.perf_counter() of the last transmission
+        self.deadline = None            # time.perf_counter() after which the command is sent again or fails
+        self.round_trip = None          # Seconds from the last transmission to the reply
+        self.future = concurrent.futures.Future()
+
+    def __repr__(self):
+        return f"Command({self.msg!r}, {self.data!r}, outcome={self.outcome})"
+
+    def __await__(self):
+        import asyncio      # Only needed by asyncio users, not imported at startup of the GUI
+
+        # Shielded: cancelling the await (e.g. by asyncio.wait_for) does not cancel the tracked command
+        return asyncio.shield(asyncio.wrap_future(self.future)).__await__()
+
+    def done(self):
+        return self.future.done()
+
+    @property
+    def outcome(self):
+        """Outcome, None while pending or if the future was cancelled"""
+        if not self.future.done() or self.future.cancelled():
+            return None
+        return self.future.result()
+
+    def wait(self, timeout=None):
+        """Block until the command completed. Returns its Outcome, raises TimeoutError after timeout seconds"""
+        return self.future.result(timeout)
+
+
+class PendingCommands:
+    """Commands of one port waiting for their acknowledgement. Thread-safe"""
+
+    def __init__(self, timeout=0.5, retries=2):
+        self.timeout = timeout          # Defaults for new commands
+        self.retries = retries
+
+        self.commands = {}              # Deque of pending commands by message id, oldest first
+        self.finished = deque()         # Completed commands with a callback, see run_callbacks()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(commands) for commands in self.commands.values())
+
+    def __bool__(self):
+        return bool(self.commands)
+
+    def add(self, msg, data=None, timeout=None, retries=None, callback=None):
+        """Track a new command, posted right after. A command of the same message id not sent yet is superseded,
+        as the outbox only keeps the newest value"""
+        command = Command(msg, data, self.timeout if timeout is None else timeout,
+                          self.retries if retries is None else retries, callback)
+        command.deadline = time.perf_counter() + command.timeout
+
+        with self._lock:
+            commands = self.commands.setdefault(msg, deque())
+            for previous in [previous for previous in commands if not previous.sent]:
+                commands.remove(previous)
+                self._finish(previous, Outcome.SUPERSEDED)
+            commands.append(command)
+        return command
+
+    def sent(self, msg):
+        """The command of message id msg was transmitted"""
+        if msg not in self.commands:
+            return
+
+        now = time.perf_counter()
+        with self._lock:
+            for command in self.commands.get(msg, ()):
+                if not command.sent:
+                    command.sent = True
+                    command.attempts += 1
+                    command.t_sent = now
+                    command.deadline = now + command.timeout
+
+    def drop(self, msg=None):
+        """Commands of message id msg (all if None) were removed from the outbox before being sent"""
+        with self._lock:
+            for identifier in list(self.commands) if msg is None else [msg]:
+                for command in [command for command in self.commands.get(identifier, ()) if not command.sent]:
+                    self._remove(command)
+                    self._finish(command, Outcome.SUPERSEDED)
+
+    def complete(self, msg, ack):
+        """ACK (ack=True) or NACK received for message id msg. Returns the completed command, None if
+        no command of this id was pending"""
+        if msg not in self.commands:
+            return None
+
+        now = time.perf_counter()
+        with self._lock:
+            commands = self.commands.get(msg)
+            if not commands:
+                return None
+            command = commands[0]
+            self._remove(command)
+
+            if command.t_sent is not None:
+                command.round_trip = now - command.t_sent
+                ROUND_TRIP.observe(command.round_trip)
+            if not ack:
+                NACKS.inc()
+            self._finish(command, Outcome.ACK if ack else Outcome.NACK)
+        return command
+
+    def expire(self, now=None):
+        """Fail or retry the commands whose deadline passed. Returns the commands to post again.
+        A command that could not be transmitted before its deadline fails without retry"""
+        if not self.commands:
+            return []
+
+        now = time.perf_counter() if now is None else now
+        retry = []
+        with self._lock:
+            for commands in list(self.commands.values()):
+                for command in list(commands):
+                    if command.deadline > now:
+                        continue
+
+                    # A newer command of the same message id carries on
+                    if command is not commands[-1]:
+                        self._remove(command)
+                        self._finish(command, Outcome.SUPERSEDED)
+                    elif command.sent and command.attempts <= command.retries:
+                        command.sent = False
+                        command.deadline = now + command.timeout
+                        retry.append(command)
+                        RETRIES.inc()
+                    else:
+                        self._remove(command)
+                        self._finish(command, Outcome.TIMEOUT)
+                        TIMEOUTS.inc()
+        return retry
+
+    def next_deadline(self):
+        """Earliest deadline of the pending commands, None if there are none"""
+        with self._lock:
+            return min((command.deadline for commands in self.commands.values() for command in commands), default=None)
+
+    def cancel(self):
+        """Complete all pending commands as cancelled"""
+        with self._lock:
+            for commands in list(self.commands.values()):
+                for command in list(commands):
+                    self._remove(command)
+                    self._finish(command, Outcome.CANCELLED)
+
+    def run_callbacks(self):
+        """Call the callbacks of the commands completed since the last call"""
+        while self.finished:
+            command = self.finished.popleft()
+            command.callback(command)
+
+    def _remove(self, command):
+        commands = self.commands[command.msg]
+        commands.remove(command)
+        if not commands:
+            del self.commands[command.msg]
+
+    def _finish(self, command, outcome):
+        # The future may have been cancelled by a caller
+        if command.future.done():
+            return
+        command.future.set_result(outcome)
+        if command.callback is not None:
+            self.finished.append(command)
@@ -4,9 +4,56 @@ window_width = 1200
 window_height = round(window_width/aspect_ratio)
 top_temperature_window_height = 105
 
-# Plot downsampling. After N_points_max datapoints, the plot gets downsampled by factor of two.
+# Additional entries of the port selection, e.g. pyserial URLs or a recorded trace to replay:
+# "replay://Trace_01-01-2025_12-00-00.dht?speed=100" (see capture.py)
+extra_ports = []
+
+# Serial framing. Batches are wrapped with a sync marker and CRC, so the stream resynchronizes after
+# lost or corrupted bytes. Requires firmware support.
+framed = False
+
+# Plot resolution. Maximal number of points drawn per series, whatever the length of the record.
+# The full record is kept for zooming in and csv export.
 N_points_max = 30000
 
+# Maximal number of plot redraws per second. New samples are drawn with the next redraw
+plot_refresh_rate = 30
+
+# Continuous recording. New rows are appended to the session CSV file every record_flush_interval seconds
+# and synced to disk every record_fsync_interval seconds. A new file is started after record_max_rows rows.
+# record_format is "csv" or "session" (binary, see session.py, convert with python session.py FILE).
+record_format = "csv"
+record_flush_interval = 1.0
+record_fsync_interval = 10.0
+record_max_rows = 1000000
+
+# Offset of the timestamps to wall-clock time is sampled again every clock_sync_interval seconds (see timebase.py)
+clock_sync_interval = 60.0
+
+# Controller watchdog. The controller resets if it receives no ACK for watchdog_timeout seconds. Besides the ACK after
+# every received batch, an ACK is sent every watchdog_period seconds by a separate thread. An alarm is logged when the
+# time between two ACKs left less than watchdog_margin seconds to the timeout
+watchdog_timeout = 5.0
+watchdog_period = 0.5
+watchdog_margin = 2.5
+
+# Writes to a port fail after write_timeout seconds, so one hung port can not delay the watchdog ACKs of the other boards
+write_timeout = 0.1
+
+# Commands acknowledged by the controller (start, stop, setpoint) are sent again if their ACK/NACK does not arrive
+# within command_timeout seconds, up to command_retries times, and then reported as failed
+command_timeout = 0.5
+command_retries = 2
+
+# Pipeline metrics (Tools > Show Pipeline Metrics). With a file name, a snapshot of all metrics is appended to the
+# file every metrics_interval seconds as one JSON object per line.
+metrics_file = None
+metrics_interval = 10.0
+
+# CSV export with the Save button. None: one row per temperature data point with the current as of its timestamp.
+# A rate in Hz resamples all channels to a regular time grid.
+export_rate = None
+
 # Temperature settings
 T_max = 300.0
 T_min = 0
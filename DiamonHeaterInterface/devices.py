@@ -0,0 +1,336 @@
+"""
+Multi-heater support.
+A Device bundles the serial port, acquisition state, records and last known controller state of one
+heater board. DeviceManager services the ports of all devices from a single selector-based I/O thread,
+so many boards can be driven from one process.
+"""
+
+import selectors
+import socket
+import threading
+import time
+import numpy as np
+from pycomm import Comm, MSG
+from record import ChunkedArray
+from acquisition import Acquisition
+from watchdog import Watchdog
+import config as cfg
+
+
+class Device(Acquisition):
+    """One heater board"""
+
+    def __init__(self, name, port, clock=time.time, framed=False, ring_size=65536):
+        # Reads never block, the manager only reads when data is waiting
+        super().__init__(Comm(baud_rate=115200, timeout=0, write_timeout=cfg.write_timeout, framed=framed), clock, ring_size)
+        self.name = name
+        self.port = port
+
+        # Full record of values for plotting and saving to CSV. Measurements are float32 like on the wire,
+        # timestamps need float64
+        self.temperature   = ChunkedArray(np.float32) # Temperature data points
+        self.setpoint      = ChunkedArray(np.float32) # Setpoint data points
+        self.timestamp     = ChunkedArray(np.float64) # Timestamps for temperature data points
+        self.status_history = ChunkedArray(np.int32)  # Status bits at the temperature data points
+
+        self.current           = ChunkedArray(np.float32) # Heater wire current
+        self.current_timestamp = ChunkedArray(np.float64) # Timestamps for current data points
+
+        # Last known state of the controller
+        self.target = 0.0                                   # Temperature setpoint
+        self.pid = [cfg.P_default, cfg.I_default, cfg.D_default]
+        self.status = 0                                     # Status bits, see MSG.STATUS
+        self.running = False                                # Temperature control started
+
+        self.recorder = None    # CsvRecorder streaming the record to disk, None if not recording
+
+        self.comm.pending.timeout = cfg.command_timeout
+        self.comm.pending.retries = cfg.command_retries
+
+    def is_open(self):
+        return self.comm.ser.is_open
+
+    def connect(self):
+        """Open the port and send the PID gains. Raises if the port can not be opened or written"""
+        self.comm.connect(self.port)
+        self.comm.clear_input_buffer()
+        self.comm.pending.cancel()
+        self._ack = None
+        self._t_ack = None
+        self._ack_gap = 0.0
+
+        # Even if the port could be opened, it might not be the Teensy microcontroller and the write will fail
+        self.comm.add_variable_token(self.pid[0], MSG.PID_P)
+        self.comm.add_variable_token(self.pid[1], MSG.PID_I)
+        self.comm.add_variable_token(self.pid[2], MSG.PID_D)
+        self.comm.transmit()
+
+    def disconnect(self):
+        self.comm.disconnect()
+        self.comm.pending.cancel()
+        self.running = False
+
+    # Commands are queued and sent with the next flush of the port. Commands acknowledged by the controller
+    # return their Command, callback(command) is called by update() once it completed, see commands.py
+    def set_setpoint(self, value, callback=None):
+        self.target = value
+        return self.comm.request(MSG.T_SETPOINT, value, callback=callback)
+
+    def set_pid(self, index, value):
+        self.pid[index] = value
+        self.comm.post((MSG.PID_P, MSG.PID_I, MSG.PID_D)[index], value)
+
+    def start(self, callback=None):
+        return self.comm.request(MSG.START, callback=callback)
+
+    def stop(self, callback=None):
+        return self.comm.request(MSG.STOP, callback=callback)
+
+    def reset(self):
+        self.comm.post(MSG.RESET)
+        self.running = False
+
+    def update(self):
+        """Drain received samples into the records and controller state. Returns the drained samples"""
+        samples = self.drain()
+
+        for t, msg, value in samples:
+            if msg == MSG.T_ACTUAL:
+                self.temperature.append(value)
+                self.setpoint.append(self.target)
+                self.timestamp.append(t)
+                self.status_history.append(self.status)
+
+            elif msg == MSG.CURRENT:
+                self.current.append(value)
+                self.current_timestamp.append(t)
+
+            elif msg == MSG.STATUS:
+                self.status = value
+                if value & 0b1110:
+                    self.running = False
+
+            elif msg == MSG.ACK:
+                if value == MSG.START:
+                    self.running = True
+                elif value == MSG.STOP:
+                    self.running = False
+
+            elif msg == MSG.RESET:
+                self.running = False
+
+        self.comm.pending.run_callbacks()
+        return samples
+
+    def clear_record(self):
+        self.temperature.clear()
+        self.setpoint.clear()
+        self.timestamp.clear()
+        self.status_history.clear()
+        self.current.clear()
+        self.current_timestamp.clear()
+
+
+class DeviceManager:
+    """Services the serial ports of many devices from one I/O thread.
+
+    Ports with a file descriptor are watched with a selector, so idle boards cost nothing.
+    Ports without one (Windows COM ports) are polled every poll_interval.
+    The watchdog of every open board is fed by a separate keep-alive thread, see watchdog.py.
+    """
+
+    def __init__(self, clock=time.time, poll_interval=0.02):
+        self.devices = {}                   # Devices by name, in order of creation
+        self.clock = clock                  # Timestamp source for received samples
+        self.poll_interval = poll_interval
+        self.watchdog = Watchdog(self, cfg.watchdog_period, cfg.watchdog_timeout, cfg.watchdog_margin, cfg.write_timeout)
+        self.sync_interval = cfg.clock_sync_interval    # Seconds between syncs of a clock with sync(), see timebase.py
+
+        self.selector = selectors.DefaultSelector()     # Only used by the I/O thread
+        self._ports = {}                    # Serviced devices: (port, file descriptor or None to poll it)
+        self._changed = False               # _ports changed since the I/O thread last applied it to the selector
+        self._lock = threading.Lock()       # Guards _ports, never held while waiting for data
+        self._thread = None
+        self._stop = threading.Event()
+
+        # Writing to the wakeup socket interrupts the I/O thread waiting in select() when devices change
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._selected = {}                 # Devices registered with the selector: (port, file descriptor)
+
+    def __iter__(self):
+        return iter(list(self.devices.values()))
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __getitem__(self, name):
+        return self.devices[name]
+
+    def __contains__(self, name):
+        return name in self.devices
+
+    def add(self, name, port=None, framed=False):
+        """Create a device. The port defaults to the name"""
+        if name in self.devices:
+            raise ValueError(f"Device {name} already exists")
+
+        device = Device(name, port if port is not None else name, clock=self.clock, framed=framed)
+        self.devices[name] = device
+        return device
+
+    def remove(self, name):
+        device = self.devices.pop(name)
+        self.disconnect(device)
+        return device
+
+    def connect(self, device):
+        """Open the port of a device and start servicing it"""
+        device.connect()
+
+        try:
+            fd = device.comm.ser.fileno()
+        except Exception:
+            fd = None
+
+        with self._lock:
+            self._ports[device] = (device.comm.ser, fd)
+            self._changed = True
+        self._wakeup()
+
+    def disconnect(self, device):
+        self._unregister(device)
+        if device.is_open():
+            device.disconnect()
+
+    def is_serviced(self, device):
+        """Port of the device is open and read by the I/O thread. False after it failed"""
+        with self._lock:
+            return device in self._ports
+
+    def _unregister(self, device):
+        with self._lock:
+            if self._ports.pop(device, False) is False:
+                return
+            self._changed = True
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass    # A wakeup is already pending
+
+    def _apply_ports(self):
+        """Bring the selector up to date with the serviced devices. Returns the devices to poll"""
+        with self._lock:
+            ports = dict(self._ports)
+            self._changed = False
+
+        # A reconnected port is registered again, even if it got the same file descriptor
+        for device, port in list(self._selected.items()):
+            if ports.get(device) != port:
+                del self._selected[device]
+                try:
+                    self.selector.unregister(port[1])
+                except (KeyError, ValueError, OSError):
+                    pass    # Closed in the meantime
+
+        polled = []
+        for device, port in ports.items():
+            if port[1] is None:
+                polled.append(device)
+            elif device not in self._selected:
+                try:
+                    self.selector.register(port[1], selectors.EVENT_READ, device)
+                    self._selected[device] = port
+                except (KeyError, ValueError, OSError):
+                    polled.append(device)   # Not selectable, e.g. closed or a regular file
+        return polled
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="DeviceManager", daemon=True)
+        self._thread.start()
+        self.watchdog.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self.watchdog.stop()
+        self._stop.set()
+        self._wakeup()
+        self._thread.join()
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        for device in self:
+            self.disconnect(device)
+
+    def _run(self):
+        next_poll = time.monotonic()    # Next read of the ports without file descriptor
+        next_sync = next_poll + self.sync_interval
+        polled = self._apply_ports()
+        while not self._stop.is_set():
+            # Wait for data on the selected ports, at most until the next poll. The lock is not held while waiting
+            timeout = max(next_poll - time.monotonic(), 0.0) if polled else self.poll_interval
+            ready = []
+            for key, _ in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        self._wakeup_r.recv(4096)
+                    except (BlockingIOError, OSError):
+                        pass
+                else:
+                    ready.append(key.data)
+
+            if self._changed:
+                polled = self._apply_ports()
+
+            now = time.monotonic()
+            if now >= next_poll:
+                ready.extend(polled)
+                next_poll = now + self.poll_interval
+
+            # Skip devices disconnected while waiting
+            if ready:
+                with self._lock:
+                    ready = [device for device in ready if device in self._ports]
+
+            # Follow adjustments of the wall clock and daylight saving time
+            if now >= next_sync:
+                if hasattr(self.clock, "sync"):
+                    self.clock.sync()
+                next_sync = now + self.sync_interval
+
+            for device in ready:
+                self._service(device)
+
+            # Send commands of boards that did not transmit anything, including retries of unacknowledged commands
+            for device in self:
+                if device.comm.pending and device.is_open():
+                    try:
+                        device.check_commands()
+                    except Exception as e:
+                        device.ring.push((self.clock(), MSG.ERROR_MSG, f"Failed to check pending commands: {e}"))
+                if device.comm.outbox and device.is_open():
+                    self._service(device, flush=True)
+
+    def _service(self, device, flush=False):
+        try:
+            if flush:
+                device.comm.flush()
+            else:
+                device.poll()
+        except Exception:
+            # Port was closed or unplugged. The error was reported in the sample ring of the device
+            self._unregister(device)
+            if flush:
+                device.ring.push((self.clock(), MSG.ERROR_MSG, "Failed to send commands"))
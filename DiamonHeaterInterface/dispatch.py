@@ -0,0 +1,60 @@
+"""
+Dispatch of received samples to subscribers.
+Consumers (GUI, plot, logging, alarms, ...) subscribe handlers to message ids. The samples drained from a
+device are grouped by message id with one dictionary lookup per sample, and every handler of a message id
+is called once with the whole batch, so adding consumers or message types does not slow down the loop
+over the samples.
+"""
+
+
+class Dispatcher:
+    """Routes the samples drained from a device to the handlers subscribed to their message ids.
+
+    A handler is called as handler(device, batch), batch being the list of (time, msg, value) samples of
+    its message id in order of reception. Batches are passed in the order of the first sample of each
+    message id. Handlers subscribed with subscribe_all() get all samples of every drain.
+    """
+
+    def __init__(self):
+        self.handlers = {}      # Tuple of handlers by message id
+        self.all = ()           # Handlers of all samples
+
+    def subscribe(self, msg, handler):
+        """Call handler with the samples of message id msg. Returns the handler, to be usable as decorator"""
+        self.handlers[msg] = self.handlers.get(msg, ()) + (handler,)
+        return handler
+
+    def subscribe_all(self, handler):
+        self.all = self.all + (handler,)
+        return handler
+
+    def unsubscribe(self, msg, handler):
+        handlers = tuple(h for h in self.handlers.get(msg, ()) if h != handler)
+        if handlers:
+            self.handlers[msg] = handlers
+        else:
+            self.handlers.pop(msg, None)
+
+    def unsubscribe_all(self, handler):
+        self.all = tuple(h for h in self.all if h != handler)
+
+    def dispatch(self, device, samples):
+        if not samples:
+            return
+
+        handlers = self.handlers
+        batches = {}
+        for sample in samples:
+            msg = sample[1]
+            batch = batches.get(msg)
+            if batch is None:
+                if msg not in handlers:
+                    continue
+                batches[msg] = batch = []
+            batch.append(sample)
+
+        for msg, batch in batches.items():
+            for handler in handlers.get(msg, ()):
+                handler(device, batch)
+        for handler in self.all:
+            handler(device, samples)
@@ -0,0 +1,127 @@
+"""
+Time-aligned export of the acquisition record.
+Temperature and current are measured at different times and rates. Every row of an export belongs to one
+temperature data point and holds the last current sample at or before its timestamp (as-of join). With a
+rate, all channels are instead interpolated onto a regular time grid. Alignment uses vectorized
+searchsorted/interp and rows are formatted and written in large blocks.
+"""
+
+import numpy as np
+
+# Layout of exported CSV files. Current timestamp is the time of the current sample used in the row
+CSV_HEADER = ['Temperature', ' Setpoint', ' Temperature timestamp', ' Current', ' Current timestamp']
+CSV_FIELDS = ('temperature', 'setpoint', 'timestamp', 'current', 'current_timestamp')
+
+BLOCK_ROWS = 65536
+
+
+# Results keep the dtype of the channel, so float32 measurements are formatted with the digits of float32
+def asof(t, t_src, values):
+    """Values of a step signal at the times t: the last sample at or before each time, NaN before the first"""
+    dtype = np.promote_types(values.dtype, np.float32)
+    if values.size == 0:
+        return np.full(t.shape, np.nan, dtype)
+    i = np.searchsorted(t_src, t, 'right') - 1
+    out = values[np.maximum(i, 0)].astype(dtype)
+    out[i < 0] = np.nan
+    return out
+
+
+def interp(t, t_src, values):
+    """Values linearly interpolated at the times t, NaN outside of the samples"""
+    dtype = np.promote_types(values.dtype, np.float32)
+    if values.size == 0:
+        return np.full(t.shape, np.nan, dtype)
+    return np.interp(t, t_src, values, left=np.nan, right=np.nan).astype(dtype, copy=False)
+
+
+def record_length(device):
+    """Number of complete temperature data points in the record of a device"""
+    return min(len(device.temperature), len(device.setpoint), len(device.timestamp), len(device.status_history))
+
+
+def record_block(device, start, stop):
+    """Temperature data points start to stop of the record of a device with the current as of their timestamps.
+    Returns a dict of arrays by field name (see session.RECORD)"""
+    t = device.timestamp.slice(start, stop)
+    block = {
+        'temperature': device.temperature.slice(start, stop),
+        'setpoint': device.setpoint.slice(start, stop),
+        'timestamp': t,
+        'status': device.status_history.slice(start, stop),
+    }
+
+    # Only the current samples around the block are needed: the one before it and those within
+    n = min(len(device.current), len(device.current_timestamp))
+    if t.size and n:
+        lo = max(device.current_timestamp.searchsorted(t[0], 'right') - 1, 0)
+        hi = min(device.current_timestamp.searchsorted(t[-1], 'right'), n)
+    else:
+        lo = hi = 0
+    t_current = device.current_timestamp.slice(lo, hi)
+    block['current'] = asof(t, t_current, device.current.slice(lo, hi))
+    block['current_timestamp'] = asof(t, t_current, t_current)
+    return block
+
+
+def record_blocks(device, block_rows=BLOCK_ROWS):
+    """All temperature data points of the record of a device in blocks"""
+    n = record_length(device)
+    for start in range(0, n, block_rows):
+        yield record_block(device, start, min(start + block_rows, n))
+
+
+def resample(t, temperature, setpoint, t_current, current, rate, block_rows=BLOCK_ROWS):
+    """Blocks of the channels on a regular grid of rate points per second. Temperature and current are
+    interpolated linearly, the setpoint is a step signal. Both timestamps of a row are the grid time"""
+    if t.size == 0:
+        return
+
+    k0 = int(np.ceil(t[0] * rate))
+    k1 = int(np.floor(t[-1] * rate)) + 1
+    for k in range(k0, k1, block_rows):
+        grid = np.arange(k, min(k + block_rows, k1)) / rate
+        yield {
+            'temperature': interp(grid, t, temperature),
+            'setpoint': asof(grid, t, setpoint),
+            'timestamp': grid,
+            'current': interp(grid, t_current, current),
+            'current_timestamp': grid,
+        }
+
+
+def resample_record(device, rate, block_rows=BLOCK_ROWS):
+    n = record_length(device)
+    m = min(len(device.current), len(device.current_timestamp))
+    yield from resample(device.timestamp.slice(0, n), device.temperature.slice(0, n), device.setpoint.slice(0, n),
+                        device.current_timestamp.slice(0, m), device.current.slice(0, m), rate, block_rows)
+
+
+def row_format(columns):
+    """%-format of a CSV row. float32 measurements are written with 9 significant digits, which read back as
+    the recorded float32 value, float64 timestamps with 16 (microseconds of seconds since the epoch).
+    Lines end with CRLF like those of csv.writer"""
+    return ",".join("%.9g" if column.dtype == np.float32 else "%.16g" for column in columns) + "\r\n"
+
+
+def format_block(block):
+    """CSV text of a block, one line per row"""
+    columns = [np.asarray(block[field]) for field in CSV_FIELDS]
+    if columns[0].size == 0:
+        return ""
+    fmt = row_format(columns)
+    return "".join([fmt % row for row in zip(*(column.tolist() for column in columns))])
+
+
+def write_csv(file, blocks):
+    """Write the header and blocks to a text file opened with newline=''"""
+    file.write(",".join(CSV_HEADER) + "\r\n")
+    for block in blocks:
+        file.write(format_block(block))
+
+
+def export_csv(filename, device, rate=None):
+    """Write the record of a device to a CSV file. Without rate, one row per temperature data point"""
+    blocks = record_blocks(device) if rate is None else resample_record(device, rate)
+    with open(filename, mode='w', newline='') as file:
+        write_csv(file, blocks)
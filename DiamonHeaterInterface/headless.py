@@ -0,0 +1,260 @@
+"""
+Headless acquisition without DearPyGui, for unattended logging on lab PCs and small single-board computers:
+
+    python -m DiamonHeaterInterface --headless CONFIG [--log FILE]
+
+Connects the heater boards listed in the config file, applies their PID gains and setpoint, optionally
+starts temperature control and records to disk until interrupted (Ctrl+C or SIGTERM). The I/O thread of
+the DeviceManager feeds the watchdog with every received batch, its keep-alive thread at a fixed period
+(see watchdog.py). The main thread wakes up every interval seconds to move the received samples into the
+record, log events and reconnect lost ports.
+
+Config file (INI), one [device NAME] section per board. Missing keys default to config.py:
+
+    [recording]
+    format = csv                ; csv or session
+    directory = logs
+    flush_interval = 1.0
+    fsync_interval = 10.0
+    max_rows = 1000000
+
+    [daemon]
+    interval = 0.5              ; seconds between wake-ups of the main thread
+    reconnect_interval = 5.0    ; seconds between attempts to reopen a lost port
+    stop_on_exit = yes          ; stop temperature control on exit
+    metrics_file = metrics.jsonl ; append pipeline metrics to this file (see metrics.py), off by default
+    metrics_interval = 10.0
+
+    [device heater1]
+    port = /dev/ttyACM0         ; defaults to the name
+    framed = no
+    setpoint = 150.0
+    P = 0.045
+    I = 0.01
+    D = 0.0
+    start = yes                 ; start temperature control after connecting
+
+A board that resets after losing the connection is stopped. After reconnecting, PID gains and setpoint
+are sent again, but temperature control is not restarted.
+"""
+
+import argparse
+import configparser
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from zoneinfo import ZoneInfo
+from pycomm import MSG
+from devices import DeviceManager
+from dispatch import Dispatcher
+from commands import Outcome
+from metrics import MetricsExporter
+from timebase import Timebase
+from recorder import CsvRecorder, SessionRecorder
+import config as cfg
+
+log = logging.getLogger("heater")
+
+STATUS_BITS = ((0b1000, "System Fault"), (0b100, "Over-Current"), (0b10, "Over-Temperature"))
+
+
+def msg_name(msg):
+    try:
+        return MSG(msg).name
+    except ValueError:
+        return str(msg)
+
+
+class Daemon:
+    """Drives the devices of a config file until stop() is called"""
+
+    def __init__(self, config):
+        self.config = config
+        daemon = config["daemon"] if config.has_section("daemon") else {}
+        self.interval = float(daemon.get("interval", 0.5))
+        self.reconnect_interval = float(daemon.get("reconnect_interval", 5.0))
+        self.stop_on_exit = config.getboolean("daemon", "stop_on_exit", fallback=True)
+        metrics_file = daemon.get("metrics_file", cfg.metrics_file)
+        self.exporter = MetricsExporter(metrics_file, float(daemon.get("metrics_interval", cfg.metrics_interval))) \
+            if metrics_file else None
+
+        recording = config["recording"] if config.has_section("recording") else {}
+        self.recorder_type = SessionRecorder if recording.get("format", cfg.record_format) == "session" else CsvRecorder
+        self.directory = recording.get("directory", ".")
+        self.flush_interval = float(recording.get("flush_interval", cfg.record_flush_interval))
+        self.fsync_interval = float(recording.get("fsync_interval", cfg.record_fsync_interval))
+        self.max_rows = int(recording.get("max_rows", cfg.record_max_rows))
+
+        self.manager = DeviceManager(clock=Timebase("Europe/Berlin"))
+        self.settings = {}      # Config section by device
+        self._retry = {}        # Time of the next connection attempt by device
+        self._status = {}       # Last reported status by device
+
+        self.dispatcher = Dispatcher()
+        self.dispatcher.subscribe(MSG.STATUS, self._on_status)
+        self.dispatcher.subscribe(MSG.RESET, self._on_reset)
+        self.dispatcher.subscribe(MSG.ERROR_MSG, self._on_error)
+        self._stop = threading.Event()
+
+        for section in config.sections():
+            if not section.startswith("device "):
+                continue
+            name = section[len("device "):].strip()
+            settings = config[section]
+            device = self.manager.add(name, settings.get("port", name), framed=settings.getboolean("framed", cfg.framed))
+            device.pid = [settings.getfloat("P", cfg.P_default), settings.getfloat("I", cfg.I_default),
+                          settings.getfloat("D", cfg.D_default)]
+            self.settings[device] = settings
+
+        if not self.settings:
+            raise ValueError("No [device NAME] section in the config file")
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.manager.start()
+        if self.exporter is not None:
+            try:
+                self.exporter.start()
+                log.info(f"Writing metrics to {self.exporter.filename}")
+            except OSError as e:
+                log.error(f"Failed to write metrics to {self.exporter.filename}: {e}")
+                self.exporter = None
+        try:
+            for device in self.manager:
+                if self._connect(device):
+                    if self.settings[device].getboolean("start", False):
+                        device.start(callback=partial(self._on_command, device))
+                        log.info(f"[{device.name}] Starting temperature control")
+                self._record(device)
+
+            while not self._stop.wait(self.interval):
+                for device in self.manager:
+                    self._update(device)
+                for device, message in self.manager.watchdog.drain_alarms():
+                    log.warning(f"[{device.name}] {message}")
+        finally:
+            self._shutdown()
+
+    # Handlers of received samples, see dispatch.py
+    def _on_status(self, device, samples):
+        status = self._status.get(device, 0)
+        for t, msg, value in samples:
+            for bit, name in STATUS_BITS:
+                if value & bit and not status & bit:
+                    log.error(f"[{device.name}] {name}!")
+            if (value ^ status) & 0b1:
+                log.info(f"[{device.name}] " + ("Active" if value & 0b1 else "Inactive"))
+            status = value
+        self._status[device] = status
+
+    # Outcome of acknowledged commands, see commands.py
+    def _on_command(self, device, command):
+        if command.outcome == Outcome.NACK:
+            log.warning(f"[{device.name}] Command {msg_name(command.msg)} was rejected")
+        elif command.outcome == Outcome.TIMEOUT:
+            log.error(f"[{device.name}] No reply to command {msg_name(command.msg)} after {command.attempts} attempts")
+
+    def _on_reset(self, device, samples):
+        log.warning(f"[{device.name}] Reset button pressed")
+
+    def _on_error(self, device, samples):
+        for t, msg, value in samples:
+            log.error(f"[{device.name}] {value}")
+
+    def _connect(self, device):
+        try:
+            self.manager.connect(device)
+        except Exception as e:
+            self.manager.disconnect(device)
+            self._retry[device] = time.monotonic() + self.reconnect_interval
+            log.error(f"[{device.name}] Failed to connect to {device.port}: {e}")
+            return False
+
+        # PID gains were sent by connect()
+        setpoint = self.settings[device].getfloat("setpoint", None)
+        if setpoint is not None:
+            device.set_setpoint(setpoint, callback=partial(self._on_command, device))
+        self._retry.pop(device, None)
+        log.info(f"[{device.name}] Connected to {device.port}")
+        return True
+
+    def _record(self, device):
+        stamp = datetime.now(ZoneInfo("Europe/Berlin")).strftime("%d-%m-%Y_%H-%M-%S")
+        prefix = os.path.join(self.directory, f"Temperature_{device.name.replace(os.sep, '_')}_{stamp}")
+        recorder = self.recorder_type(device, prefix, flush_interval=self.flush_interval,
+                                      fsync_interval=self.fsync_interval, max_rows=self.max_rows)
+        try:
+            recorder.start()
+        except OSError as e:
+            log.error(f"[{device.name}] Failed to create recording file: {e}")
+            return
+        device.recorder = recorder
+        log.info(f"[{device.name}] Recording to {recorder.filename}")
+
+    def _update(self, device):
+        self.dispatcher.dispatch(device, device.update())
+
+        if device.recorder is not None and device.recorder.error is not None:
+            log.error(f"[{device.name}] Recording stopped: {device.recorder.error}")
+            device.recorder = None
+
+        # Port lost: reopen it every reconnect_interval
+        if device in self._retry:
+            if time.monotonic() >= self._retry[device]:
+                self._connect(device)
+        elif not self.manager.is_serviced(device):
+            log.error(f"[{device.name}] Connection lost")
+            self.manager.disconnect(device)
+            self._retry[device] = time.monotonic() + self.reconnect_interval
+
+    def _shutdown(self):
+        for device in self.manager:
+            if self.stop_on_exit and device.is_open():
+                try:
+                    device.comm.send_urgent(MSG.STOP)
+                except Exception:
+                    pass
+        self.manager.close()
+
+        for device in self.manager:
+            device.update()
+            if device.recorder is not None:
+                device.recorder.stop()
+                log.info(f"[{device.name}] Wrote {', '.join(device.recorder.files)}")
+                device.recorder = None
+
+        if self.exporter is not None:
+            self.exporter.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m DiamonHeaterInterface --headless",
+                                     description="Run diamond heaters and record their data without GUI")
+    parser.add_argument("config", help="config file, see headless.py")
+    parser.add_argument("--log", default=None, help="also write log messages to this file")
+    args = parser.parse_args(argv)
+
+    handlers = [logging.StreamHandler()]
+    if args.log:
+        handlers.append(logging.FileHandler(args.log))
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", handlers=handlers)
+
+    config = configparser.ConfigParser(inline_comment_prefixes=(";", "#"))
+    if not config.read(args.config):
+        parser.error(f"Could not read {args.config}")
+
+    daemon = Daemon(config)
+    signal.signal(signal.SIGINT, lambda *args: daemon.stop())
+    signal.signal(signal.SIGTERM, lambda *args: daemon.stop())
+    daemon.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,173 +1,300 @@
 from pycomm import Comm, MSG
+from dispatch import Dispatcher
+from commands import Outcome
+from metrics import metrics, MetricsExporter
 from datetime import datetime
+from functools import partial
 from zoneinfo import ZoneInfo
 from logger import mvLogger
+from startup import timer as startup_timer
 import dearpygui.dearpygui as dpg
+import threading
+import time
 import os
-import csv
-import numpy as np
 import config as cfg
 
 #log = mvLogger()
 
-comm = Comm(baud_rate=115200)
+# Clock, devices and plotted channels are set up by init_acquisition() after the first frame, so NumPy and the
+# acquisition modules are not imported before the window appears
 
-# Full record of values for saving to SVG
-temperature   = [] # Temperature data points
-setpoint      = [] # Setpoint data points
-timestamp     = [] # Timestamps for temperature data points
+# Timestamps of received samples: local time (Europe/Berlin) as seconds since the epoch, for the time axis of the plot.
+# Read from the monotonic clock, the offset to local time is sampled again by the I/O thread every cfg.clock_sync_interval
+timebase = None
 
-current           = [] # Heater wire current
-current_timestamp = [] # Timestamps for current data points
+# All connected heater boards, serviced by one background I/O thread. Each device keeps its own full record
+manager = None
 
-# Downsampled data points for efficient rendering to plot
-points = np.empty((3, cfg.N_points_max))
-idx_last = 0
+# Samples received from the devices are passed to the handlers subscribed to their message ids, see handle_Serial()
+dispatcher = Dispatcher()
+
+# Device shown and controlled by the GUI, None if the selected port is not connected
+device = None
+
+# Plotted channels of the record of the selected device, see channels.py
+channels = []
+
+# Live series of the plot, decimated with min/max pyramids. The plot only gets as many points of the visible
+# x-range as it has pixels, at full detail when zoomed in
+live = None
+autoscale = True        # Plot x-axis follows the record
+plot_refreshed = 0.0    # time.monotonic() of the last redraw
+
+# Text of value displays, by tag
+shown_text = {}
+
+# Metrics of the GUI, see metrics.py
+BATCH_SIZE   = metrics.histogram("gui.batch_size")              # Samples drained from a device per frame
+LATENCY      = metrics.histogram("gui.latency", "s")            # From reception of the oldest sample of a batch to its processing
+UPDATE_TIME  = metrics.histogram("gui.update_plot_time", "s")
+REFRESH_TIME = metrics.histogram("gui.refresh_plot_time", "s")
+metrics_refreshed = 0.0     # time.monotonic() of the last update of the metrics window
+metrics_previous = {}       # Counts of the metrics at the last update, for the rates
 
 # System status indicator previous state
 status_prev = 0
 
+# Last status of devices in the background, to report new faults
+background_status = {}
+
 # Scan available serial ports and update scroll box
 def scanPorts():
-    ports = comm.available_ports()
+    ports = Comm.available_ports()
 
     dpg.delete_item("Ports list", children_only=True)
     for port, desc, hwid in sorted(ports):
         dpg.add_text("{}: {} [{}]".format(port, desc, hwid), parent="Ports list")
 
+# Prefix for log messages, to tell devices apart when more than one is connected
+def log_prefix(dev):
+    return f"[{dev.name}] " if len(manager) > 1 else ""
+
 # Connect button callback
 def connect():
     port = dpg.get_value("Port select")
+    dev = manager.devices.get(port) or manager.add(port, framed=cfg.framed)
+
+    # Set PID values from sliders
+    dev.pid = [dpg.get_value("slider_P"), dpg.get_value("slider_I"), dpg.get_value("slider_D")]
+
+    # Open port and transmit PID values. Even if connection to the selected port was sucessful, it might not be the Teensy microcontroller and the write will fail
     try:
-        comm.connect(port)
+        manager.connect(dev)
     except:
-        log.log_error("Failed to establish connection!")
+        manager.disconnect(dev)
+        if not dev.timestamp:
+            manager.remove(port)
+        log.log_error(f"Failed to establish connection to {port}!")
     else:
-        # Set default PID values
-        comm.add_variable_token(dpg.get_value("slider_P"), MSG.PID_P)
-        comm.add_variable_token(dpg.get_value("slider_I"), MSG.PID_I)
-        comm.add_variable_token(dpg.get_value("slider_D"), MSG.PID_D)
-
-        # Transmit PID values. Even if connection to the selected port was sucessful, it might not be the Teensy microcontroller and the write will fail
-        try:
-            comm.transmit() 
-        except: 
-            log.log_error("Failed to establish connection!")
-        else:
-            dpg.configure_item("Connect Button", label="Disconnect")
-            dpg.configure_item("Connect Button", callback=disconnect)
-            dpg.configure_item("Slider Group", enabled=True)
-            dpg.configure_item("Temperature Group", enabled=True)
-            log.log_info("Successfully connected")
+        show_device(dev)
+        log.log_info(f"Successfully connected to {port}")
 
 # Disconnect button callback
 def disconnect():
-    comm.disconnect()
-    dpg.configure_item("Connect Button", label="Connect")
-    dpg.configure_item("Connect Button", callback=connect)
-    dpg.configure_item("Slider Group", enabled=False)
-    dpg.configure_item("Temperature Group", enabled=False)
-    log.log_info("Disconnected")
+    manager.disconnect(device)
+    show_device(device)
+    log.log_info(f"Disconnected from {device.name}")
+
+# Port selection callback: show the device connected to this port
+def select_port(sender, app_data):
+    show_device(manager.devices.get(app_data))
+
+# Show state and record of a device in the GUI and direct all controls to it
+def show_device(dev):
+    global device
+    device = dev
+    connected = dev is not None and dev.is_open()
+
+    # Value displays show the last recorded values of the new device until its next samples, blank without record
+    shown_text.clear()
+    has_temperature = dev is not None and len(dev.temperature) > 0
+    has_current = dev is not None and len(dev.current) > 0
+    set_text("actual_temp_value", f"{dev.temperature[-1]:.1f}" if has_temperature else "")
+    set_text("current_value", f"{dev.current[-1]:.2f}" if has_current else "")
+
+    if connected:
+        dpg.configure_item("Connect Button", label="Disconnect")
+        dpg.configure_item("Connect Button", callback=disconnect)
+    else:
+        dpg.configure_item("Connect Button", label="Connect")
+        dpg.configure_item("Connect Button", callback=connect)
+    dpg.configure_item("Slider Group", enabled=connected)
+    dpg.configure_item("Temperature Group", enabled=connected)
+
+    if dev is not None:
+        dpg.set_value("slider_P", dev.pid[0])
+        dpg.set_value("slider_I", dev.pid[1])
+        dpg.set_value("slider_D", dev.pid[2])
+        dpg.set_value("setpoint_input", dev.target)
+        setStartStop(dev.running)
+        setIndicators(dev.status, force=True)
+    dpg.set_value("Checkbox Record", dev is not None and dev.recorder is not None)
+    dpg.set_value("Checkbox Capture", dev is not None and dev.comm.capture is not None)
+
+    rebuild_Plot()
 
 # Callback to set a new temperature setpoint
 def new_setpoint(sender, app_data):
-    comm.add_variable_token(app_data, MSG.T_SETPOINT)
-    comm.transmit()
-    #setpoint.append(app_data)
-    #time_setpoint.append(time.time() + 7200)
+    device.set_setpoint(app_data, callback=partial(command_done, device))
 
 # Start temperature controller
 def start_button():
-    comm.add_flag_token(MSG.START)
-    comm.transmit()
+    device.start(callback=partial(command_done, device))
     print("Start")
 
 # Stop temperature controller
 def stop_button():
-    comm.add_flag_token(MSG.STOP)
-    comm.transmit()
+    device.stop(callback=partial(command_done, device))
     print("Stop")
 
 # Reset error states of temperature controller
 def reset_button():
-    comm.add_flag_token(MSG.RESET)
-    comm.transmit()
+    device.reset()
 
     # Set Start/Stop button back to start
-    dpg.configure_item("start stop button", label="Start")
-    dpg.configure_item("start stop button", callback=start_button)
+    setStartStop(False)
 
-    log.log_info("System reset")
+    log.log_info(log_prefix(device) + "System reset")
+
+# Show Start or Stop on the start/stop button
+def setStartStop(running):
+    if running:
+        dpg.configure_item("start stop button", label="Stop")
+        dpg.configure_item("start stop button", callback=stop_button)
+    else:
+        dpg.configure_item("start stop button", label="Start")
+        dpg.configure_item("start stop button", callback=start_button)
 
-# clear plot button callback
+# clear plot button callback. A running recording is finished and continues in a new session file
 def clear_plot():
-    global idx_last
-    idx_last = 0
-    temperature.clear()
-    setpoint.clear()
-    timestamp.clear()
-    current.clear()
-    current_timestamp.clear()
-    dpg.set_value("Setpoint Series",    [timestamp, setpoint])
-    dpg.set_value("Temperature Series", [timestamp, temperature])
-
-# sava plot data to csv file
+    if device is not None:
+        recording = device.recorder is not None
+        if recording:
+            stop_recording(device)
+        device.clear_record()
+        live.clear()
+        if recording:
+            start_recording(device)
+    refresh_Plot(force=True)
+
+# Filename without extension for files of a device, using the current date and time
+def csv_basename(dev, time_format="%d-%m-%Y_%H-%M", prefix="Temperature"):
+    now = datetime.now(ZoneInfo("Europe/Berlin")).strftime(time_format)
+    if len(manager) > 1:
+        return f"{prefix}_{os.path.basename(dev.name)}_{now}"
+    return f"{prefix}_{now}"
+
+# sava plot data to csv file. While recording, the session file already holds the data and is only finalized
 def save_plot():
-    # Get current date and time formatted for filename
-    now = datetime.now(ZoneInfo("Europe/Berlin")).strftime("%d-%m-%Y_%H-%M")
-    filename = f"Temperature_{now}.csv"
-
-    # Write to CSV in current directory
-    with open(filename, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Temperature', ' Setpoint', ' Temperature timestamp', ' Current', ' Current timestamp'])
-        for row in zip(temperature, setpoint, timestamp, current, current_timestamp):
-            writer.writerow(row)
-        log.log_info(f"Wrote data to {filename}")
+    if device is None:
+        log.log_error("No device selected!")
+        return
+
+    # Logged by handle_Serial() once the recorder thread closed the file
+    if device.recorder is not None:
+        device.recorder.rotate()
+        return
+
+    from export import export_csv
+
+    filename = csv_basename(device) + ".csv"
+
+    # Write to CSV in current directory, current aligned to the temperature timestamps or all channels resampled
+    export_csv(filename, device, cfg.export_rate)
+    log.log_info(f"Wrote data to {filename}")
+
+# Continuously write the record of a device to CSV or session files in a background thread, starting with the data recorded so far
+def start_recording(dev):
+    from recorder import CsvRecorder, SessionRecorder
+
+    recorder_type = SessionRecorder if cfg.record_format == "session" else CsvRecorder
+    recorder = recorder_type(dev, csv_basename(dev, "%d-%m-%Y_%H-%M-%S"), flush_interval=cfg.record_flush_interval,
+                             fsync_interval=cfg.record_fsync_interval, max_rows=cfg.record_max_rows)
+    try:
+        recorder.start()
+    except OSError:
+        log.log_error(log_prefix(dev) + "Failed to create recording file!")
+        return
+    dev.recorder = recorder
+    log.log_info(log_prefix(dev) + f"Recording to {recorder.filename}")
+
+def stop_recording(dev):
+    dev.recorder.stop()
+    if dev.recorder.error is not None:
+        log.log_error(log_prefix(dev) + f"Recording failed: {dev.recorder.error}")
+    else:
+        log.log_info(log_prefix(dev) + f"Stopped recording, wrote {', '.join(dev.recorder.files)}")
+    dev.recorder = None
+
+# Record checkbox callback
+def checkbox_record_cb(sender, app_data):
+    if device is None:
+        log.log_error("No device selected!")
+        dpg.set_value("Checkbox Record", False)
+    elif app_data and device.recorder is None:
+        start_recording(device)
+        dpg.set_value("Checkbox Record", device.recorder is not None)
+    elif not app_data and device.recorder is not None:
+        stop_recording(device)
+
+# Capture checkbox callback: record the raw serial traffic of the selected device to a trace file for replay
+def checkbox_capture_cb(sender, app_data):
+    if device is None:
+        log.log_error("No device selected!")
+        dpg.set_value("Checkbox Capture", False)
+    elif app_data and device.comm.capture is None:
+        filename = csv_basename(device, "%d-%m-%Y_%H-%M-%S", prefix="Trace") + ".dht"
+        try:
+            device.comm.start_capture(filename)
+        except OSError:
+            log.log_error(log_prefix(device) + "Failed to create trace file!")
+            dpg.set_value("Checkbox Capture", False)
+        else:
+            log.log_info(log_prefix(device) + f"Capturing serial traffic to {filename}")
+    elif not app_data and device.comm.capture is not None:
+        capture = device.comm.stop_capture()
+        log.log_info(log_prefix(device) + f"Captured {capture.bytes} bytes to {capture.filename}")
 
 # Change autoscaling of plot x-axis
 def checkbox_autoscale_cb(sender, app_data):
+    global autoscale
+    autoscale = app_data
     if app_data:
         dpg.configure_item("x_axis", auto_fit=True)
     else:
         dpg.configure_item("x_axis", auto_fit=False)
 
-# Change maximal number of samples in plot (for better performance)
+# Change maximal number of samples per plot series (for better performance)
 def change_N_points_max(sender, app_data):
     cfg.N_points_max = app_data
-    global points
-    points = np.empty((3, cfg.N_points_max))
-    clear_plot()
+    refresh_Plot(force=True)
 
 # Slider callbacks: Send new PID gains to heater
 def set_P():
     p = dpg.get_value("slider_P")
     print(p)
-    comm.add_variable_token(p, MSG.PID_P)
-    comm.transmit()
+    device.set_pid(0, p)
     log.log_info("Set proportional gain")
 def set_I():
     i = dpg.get_value("slider_I")
     print(i)
-    comm.add_variable_token(i, MSG.PID_I)
-    comm.transmit()
+    device.set_pid(1, i)
     log.log_info("Set integral gain")
 def set_D():
     d = dpg.get_value("slider_D")
     print(d)
-    comm.add_variable_token(d, MSG.PID_D)
-    comm.transmit()
+    device.set_pid(2, d)
     log.log_info("Set differential gain")
 
 # Set state indicators from binary state-word
-def setIndicators(status):
+def setIndicators(status, force=False):
     global status_prev
 
     # Only update when status changed
-    if status == status_prev: return
+    if status == status_prev and not force: return
 
-    # XOR, one whereever there was a status change
-    changes = status ^ status_prev 
+    # XOR, one whereever there was a status change. Forced update redraws all indicators without logging
+    changes = 0b1111 if force else status ^ status_prev
 
     # Save status
     status_prev = status
@@ -179,27 +306,26 @@ def setIndicators(status):
     if(changes & 0b10):
         if (status & 0b10): 
             dpg.configure_item("Indicator OT", texture_tag = "RedIndicator")
-            log.log_error("Over-Temperature!")
+            if not force: log.log_error(log_prefix(device) + "Over-Temperature!")
         else:               
             dpg.configure_item("Indicator OT", texture_tag = "RedIndicatorOff")
 
     if(changes & 0b100):
         if (status & 0b100): 
             dpg.configure_item("Indicator OC", texture_tag = "RedIndicator")
-            log.log_error("Over-Current!")
+            if not force: log.log_error(log_prefix(device) + "Over-Current!")
         else:                
             dpg.configure_item("Indicator OC", texture_tag = "RedIndicatorOff")
 
     if(changes & 0b1000):
         if (status & 0b1000): 
             dpg.configure_item("Indicator Fault", texture_tag = "RedIndicator")
-            log.log_error("System Fault!")
+            if not force: log.log_error(log_prefix(device) + "System Fault!")
         else:                 
             dpg.configure_item("Indicator Fault", texture_tag = "RedIndicatorOff")
 
     if(status & 0b1110): # One of the fault indicators is on
-        dpg.configure_item("start stop button", label="Start")
-        dpg.configure_item("start stop button", callback=start_button)
+        setStartStop(False)
 
 # Handle UI scaling when viewport is resized   
 def on_viewport_resize(sender, app_data):
@@ -216,144 +342,256 @@ def on_viewport_resize(sender, app_data):
     dpg.configure_item("Temperature Window", pos=(left_width, 0), width=right_width, height=top_height)
     dpg.configure_item("Plot Window", pos=(left_width, top_height), width=right_width, height=bottom_height)
 
-# Pushes new temperature to the screen
-def update_Plot(temp, sp, time):
-    temperature.append(temp)
-    setpoint.append(sp)
-    timestamp.append(time)
-
-    # Append new points to back
-    global points, idx_last
-    points[:, idx_last] = np.array([temp, sp, time])
-    idx_last = idx_last + 1
-
-    # New downsampling set if last block length exceeds half the max size
-    if idx_last == cfg.N_points_max:
-        # Downsample by factor of two
-        points[:, :cfg.N_points_max//2] = 0.5*(points[:, 0::2] + points[:, 1::2])
-
-        # Start new block
-        idx_last = cfg.N_points_max//2
-
-        log.log_info("Downsampled plot to improve performance. This does not affect csv export.")
-
-    dpg.set_value("Setpoint Series",    [points[2,:idx_last].tolist(), points[1,:idx_last].tolist()])
-    dpg.set_value("Temperature Series", [points[2,:idx_last].tolist(), points[0,:idx_last].tolist()])
-        
-# Handle acknowledgements sent back from controller
-def handleAckNack(ack):
-    msg = comm.get_next_msg()
-
-    if ack: # Acknowledgements
-        if msg.msg == MSG.START:
-            dpg.configure_item("start stop button", label="Stop")
-            dpg.configure_item("start stop button", callback=stop_button)
-            log.log_info("System started")
-        elif msg.msg == MSG.STOP:
-            dpg.configure_item("start stop button", label="Start")
-            dpg.configure_item("start stop button", callback=start_button)
-            log.log_info("System stopped")
-        elif msg.msg == MSG.T_SETPOINT:
-            log.log_info("New setpoint")
-
-    else: # Not Acknowledgements
-        if msg.msg == MSG.START:
-            log.log_error("Failed to start system!")
-        elif msg.msg == MSG.STOP:
-            log.log_error("Failed to stop system!")
-        elif msg.msg == MSG.T_SETPOINT:
-            log.log_info("Failed to set new setpoint!")
-
-def get_time():
-    berlin_time = datetime.now(ZoneInfo("Europe/Berlin"))
-
-    # Get offset from UTC and UTC timestamp
-    offset_seconds = berlin_time.utcoffset().total_seconds()
-    utc_timestamp = berlin_time.timestamp()
-
-    # Timestamp with offset added
-    t = utc_timestamp + offset_seconds
-    return t
-
-# Called continuously in the render loop
-def handle_Serial():
-    if not comm.ser.is_open:
-        return
-    
-    if not comm.msg_available():
+# Show a text in a text item, unless it already shows it
+def set_text(tag, text):
+    if shown_text.get(tag) != text:
+        shown_text[tag] = text
+        dpg.configure_item(tag, default_value=text)
+
+# Adds new samples of the record of the selected device to the plot. Drawn with the next refresh_Plot()
+def update_Plot():
+    t0 = time.perf_counter()
+    live.update()
+    UPDATE_TIME.observe(time.perf_counter() - t0)
+
+# Draw the visible x-range of the record with about two points per pixel of the plot width.
+# Called once per frame, redraws at most cfg.plot_refresh_rate times per second: only the series with new data,
+# or all of them if the x-axis was zoomed or panned
+def refresh_Plot(force=False):
+    global plot_refreshed
+
+    now = time.monotonic()
+    if not force and now - plot_refreshed < 1.0 / cfg.plot_refresh_rate:
         return
+    plot_refreshed = now
+    t0 = time.perf_counter()
 
-    # Read all incoming messages until MSG_END
-    while True:
-        msg = comm.get_next_msg()
-        #if msg.msg != MSG.MSG_END: print(msg.msg)
-
-        if msg.msg == MSG.MSG_END:
-            break  
-
-        elif msg.msg == MSG.T_ACTUAL:
-            # Update plot datapoints
-            temp = comm.get_payload(float)
-            sp   = dpg.get_value("setpoint_input")
-            t    = get_time()
-
-            # Update UI elements
-            update_Plot(temp, sp, t)
-            dpg.configure_item("actual_temp_value", default_value=f"{temp:.1f}")
-
-        elif msg.msg == MSG.CURRENT:
-            I = comm.get_payload(float)
-
-            current.append(I)
-            current_timestamp.append(get_time())
-
-            dpg.configure_item("current_value", default_value=f"{I:.2f}")
-
-        elif msg.msg == MSG.STATUS:
-            status = comm.get_payload(int)
-            setIndicators(status)
-
-        elif msg.msg == MSG.ACK:
-            handleAckNack(True)
-
-        elif msg.msg == MSG.NACK:
-            handleAckNack(False)
-
-        # Reset button on PCB was pressed
-        elif msg.msg == MSG.RESET:
-            dpg.configure_item("start stop button", label="Start")
-            dpg.configure_item("start stop button", callback=start_button)
-            log.log_info("Reset button pressed")
-
-        elif msg.msg == MSG.ERROR_MSG:
-            err_msg = comm.get_payload(str)
-            log.log_debug(err_msg)
+    if autoscale:
+        x_range = live.x_range()
+    else:
+        x_range = tuple(dpg.get_axis_limits("x_axis"))
+
+    width = dpg.get_item_rect_size("plot")[0]
+    max_points = min(max(2*width, 1000), cfg.N_points_max)
+
+    # DearPyGui reads the NumPy arrays through the buffer protocol, without conversion to lists
+    for channel, x, y in live.refresh(x_range, max_points, force):
+        dpg.set_value(channel.tag, [x, y])
+    REFRESH_TIME.observe(time.perf_counter() - t0)
+
+# Redraw the plot from the full record of the selected device
+def rebuild_Plot():
+    live.bind(device)
+    refresh_Plot(force=True)
+
+# Handle the outcome of a command sent to the controller, see commands.py. Called by Device.update() in handle_Serial()
+# once the command was acknowledged or rejected, or failed without reply after all retries
+def command_done(dev, command):
+    cmd = command.msg
+    if command.outcome == Outcome.ACK: # Acknowledgements
+        if cmd == MSG.START:
+            if dev is device:
+                setStartStop(True)
+            log.log_info(log_prefix(dev) + "System started")
+        elif cmd == MSG.STOP:
+            if dev is device:
+                setStartStop(False)
+            log.log_info(log_prefix(dev) + "System stopped")
+        elif cmd == MSG.T_SETPOINT:
+            log.log_info(log_prefix(dev) + "New setpoint")
+
+    elif command.outcome == Outcome.NACK: # Not Acknowledgements
+        if cmd == MSG.START:
+            log.log_error(log_prefix(dev) + "Failed to start system!")
+        elif cmd == MSG.STOP:
+            log.log_error(log_prefix(dev) + "Failed to stop system!")
+        elif cmd == MSG.T_SETPOINT:
+            log.log_info(log_prefix(dev) + "Failed to set new setpoint!")
+
+    elif command.outcome == Outcome.TIMEOUT: # No reply
+        log.log_error(log_prefix(dev) + f"No reply to {cmd.name} after {command.attempts} attempts!")
+
+# Handlers of received samples, called by the dispatcher with the samples of one message id of a device
+# received since the last frame. Devices in the background only report errors and faults
+def on_temperature(dev, samples):
+    if dev is device:
+        set_text("actual_temp_value", f"{samples[-1][2]:.1f}")
+        update_Plot()
+
+def on_current(dev, samples):
+    if dev is device:
+        set_text("current_value", f"{samples[-1][2]:.2f}")
+        update_Plot()
+
+def on_status(dev, samples):
+    for t, msg, value in samples:
+        if dev is device:
+            setIndicators(value)
+        elif value & 0b1110 and not background_status.get(dev, 0) & 0b1110:
+            log.log_error(log_prefix(dev) + "System fault!")
+        background_status[dev] = value
+
+# Reset button on PCB was pressed
+def on_reset(dev, samples):
+    if dev is device:
+        setStartStop(False)
+        log.log_info(log_prefix(dev) + "Reset button pressed")
+
+def on_error(dev, samples):
+    for t, msg, value in samples:
+        log.log_debug(log_prefix(dev) + str(value))
+
+# Reactions of the GUI to received messages. Other consumers subscribe to the dispatcher the same way
+dispatcher.subscribe(MSG.T_ACTUAL, on_temperature)
+dispatcher.subscribe(MSG.CURRENT, on_current)
+dispatcher.subscribe(MSG.STATUS, on_status)
+dispatcher.subscribe(MSG.RESET, on_reset)
+dispatcher.subscribe(MSG.ERROR_MSG, on_error)
+
+# Called once per frame in the render loop. Processes all samples received since the last frame
+def handle_Serial():
+    for dev in manager:
+        samples = dev.update()
+        if samples:
+            BATCH_SIZE.observe(len(samples))
+            LATENCY.observe(timebase() - samples[0][0])
+
+        if dev.recorder is not None:
+            for filename in dev.recorder.drain_finished():
+                log.log_info(log_prefix(dev) + f"Finalized {filename}, recording continues in a new file")
+        if dev.recorder is not None and dev.recorder.error is not None:
+            log.log_error(log_prefix(dev) + f"Recording stopped: {dev.recorder.error}")
+            dev.recorder = None
+            if dev is device:
+                dpg.set_value("Checkbox Record", False)
+
+        dispatcher.dispatch(dev, samples)
+
+    for dev, message in manager.watchdog.drain_alarms():
+        log.log_warning(log_prefix(dev) + message)
+
+# Send all commands queued by GUI callbacks during this frame as one transmission per device
+def flush_commands():
+    for dev in manager:
+        if not dev.comm.outbox or not dev.is_open():
+            continue
 
-    # Acknowledge reception and feed the watchdog. If the controller does not receive this Ack over five seconds, it resets
-    comm.add_flag_token(MSG.ACK) 
-    comm.transmit()
-    #print("Feed watchdog")
+        try:
+            dev.comm.flush()
+        except:
+            log.log_error(log_prefix(dev) + "Failed to send commands!")
+
+def format_metric(value, unit):
+    if unit == "s":
+        return f"{value*1e3:.3f} ms"
+    return f"{value:.6g} {unit}".rstrip()
+
+# Show the pipeline metrics in the metrics window, at most twice per second while it is shown.
+# Rows are added for metrics created since the last update
+def refresh_Metrics():
+    global metrics_refreshed
+
+    now = time.monotonic()
+    if now - metrics_refreshed < 0.5 or not dpg.is_item_shown("Metrics Window"):
+        return
+    dt = now - metrics_refreshed
+    metrics_refreshed = now
+
+    for name, item in sorted(metrics.items.items()):
+        row = f"Metric {name}"
+        if not dpg.does_item_exist(row):
+            with dpg.table_row(tag=row, parent="Metrics Table"):
+                dpg.add_text(name)
+                for column in ("count", "rate", "mean", "p99", "max"):
+                    dpg.add_text("", tag=f"{row} {column}")
+
+        count = getattr(item, "count", None)
+        if count is None:   # Counter
+            count = item.value
+            set_text(f"{row} count", format_metric(count, item.unit))
+        else:
+            set_text(f"{row} count", str(count))
+            set_text(f"{row} mean", format_metric(item.mean, item.unit) if count else "")
+            set_text(f"{row} p99", format_metric(item.quantile(0.99), item.unit) if count else "")
+            set_text(f"{row} max", format_metric(item.max, item.unit) if count else "")
+        previous = metrics_previous.get(name, count)
+        set_text(f"{row} rate", f"{max(count - previous, 0)/dt:.1f}" if dt < 5.0 else "")
+        metrics_previous[name] = count
+
+def reset_metrics():
+    metrics.reset()
+    metrics_previous.clear()
+
+# Fonts of the temperature window: file, size and the items using it. Loaded after the first frame, so the font
+# atlas is not built before the window appears. Until then the items use the default font
+FONTS = [
+    (("fonts-DSEG_v046", "DSEG7-Classic", "DSEG7Classic-Regular.ttf"), 35, ["setpoint_input", "actual_temp_value", "current_value"]),
+    (("arial", "arial.ttf"), 20, ["start stop button", "reset button", "text_temp_setpoint", "actual_temp_label", "current_label"]),
+    (("arial", "arial.ttf"), 40, ["Celcius_setpoint", "Celcius_actual", "Amps"]),
+]
+
+INDICATOR_ICONS = ["RedIndicator.png", "RedIndicatorOff.png", "GreenIndicator.png", "GreenIndicatorOff.png"]
+
+def load_fonts():
+    with dpg.font_registry():
+        for path, size, items in FONTS:
+            font = dpg.add_font(os.path.join(os.path.dirname(__file__), "Fonts", *path), size)
+            for item in items:
+                dpg.bind_item_font(item, font)
+
+# Runs in a background thread during startup. Appends (tag, width, height, data) of every indicator icon
+def decode_icons(decoded):
+    for icon in INDICATOR_ICONS:
+        width, height, channels, data = dpg.load_image(os.path.join(os.path.dirname(__file__), "Icons", icon))
+        decoded.append((icon.replace(".png",""), width, height, data))
+
+def add_icons(decoded):
+    for tag, width, height, data in decoded:
+        dpg.add_static_texture(width=width, height=height, default_value=data, tag=tag, parent="Texture Registry")
+    setIndicators(device.status if device is not None else 0, force=True)
+
+# Create the clock, the device manager and the plotted channels. Each channel gets a line series tagged
+# "<name> Series" on its y-axis. The status bits are stacked on the third y-axis, one unit apart
+def init_acquisition():
+    global timebase, manager, channels, live
+    from timebase import Timebase
+    from devices import DeviceManager
+    from channels import Channel, LiveSeries
+
+    timebase = Timebase("Europe/Berlin")
+    manager = DeviceManager(clock=timebase)
+    channels = [
+        Channel("Setpoint",         "timestamp",         "setpoint"),
+        Channel("Temperature",      "timestamp",         "temperature"),
+        Channel("Current",          "current_timestamp", "current",        axis="y2_axis"),
+        Channel("Active",           "timestamp",         "status_history", axis="y3_axis", bit=0, level=0.0),
+        Channel("Over-Temperature", "timestamp",         "status_history", axis="y3_axis", bit=1, level=1.5),
+        Channel("Over-Current",     "timestamp",         "status_history", axis="y3_axis", bit=2, level=3.0),
+        Channel("System Fault",     "timestamp",         "status_history", axis="y3_axis", bit=3, level=4.5),
+    ]
+    live = LiveSeries(channels)
+
+    dpg.set_axis_ticks("y3_axis", tuple((channel.name, channel.level) for channel in channels if channel.bit is not None))
+    for channel in channels:
+        dpg.add_line_series([], [], label=channel.name, tag=channel.tag, parent=channel.axis)
 
 # Main function
 def run():
+    startup_timer.mark("imports")
     dpg.create_context()
     dpg.create_viewport(title='Diamond Heater Control', width=cfg.window_width, height=cfg.window_height)
     dpg.set_viewport_large_icon(os.path.join(os.path.dirname(__file__), "Icons", "icon.ico"))
     dpg.set_viewport_small_icon(os.path.join(os.path.dirname(__file__), "Icons", "icon.ico"))
 
-    # Load fonts
-    with dpg.font_registry():
-        font_path = os.path.join(os.path.dirname(__file__), "Fonts", "fonts-DSEG_v046", "DSEG7-Classic", "DSEG7Classic-Regular.ttf")
-        font_7seg = dpg.add_font(font_path, 35)
-        font_path = os.path.join(os.path.dirname(__file__), "Fonts", "arial", "arial.ttf")
-        font_arial = dpg.add_font(font_path, 20)
-        font_arial_big = dpg.add_font(font_path, 40)
-
-    # Load icons
-    with dpg.texture_registry(show=False):
-        for icon in ["RedIndicator.png", "RedIndicatorOff.png", "GreenIndicator.png", "GreenIndicatorOff.png"]:
-            width, height, channels, data = dpg.load_image(os.path.join(os.path.dirname(__file__), "Icons", icon))
-            dpg.add_static_texture(width=width, height=height, default_value=data, tag=icon.replace(".png",""))
+    startup_timer.mark("viewport")
+
+    # Indicator icons are decoded in the background while the widgets are built. Until they are added after the
+    # first frame, indicators show a transparent placeholder
+    decoded = []
+    decoder = threading.Thread(target=decode_icons, args=(decoded,), name="IconDecoder", daemon=True)
+    decoder.start()
+    with dpg.texture_registry(show=False, tag="Texture Registry"):
+        dpg.add_static_texture(width=1, height=1, default_value=[0.0, 0.0, 0.0, 0.0], tag="IndicatorLoading")
 
     # Settings window
     with dpg.window(tag="Settings Window", no_title_bar=True, no_resize=True, no_move=True, no_close=True):
@@ -367,8 +605,8 @@ def run():
 
         # Dropdown menu to select serial port and button to connect
         with dpg.group(horizontal=True):
-            port_selection = ("COM0", "COM1", "COM2", "COM3", "COM4", "COM5", "COM6", "COM7", "COM8", "COM9", "COM10", "COM11", "COM12", "COM13", "COM14", "COM15", "COM16", "COM17", "COM18", "COM19", "COM20")
-            dpg.add_combo(port_selection, tag="Port select", default_value="COM0", width=100)
+            port_selection = ("COM0", "COM1", "COM2", "COM3", "COM4", "COM5", "COM6", "COM7", "COM8", "COM9", "COM10", "COM11", "COM12", "COM13", "COM14", "COM15", "COM16", "COM17", "COM18", "COM19", "COM20") + tuple(cfg.extra_ports)
+            dpg.add_combo(port_selection, tag="Port select", default_value="COM0", width=100, callback=select_port)
             dpg.add_button(tag = "Connect Button", label="Connect", callback=connect)
 
         # Sliders to change PID loop gains. Handlers to only transmit after slider is released.
@@ -398,6 +636,7 @@ def run():
             with dpg.menu(label="Tools"):
                 #dpg.add_menu_item(label="Show About", callback=lambda:dpg.show_tool(dpg.mvTool_About))
                 dpg.add_menu_item(label="Show Metrics", callback=lambda:dpg.show_tool(dpg.mvTool_Metrics))
+                dpg.add_menu_item(label="Show Pipeline Metrics", callback=lambda:dpg.show_item("Metrics Window"))
                 #dpg.add_menu_item(label="Show Documentation", callback=lambda:dpg.show_tool(dpg.mvTool_Doc))
                 dpg.add_menu_item(label="Show Debug", callback=lambda:dpg.show_tool(dpg.mvTool_Debug))
                 dpg.add_menu_item(label="Show Style Editor", callback=lambda:dpg.show_tool(dpg.mvTool_Style))
@@ -405,6 +644,7 @@ def run():
                 #dpg.add_menu_item(label="Show Item Registry", callback=lambda:dpg.show_tool(dpg.mvTool_ItemRegistry))
                 #dpg.add_menu_item(label="Show Stack Tool", callback=lambda:dpg.show_tool(dpg.mvTool_Stack))
                 dpg.add_input_int(label="Plot max points", default_value=cfg.N_points_max, callback=change_N_points_max, on_enter=True, step=0, width=60)
+                dpg.add_checkbox(label="Capture serial traffic", tag="Checkbox Capture", default_value=False, callback=checkbox_capture_cb)
             
     # Temperature window at top of viewport
     with dpg.window(tag="Temperature Window", no_title_bar=True, no_resize=True, no_move=True, no_close=True):
@@ -413,51 +653,48 @@ def run():
             with dpg.group(tag="status_light_group", horizontal=False, ):
                 for status_name, tag_name in zip(["System Fault", "Over-Current", "Over-Temperature"], ["Indicator Fault", "Indicator OC", "Indicator OT"]):
                     with dpg.group(horizontal=True):
-                        dpg.add_image("RedIndicatorOff",tag=tag_name, width=18, height=18)
+                        dpg.add_image("IndicatorLoading",tag=tag_name, width=18, height=18)
                         dpg.add_text(status_name)
                 with dpg.group(horizontal=True):
-                    dpg.add_image("GreenIndicatorOff", tag="Indicator Active",width=18, height=18)
+                    dpg.add_image("IndicatorLoading", tag="Indicator Active",width=18, height=18)
                     dpg.add_text("Active")
 
             # Start/Stop and Reset button
             with dpg.group(tag="System Controls Group", horizontal=False):
                 dpg.add_button(tag="start stop button", label="Start",width=100, height=40, callback=start_button)
                 dpg.add_button(tag="reset button", label="Reset",width=100, height=40, callback=reset_button)
-                dpg.bind_item_font("start stop button", font_arial)
-                dpg.bind_item_font("reset button", font_arial)
 
 
             # Temperature setpoint input box
             with dpg.group(horizontal=False):
                 dpg.add_text("Setpoint", tag="text_temp_setpoint")
-                dpg.bind_item_font("text_temp_setpoint", font_arial)
                 with dpg.group(horizontal=True):
                     dpg.add_input_float(tag="setpoint_input", default_value=0.0,min_value=cfg.T_min,max_value=cfg.T_max, format="%.1f", width=120, step=0, step_fast=0, callback=new_setpoint, on_enter=True)
                     dpg.add_text("°C", tag="Celcius_setpoint")
-                    dpg.bind_item_font("setpoint_input", font_7seg)
-                    dpg.bind_item_font("Celcius_setpoint", font_arial_big)
 
             # Actual Temperature display
             with dpg.group(horizontal=False):
                 current_temp = 0.0
                 dpg.add_text("Temperature", tag="actual_temp_label")
-                dpg.bind_item_font("actual_temp_label", font_arial)
                 with dpg.group(horizontal=True):
                     dpg.add_text(f"{current_temp:.1f}", tag="actual_temp_value")
                     dpg.add_text("°C", tag="Celcius_actual")
-                    dpg.bind_item_font("actual_temp_value", font_7seg)
-                    dpg.bind_item_font("Celcius_actual", font_arial_big)
 
             # Actual Current display
             with dpg.group(horizontal=False):
                 current = 0.0
                 dpg.add_text("Current", tag="current_label")
-                dpg.bind_item_font("current_label", font_arial)
                 with dpg.group(horizontal=True):
                     dpg.add_text(f"{current:.2f}", tag="current_value")
                     dpg.add_text("A", tag="Amps")
-                    dpg.bind_item_font("current_value", font_7seg)
-                    dpg.bind_item_font("Amps", font_arial_big)
+
+    # Pipeline metrics window, shown from the Tools menu
+    with dpg.window(label="Pipeline Metrics", tag="Metrics Window", show=False, width=640, height=400, pos=(200, 150)):
+        dpg.add_button(label="Reset", callback=reset_metrics)
+        with dpg.table(tag="Metrics Table", header_row=True, resizable=True, row_background=True,
+                       borders_innerV=True, policy=dpg.mvTable_SizingStretchProp):
+            for column in ("Metric", "Count", "Rate (1/s)", "Mean", "p99", "Max"):
+                dpg.add_table_column(label=column)
 
     # Plot window
     with dpg.window(tag="Plot Window", no_title_bar=True, no_resize=True, no_move=True, no_close=True):
@@ -469,10 +706,10 @@ def run():
             # REQUIRED: create x and y axes
             dpg.add_plot_axis(dpg.mvXAxis, label="Time", tag="x_axis", scale=dpg.mvPlotScale_Time, auto_fit=True)
             dpg.add_plot_axis(dpg.mvYAxis, label="T (°C)", tag="y_axis", auto_fit=True)
+            dpg.add_plot_axis(dpg.mvYAxis2, label="I (A)", tag="y2_axis", auto_fit=True, opposite=True)
+            dpg.add_plot_axis(dpg.mvYAxis3, label="Status", tag="y3_axis", auto_fit=True, opposite=True)
 
-            # series belong to a y axis
-            dpg.add_line_series(timestamp, setpoint, label="Setpoint", tag="Setpoint Series", parent="y_axis")
-            dpg.add_line_series(timestamp, temperature, label="Temperature", tag="Temperature Series", parent="y_axis")
+            # series belong to a y axis, added by init_acquisition()
 
         # Menu bar 
         with dpg.menu_bar():
@@ -482,6 +719,8 @@ def run():
             dpg.add_button(label="Clear", callback=clear_plot)
             dpg.add_separator()
             dpg.add_checkbox(label="Autoscale", tag="Checkbox Autoscale", default_value=True, callback=checkbox_autoscale_cb)
+            dpg.add_separator()
+            dpg.add_checkbox(label="Record", tag="Checkbox Record", default_value=False, callback=checkbox_record_cb)
 
     # Add points to plot for testing
     """ for i in range(int(1e3)):
@@ -492,14 +731,48 @@ def run():
     # Callback for Window resizing
     dpg.set_viewport_resize_callback(on_viewport_resize)
 
+    startup_timer.mark("widgets")
+
     dpg.setup_dearpygui()
     dpg.show_viewport()
     #dpg.start_dearpygui() # Only necessary when main render loop is not accessed
 
+    exporter = None
+    if cfg.metrics_file:
+        exporter = MetricsExporter(cfg.metrics_file, cfg.metrics_interval)
+        try:
+            exporter.start()
+        except OSError as e:
+            log.log_error(f"Failed to write metrics to {cfg.metrics_file}: {e}")
+            exporter = None
+
+    # First frame with the default font, then set up the acquisition and load the deferred fonts and icons
+    dpg.render_dearpygui_frame()
+    startup_timer.mark("first frame")
+    init_acquisition()
+
+    # Start servicing serial ports
+    manager.start()
+    startup_timer.mark("acquisition")
+    load_fonts()
+    decoder.join()
+    add_icons(decoded)
+    startup_timer.mark("fonts and icons")
+    startup_timer.report()
+
     # Main loop
     while dpg.is_dearpygui_running():
         handle_Serial()
+        flush_commands()
+        refresh_Plot()
+        log.render()
+        refresh_Metrics()
         dpg.render_dearpygui_frame()
 
-    comm.close()
+    manager.close()
+    if exporter is not None:
+        exporter.stop()
+    for dev in manager:
+        if dev.recorder is not None:
+            stop_recording(dev)
     dpg.destroy_context()
\ No newline at end of file
@@ -1,14 +1,91 @@
 """
 Adapted from dearpyguiext package by Jonathan Hoffstadt and Preston Cothren: https://github.com/hoffstadt/DearPyGui_Ext/tree/master
 Added feature to allow for text-wrapping
+
+Messages are kept in a bounded ring buffer (LogBuffer), a message repeating the previous one only increments
+its counter. Logging does not touch DearPyGui: render() is called once per frame and updates a pool of text
+items inside a clipper, so only the visible lines are drawn and a flood of messages costs one update per frame.
 """
 
+import textwrap
+import time
+from collections import deque
 import dearpygui.dearpygui as dpg
 
+LEVELS = ["TRACE", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+
+class LogRecord:
+    __slots__ = ("seq", "time", "level", "message", "count")
+
+    def __init__(self, seq, t, level, message):
+        self.seq = seq          # Position in the log, increasing
+        self.time = t           # Time of the last repetition
+        self.level = level
+        self.message = message
+        self.count = 1          # Number of repetitions
+
+    @property
+    def text(self):
+        text = f"[{LEVELS[self.level]}] {self.message}"
+        return text if self.count == 1 else f"{text} (x{self.count})"
+
+
+def text_filter(pattern):
+    """Match function for a filter in the syntax of the DearPyGui filter_set: comma separated terms,
+    terms starting with - exclude. Case-insensitive"""
+    terms = [term.strip().lower() for term in pattern.split(",") if term.strip()]
+    include = [term for term in terms if not term.startswith("-")]
+    exclude = [term[1:] for term in terms if term.startswith("-") and len(term) > 1]
+
+    def match(text):
+        text = text.lower()
+        if any(term in text for term in exclude):
+            return False
+        return not include or any(term in text for term in include)
+    return match
+
+
+class LogBuffer:
+    """Bounded ring buffer of log records. The oldest records are dropped when it is full"""
+
+    def __init__(self, capacity=5000):
+        self.records = deque(maxlen=capacity)
+        self.seq = 0            # Sequence number of the next record
+        self.cleared = 0        # Number of calls to clear()
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, level, message, t=None):
+        """Add a message. Returns its record, which is the last one if the message repeats it"""
+        t = time.time() if t is None else t
+        if self.records:
+            last = self.records[-1]
+            if last.level == level and last.message == message:
+                last.count += 1
+                last.time = t
+                return last
+
+        record = LogRecord(self.seq, t, level, message)
+        self.seq += 1
+        self.records.append(record)
+        return record
+
+    def clear(self):
+        self.records.clear()
+        self.cleared += 1
+
+    def select(self, pattern="", level=0):
+        """Records at or above level whose text matches a filter, see text_filter()"""
+        match = text_filter(pattern)
+        return [record for record in self.records if record.level >= level and match(record.text)]
+
+
 class mvLogger:
 
-    def __init__(self, parent=None):
-        
+    def __init__(self, parent=None, capacity=5000):
+
         self.log_level = 0
         self._auto_scroll = True
         self.filter_id = None
@@ -16,19 +93,16 @@ class mvLogger:
             self.window_id = parent
         else:
             self.window_id = dpg.add_window(label="mvLogger", pos=(200, 200), width=500, height=500)
-        self.count = 0
-        self.flush_count = 1000
+        self.buffer = LogBuffer(capacity)
 
         with dpg.group(horizontal=True, parent=self.window_id):
             dpg.add_checkbox(label="Auto-scroll", default_value=True, callback=lambda sender:self.auto_scroll(dpg.get_value(sender)))
-            dpg.add_button(label="Clear", callback=lambda: dpg.delete_item(self.filter_id, children_only=True))
+            dpg.add_button(label="Clear", callback=lambda: self.clear_log())
 
-        dpg.add_input_text(label="Filter", callback=lambda sender: dpg.set_value(self.filter_id, dpg.get_value(sender)), 
+        dpg.add_input_text(label="Filter", callback=lambda sender: self.set_filter(dpg.get_value(sender)),
                     parent=self.window_id)
         self.child_id = dpg.add_child_window(parent=self.window_id, autosize_x=True, autosize_y=True)
-        self.filter_id = dpg.add_filter_set(parent=self.child_id)
-
-        (self.width, self.height) = dpg.get_item_rect_size(self.child_id)
+        self.filter_id = dpg.add_clipper(parent=self.child_id)
 
         with dpg.theme() as self.trace_theme:
             with dpg.theme_component(0):
@@ -54,43 +128,111 @@ class mvLogger:
             with dpg.theme_component(0):
                 dpg.add_theme_color(dpg.mvThemeCol_Text, (255, 0, 0, 255))
 
+        self.themes = [self.trace_theme, self.debug_theme, self.info_theme, self.warning_theme, self.error_theme, self.critical_theme]
+
+        # Displayed lines. A record wraps into one or more lines of equal height, as required by the clipper.
+        # Text items are reused: lines dropped at the top hand their item to lines added at the bottom
+        self.filter = ""
+        self._lines = deque()       # (seq, count) of the record shown by each line, oldest first
+        self._items = deque()       # (text item, level of its theme) of each line
+        self._spare = []            # Items of removed lines, deleted if not reused by the end of render()
+        self._cleared = 0           # buffer.cleared at the last render
+        self._columns = None        # Characters per line at the last render, None: no wrapping
+        self._last = (-1, 0)        # (seq, count) of the last record of the buffer at the last render
+        self._rebuild = True
+
     def auto_scroll(self, value):
         self._auto_scroll = value
 
+    def set_filter(self, pattern):
+        self.filter = pattern
+        self._rebuild = True
+
     def _log(self, message, level):
 
         if level < self.log_level:
             return
 
-        self.count+=1
-
-        if self.count > self.flush_count:
-            self.clear_log()
-
-        theme = self.info_theme
-
-        if level == 0:
-            message = "[TRACE] " + message
-            theme = self.trace_theme
-        elif level == 1:
-            message = "[DEBUG] " + message
-            theme = self.debug_theme
-        elif level == 2:
-            message = "[INFO] " + message
-        elif level == 3:
-            message = "[WARNING] " + message
-            theme = self.warning_theme
-        elif level == 4:
-            message = "[ERROR] " + message
-            theme = self.error_theme
-        elif level == 5:
-            message = "[CRITICAL] " + message
-            theme = self.critical_theme
-
-        new_log = dpg.add_text(message, parent=self.filter_id, filter_key=message, wrap=self.width)
-        dpg.bind_item_theme(new_log, theme)
-        if self._auto_scroll:
-            scroll_max = dpg.get_y_scroll_max(self.child_id)
+        self.buffer.append(level, message)
+
+    def _line_columns(self):
+        # Text is drawn in the default font, which is monospaced
+        width = dpg.get_item_rect_size(self.child_id)[0]
+        char_width = (dpg.get_text_size("0") or [7])[0]
+        if width <= 0 or char_width <= 0:
+            return None
+        return max(int((width - 20) // char_width), 10)
+
+    def _pop_line(self, left=False):
+        if left:
+            self._lines.popleft()
+            self._spare.append(self._items.popleft())
+        else:
+            self._lines.pop()
+            self._spare.append(self._items.pop())
+
+    def _add_record(self, record):
+        text = record.text
+        if self._columns is None or len(text) <= self._columns:
+            lines = [text]
+        else:
+            lines = textwrap.wrap(text, self._columns)
+        for line in lines:
+            if self._spare:
+                item, level = self._spare.pop()
+                dpg.move_item(item, parent=self.filter_id)
+            else:
+                item, level = dpg.add_text("", parent=self.filter_id), None
+            if level != record.level:
+                dpg.bind_item_theme(item, self.themes[record.level])
+            dpg.set_value(item, line)
+            self._lines.append((record.seq, record.count))
+            self._items.append((item, record.level))
+
+    def render(self):
+        """Show the records added since the last call. Called once per frame"""
+        columns = self._line_columns()
+        if columns != self._columns or self._cleared != self.buffer.cleared:
+            self._columns = columns
+            self._cleared = self.buffer.cleared
+            self._rebuild = True
+
+        records = self.buffer.records
+        if self._rebuild:
+            self._rebuild = False
+            while self._lines:
+                self._pop_line()
+            new = self.buffer.select(self.filter, self.log_level)
+        else:
+            # Records dropped from the buffer
+            first = records[0].seq if records else self.buffer.seq
+            while self._lines and self._lines[0][0] < first:
+                self._pop_line(left=True)
+
+            # Records appended since the last render are at the end of the buffer. If the last record was
+            # repeated since, its lines are replaced
+            seq, count = self._last
+            start = len(records)
+            while start > 0 and records[start - 1].seq > seq:
+                start -= 1
+            if start > 0 and records[start - 1].seq == seq and records[start - 1].count != count:
+                start -= 1
+                while self._lines and self._lines[-1][0] == seq:
+                    self._pop_line()
+            if start == len(records) and not self._spare:
+                return
+            match = text_filter(self.filter)
+            new = [record for record in (records[i] for i in range(start, len(records)))
+                   if record.level >= self.log_level and match(record.text)]
+
+        for record in new:
+            self._add_record(record)
+        self._last = (records[-1].seq, records[-1].count) if records else (-1, 0)
+        for item, level in self._spare:
+            dpg.delete_item(item)
+        self._spare.clear()
+
+        if self._auto_scroll and new:
             dpg.set_y_scroll(self.child_id, -1.0)
 
     def log(self, message):
@@ -112,5 +254,4 @@ class mvLogger:
         self._log(message, 5)
 
     def clear_log(self):
-        dpg.delete_item(self.filter_id, children_only=True)
-        self.count = 0
+        self.buffer.clear()
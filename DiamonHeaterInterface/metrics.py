@@ -0,0 +1,153 @@
+"""
+Performance metrics of the acquisition pipeline.
+Counters and histograms are created by name in the global registry `metrics` and updated inline by Comm,
+the acquisition and the GUI. Updates are a few attribute operations without locks, so counts taken from
+several threads at the same time may rarely lose an increment. MetricsExporter appends snapshots to a file
+at an interval, as one JSON object per line.
+"""
+
+import json
+import math
+import threading
+import time
+
+# Histogram buckets by power of two: bucket i holds values in [2**(i - BUCKET_OFFSET - 1), 2**(i - BUCKET_OFFSET))
+BUCKETS = 64
+BUCKET_OFFSET = 40      # Smallest bucket ends at 2**-40 (about 1e-12), largest at 2**23
+
+
+class Counter:
+    __slots__ = ("name", "unit", "value")
+
+    def __init__(self, name, unit=""):
+        self.name = name
+        self.unit = unit
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def snapshot(self):
+        return {"value": self.value}
+
+
+class Histogram:
+    """Distribution of observed values: count, sum, minimum, maximum and power of two buckets for quantiles"""
+
+    __slots__ = ("name", "unit", "count", "total", "min", "max", "buckets")
+
+    def __init__(self, name, unit=""):
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets = [0] * BUCKETS
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        i = math.frexp(value)[1] + BUCKET_OFFSET if value > 0 else 0
+        self.buckets[min(max(i, 0), BUCKETS - 1)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, at most the maximum"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(math.ldexp(1.0, i - BUCKET_OFFSET), self.max)
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.mean, "min": self.min, "max": self.max,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+
+class Metrics:
+    """Registry of counters and histograms by name"""
+
+    def __init__(self):
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, unit):
+        item = self.items.get(name)
+        if item is None:
+            with self._lock:
+                item = self.items.setdefault(name, kind(name, unit))
+        return item
+
+    def counter(self, name, unit=""):
+        return self._get(Counter, name, unit)
+
+    def histogram(self, name, unit=""):
+        return self._get(Histogram, name, unit)
+
+    def snapshot(self):
+        """Current values of all metrics by name"""
+        return {name: item.snapshot() for name, item in sorted(self.items.items())}
+
+    def reset(self):
+        with self._lock:
+            for name, item in self.items.items():
+                item.__init__(name, item.unit)
+
+
+metrics = Metrics()
+
+
+class MetricsExporter:
+    """Appends a snapshot of the metrics to a file every interval seconds, in a background thread"""
+
+    def __init__(self, filename, interval=10.0, registry=metrics):
+        self.filename = filename
+        self.interval = interval
+        self.registry = registry
+        self.error = None       # Exception that stopped the exporter
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        # Fail early if the file can not be written
+        open(self.filename, 'a').close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write a last snapshot and stop"""
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def write(self):
+        line = json.dumps({"time": time.time(), "metrics": self.registry.snapshot()})
+        with open(self.filename, 'a') as file:
+            file.write(line + "\n")
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                self.write()
+            self.write()
+        except OSError as e:
+            self.error = e
@@ -1,9 +1,16 @@
+import binascii
 import serial
 import struct
+import threading
+import time
+import numpy as np
 from enum import Enum, IntEnum
 
 import serial.tools
 import serial.tools.list_ports
+from capture import TraceWriter, RX, TX, serial_for_url
+from metrics import metrics
+from commands import PendingCommands
 
 
 class MSG(IntEnum):
@@ -37,26 +44,486 @@ class MSG_TYPE(IntEnum):
 
 class RxMessage:
     """Structure to hold received message information"""
-    def __init__(self, msg=MSG.MSG_END, msg_type=MSG_TYPE.MSG_FLAG, size=0):
+    def __init__(self, msg=MSG.MSG_END, msg_type=MSG_TYPE.MSG_FLAG, size=0, payload=b''):
         self.msg = msg
         self.msg_type = msg_type
         self.size = size
+        self.payload = payload
+
+
+class RxDecoder:
+    """Incremental decoder for the received byte stream.
+
+    Raw bytes are appended to a reusable buffer with feed(). Complete tokens are
+    taken from the front of the buffer, incomplete tokens stay in the buffer until
+    the rest of their bytes arrive with a later feed().
+    """
+
+    def __init__(self, size=4096):
+        self.buf = bytearray(size)  # Receive buffer, grows if a single read does not fit
+        self.start = 0              # Position of first unread byte
+        self.end = 0                # Position after last received byte
+
+    def pending(self):
+        """Number of received bytes that have not been decoded yet"""
+        return self.end - self.start
+
+    def clear(self):
+        self.start = 0
+        self.end = 0
+
+    def feed(self, data):
+        """Append received bytes to the buffer"""
+        n = len(data)
+        if n == 0:
+            return
+
+        # Move the unread rest of the buffer to the front before appending
+        if self.end + n > len(self.buf):
+            pending = self.end - self.start
+            if pending + n > len(self.buf):
+                new_buf = bytearray(max(2*len(self.buf), pending + n))
+                new_buf[:pending] = self.buf[self.start:self.end]
+                self.buf = new_buf
+            else:
+                self.buf[:pending] = self.buf[self.start:self.end]
+            self.start = 0
+            self.end = pending
+
+        self.buf[self.end:self.end + n] = data
+        self.end += n
+
+    def missing(self):
+        """Number of bytes still needed to complete the token at the front of the buffer"""
+        pending = self.end - self.start
+        if pending == 0:
+            return 0
+
+        prefix = self.buf[self.start]
+        msg_type = (prefix >> 6) & 0b11
+        if msg_type == MSG_TYPE.MSG_VARIABLE:
+            size = 5
+        elif msg_type == MSG_TYPE.MSG_CUSTOM:
+            if pending < 2:
+                return 1
+            size = 2 + self.buf[self.start + 1]
+        else:
+            size = 1
+        return max(size - pending, 0)
+
+    def next_msg(self):
+        """Decode the token at the front of the buffer. Returns None if it is not complete yet"""
+        start = self.start
+        pending = self.end - start
+        if pending == 0:
+            return None
+
+        view = memoryview(self.buf)
+        prefix = view[start]
+        msg_type = (prefix >> 6) & 0b11
+        msg = prefix & 0b00111111
+
+        if msg_type == MSG_TYPE.MSG_VARIABLE:
+            if pending < 5:
+                return None
+            payload = bytes(view[start + 1:start + 5])
+            self.start = start + 5
+            return RxMessage(msg, msg_type, 4, payload)
+
+        if msg_type == MSG_TYPE.MSG_CUSTOM:
+            if pending < 2:
+                return None
+            size = view[start + 1]
+            if pending < 2 + size:
+                return None
+            payload = bytes(view[start + 2:start + 2 + size])
+            self.start = start + 2 + size
+            return RxMessage(msg, msg_type, size, payload)
+
+        self.start = start + 1
+        return RxMessage(msg, msg_type, 0)
+
+    def messages(self):
+        """Yield all complete messages currently held in the buffer"""
+        while True:
+            rxm = self.next_msg()
+            if rxm is None:
+                break
+            yield rxm
+
+        # Nothing left to decode, restart at the front of the buffer
+        if self.start == self.end:
+            self.start = 0
+            self.end = 0
+
+
+# Optional framing of whole batches: SYNC, payload length (uint16), tokens, CRC-16/CCITT of length and tokens (uint16)
+FRAME_SYNC = b'\xa5\x5a'
+FRAME_HEADER = struct.Struct('<2sH')
+FRAME_CRC = struct.Struct('<H')
+FRAME_MAX_LENGTH = 128     # Largest batch, the size of the transmit buffer on both ends (Comm.BUF_SIZE)
+
+
+def frame_crc(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def frame_batch(batch):
+    """Wrap a batch of tokens into a frame with sync marker, length and CRC"""
+    if len(batch) > FRAME_MAX_LENGTH:
+        raise ValueError(f"Batch of {len(batch)} bytes exceeds the frame limit of {FRAME_MAX_LENGTH} bytes")
+    header = FRAME_HEADER.pack(FRAME_SYNC, len(batch))
+    crc = binascii.crc_hqx(batch, frame_crc(header[2:]))
+    return header + bytes(batch) + FRAME_CRC.pack(crc)
+
+
+class FramedDecoder:
+    """Decoder for framed batches. Has the same interface as RxDecoder.
+
+    Only tokens of frames with a valid CRC are decoded. After lost or corrupted bytes the decoder
+    resynchronizes at the next sync marker that starts a valid frame and counts the bytes it skipped.
+    """
+
+    def __init__(self, size=4096, max_length=FRAME_MAX_LENGTH):
+        self.raw = RxDecoder(size)      # Received bytes, not yet checked
+        self.tokens = RxDecoder(size)   # Tokens of verified frames
+        self.max_length = max_length
+
+        self.frames = 0                 # Number of valid frames
+        self.crc_errors = 0             # Number of frames with a wrong CRC
+        self.discarded = 0              # Number of bytes skipped while resynchronizing
+
+    def pending(self):
+        return self.raw.pending() + self.tokens.pending()
+
+    def clear(self):
+        self.raw.clear()
+        self.tokens.clear()
+
+    def feed(self, data):
+        self.raw.feed(data)
+
+    def missing(self):
+        """Number of bytes still needed to complete the frame at the front of the buffer"""
+        pending = self.raw.pending()
+        if pending == 0 or self.tokens.pending():
+            return 0
+        if pending < FRAME_HEADER.size:
+            return FRAME_HEADER.size - pending
+
+        sync, length = FRAME_HEADER.unpack_from(self.raw.buf, self.raw.start)
+        if sync != FRAME_SYNC or length > self.max_length:
+            return 0
+        return max(FRAME_HEADER.size + length + FRAME_CRC.size - pending, 0)
+
+    def _discard(self, n):
+        self.raw.start += n
+        self.discarded += n
+
+    def _frame_at(self, pos):
+        """Size of the complete frame with a valid CRC starting at pos in the raw buffer, None if there is none"""
+        raw = self.raw
+        if raw.end - pos < FRAME_HEADER.size:
+            return None
+        sync, length = FRAME_HEADER.unpack_from(raw.buf, pos)
+        size = FRAME_HEADER.size + length + FRAME_CRC.size
+        if sync != FRAME_SYNC or length > self.max_length or raw.end - pos < size:
+            return None
+        crc = FRAME_CRC.unpack_from(raw.buf, pos + FRAME_HEADER.size + length)[0]
+        with memoryview(raw.buf) as view:
+            if frame_crc(view[pos + 2:pos + FRAME_HEADER.size + length]) != crc:
+                return None
+        return size
+
+    def _next_frame(self):
+        """Position of the next sync marker behind the front of the raw buffer that starts a complete and
+        valid frame, None if there is none yet"""
+        raw = self.raw
+        i = raw.buf.find(FRAME_SYNC, raw.start + 1, raw.end)
+        while i >= 0:
+            if self._frame_at(i) is not None:
+                return i
+            i = raw.buf.find(FRAME_SYNC, i + 1, raw.end)
+        return None
+
+    def _extract(self):
+        """Move the tokens of the next complete and valid frame from the raw buffer to the token buffer"""
+        raw = self.raw
+        while raw.pending() >= FRAME_HEADER.size:
+            # Search sync marker
+            i = raw.buf.find(FRAME_SYNC, raw.start, raw.end)
+            if i < 0:
+                # Keep a trailing first sync byte, the second may still arrive
+                keep = 1 if raw.buf[raw.end - 1] == FRAME_SYNC[0] else 0
+                self._discard(raw.pending() - keep)
+                break
+            if i > raw.start:
+                self._discard(i - raw.start)
+                continue
+
+            _, length = FRAME_HEADER.unpack_from(raw.buf, raw.start)
+            if length > self.max_length:
+                self._discard(1)    # Not a real sync marker
+                continue
+
+            size = FRAME_HEADER.size + length + FRAME_CRC.size
+            if raw.pending() < size:
+                # The length is not protected by the CRC until the frame is complete. If a valid frame already
+                # follows, the length of this one was corrupted: skip it instead of waiting for its end
+                j = self._next_frame()
+                if j is None:
+                    break
+                self._discard(j - raw.start)
+                continue
+
+            view = memoryview(raw.buf)
+            body = view[raw.start + 2:raw.start + FRAME_HEADER.size + length]
+            crc = FRAME_CRC.unpack_from(raw.buf, raw.start + FRAME_HEADER.size + length)[0]
+            if frame_crc(body) != crc:
+                self.crc_errors += 1
+                body.release()
+                view.release()
+                self._discard(1)    # Resynchronize after this sync marker
+                continue
+
+            # Tokens left from a previous frame are incomplete and can not be decoded anymore
+            if self.tokens.pending():
+                self.discarded += self.tokens.pending()
+                self.tokens.clear()
+
+            self.tokens.feed(body[2:])
+            body.release()
+            view.release()
+            raw.start += size
+            self.frames += 1
+            break
+
+        if raw.start == raw.end:
+            raw.clear()
+
+    def next_msg(self):
+        rxm = self.tokens.next_msg()
+        if rxm is None:
+            self._extract()
+            rxm = self.tokens.next_msg()
+        return rxm
+
+    def messages(self):
+        while True:
+            rxm = self.next_msg()
+            if rxm is None:
+                break
+            yield rxm
+
+
+class MsgSchema:
+    """Payload layout of one message type.
+
+    Variable and custom messages with a fixed layout get a precompiled struct.Struct covering
+    the prefix byte and the payload, so a token is packed with a single call. Custom messages
+    without a format carry a string (codec "str") or raw bytes (codec "bytes").
+    """
+
+    def __init__(self, msg, msg_type, fmt=None, codec=None):
+        self.msg = msg
+        self.msg_type = msg_type
+        self.prefix = (msg_type << 6) | msg
+        self.codec = codec
+
+        self.payload = None     # Struct of the payload
+        self.token = None       # Struct of prefix and payload (variable messages)
+        self.dtype = None       # NumPy type of the payload value, for batch decoding
+
+        if fmt is not None:
+            self.payload = struct.Struct('<' + fmt)
+            if msg_type == MSG_TYPE.MSG_VARIABLE:
+                if self.payload.size != 4:
+                    raise ValueError("Variable messages must have a 32-bit payload")
+                self.token = struct.Struct('<B' + fmt)
+                self.dtype = np.dtype('<' + fmt)
+
+    def encode(self, data=None, size=None):
+        """Return the complete token for a value"""
+        if self.msg_type == MSG_TYPE.MSG_FLAG:
+            return bytes([self.prefix])
+
+        if self.msg_type == MSG_TYPE.MSG_VARIABLE:
+            return self.token.pack(self.prefix, data)
+
+        # Custom message
+        if self.payload is not None:
+            if isinstance(data, (list, tuple)):
+                data_bytes = self.payload.pack(*data)
+            else:
+                data_bytes = self.payload.pack(data)
+        elif isinstance(data, str):
+            data_bytes = data.encode('utf-8')
+        else:
+            data_bytes = bytes(data)
+
+        # Ensure the data matches the specified size
+        if size is not None and len(data_bytes) != size:
+            data_bytes = data_bytes[:size].ljust(size, b'\x00')
+
+        if len(data_bytes) > 255:
+            raise ValueError("Custom message payload exceeds 255 bytes")
+
+        return bytes([self.prefix, len(data_bytes)]) + data_bytes
+
+    def token_size(self):
+        """Length of the token in bytes, None for custom messages"""
+        if self.msg_type == MSG_TYPE.MSG_FLAG:
+            return 1
+        if self.msg_type == MSG_TYPE.MSG_VARIABLE:
+            return 5
+        return None
+
+    def encode_into(self, buf, offset, data=None, size=None):
+        """Write the token for a value into buf at offset. Returns the token length"""
+        if self.msg_type == MSG_TYPE.MSG_FLAG:
+            buf[offset] = self.prefix
+            return 1
+
+        if self.msg_type == MSG_TYPE.MSG_VARIABLE:
+            self.token.pack_into(buf, offset, self.prefix, data)
+            return 5
+
+        token = self.encode(data, size)
+        buf[offset:offset + len(token)] = token
+        return len(token)
+
+    def decode(self, payload):
+        """Return the value of a received payload"""
+        if self.msg_type == MSG_TYPE.MSG_FLAG:
+            return None
+
+        if self.payload is not None:
+            values = self.payload.unpack_from(payload)
+            return values[0] if len(values) == 1 else values
+
+        if self.codec == "str":
+            # Lossy, a corrupted error message is still shown as text
+            return bytes(payload).rstrip(b'\x00').decode('utf-8', errors='replace')
+
+        return bytes(payload)
+
+    def decode_batch(self, buffer):
+        """Decode a buffer of consecutive variable tokens of this message into an array of values"""
+        frames = np.frombuffer(buffer, dtype=np.dtype([('prefix', 'u1'), ('value', self.dtype)]))
+        if not np.all(frames['prefix'] == self.prefix):
+            raise ValueError(f"Buffer contains tokens other than {MSG(self.msg).name}")
+        return frames['value'].copy()
+
+
+class SchemaRegistry:
+    """Payload layouts of all messages, keyed by message id"""
+
+    # Consecutive variable tokens as raw (prefix, 32-bit payload) records
+    VARIABLE_FRAME = np.dtype([('prefix', 'u1'), ('value', 'V4')])
+
+    def __init__(self):
+        self.schemas = {}
+
+    def __getitem__(self, msg):
+        try:
+            return self.schemas[msg]
+        except KeyError:
+            raise KeyError(f"No schema registered for message {msg}") from None
+
+    def __contains__(self, msg):
+        return msg in self.schemas
+
+    def register(self, schema):
+        self.schemas[schema.msg] = schema
+        return schema
+
+    def flag(self, msg):
+        return self.register(MsgSchema(msg, MSG_TYPE.MSG_FLAG))
+
+    def variable(self, msg, fmt):
+        return self.register(MsgSchema(msg, MSG_TYPE.MSG_VARIABLE, fmt))
+
+    def custom(self, msg, fmt=None, codec="bytes"):
+        return self.register(MsgSchema(msg, MSG_TYPE.MSG_CUSTOM, fmt, codec))
+
+    def decode(self, rxm):
+        """Return the value of a received message. Messages without schema return their raw payload"""
+        schema = self.schemas.get(rxm.msg)
+        if schema is None or schema.msg_type != rxm.msg_type:
+            return bytes(rxm.payload) if rxm.size else None
+        return schema.decode(rxm.payload)
+
+    def decode_batch(self, buffer):
+        """Decode a buffer of consecutive variable tokens, e.g. a run of T_ACTUAL and CURRENT tokens.
+        Returns a dict with an array of values for every message id in the buffer, in order of arrival"""
+        frames = np.frombuffer(buffer, dtype=self.VARIABLE_FRAME)
+        if frames.size and np.any(frames['prefix'] >> 6 != MSG_TYPE.MSG_VARIABLE):
+            raise ValueError("Buffer contains tokens that are not variable messages")
+
+        result = {}
+        for prefix in np.unique(frames['prefix']):
+            schema = self[int(prefix) & 0b00111111]
+            result[schema.msg] = frames['value'][frames['prefix'] == prefix].view(schema.dtype)
+        return result
+
+
+# Message layouts as defined in messages.h
+schemas = SchemaRegistry()
+schemas.flag(MSG.RESET)
+schemas.flag(MSG.START)
+schemas.flag(MSG.STOP)
+schemas.flag(MSG.ACK)
+schemas.flag(MSG.NACK)
+schemas.variable(MSG.T_SETPOINT, 'f')
+schemas.variable(MSG.T_ACTUAL, 'f')
+schemas.variable(MSG.CURRENT, 'f')
+schemas.variable(MSG.PID_P, 'f')
+schemas.variable(MSG.PID_I, 'f')
+schemas.variable(MSG.PID_D, 'f')
+schemas.variable(MSG.STATUS, 'i')
+schemas.custom(MSG.ERROR_MSG, codec="str")
+schemas.flag(MSG.MSG_END)
+
+
+# Link metrics of all Comm instances, see metrics.py
+BYTES_IN   = metrics.counter("comm.bytes_in", "B")
+BYTES_OUT  = metrics.counter("comm.bytes_out", "B")
+READS      = metrics.counter("comm.reads")           # Read calls on the port
+READ_SIZE  = metrics.histogram("comm.read_size", "B")
+FRAMES_OUT = metrics.counter("comm.frames_out")      # Write calls on the port
+TOKENS_OUT = metrics.counter("comm.tokens_out")
+WRITE_TIME = metrics.histogram("comm.write_time", "s")
 
 
 class Comm:
     """Serial communication class for sending and receiving messages"""
     
     BUF_SIZE = 128
+
+    # Commands that are sent immediately by post() instead of waiting in the outbox
+    URGENT = frozenset((MSG.STOP, MSG.RESET))
     
-    def __init__(self, port=None, baud_rate=115200, timeout=0.1, write_timeout = 1):
+    def __init__(self, port=None, baud_rate=115200, timeout=0.1, write_timeout = 1, registry=schemas, framed=False):
         """Initialize the serial communication with the specified baud rate"""
-        self.ser = serial.Serial(port=port, baudrate=baud_rate, timeout=timeout, write_timeout=write_timeout)
+        # serial_for_url also accepts pyserial URLs such as loop:// or socket:// and replay:// traces besides port names
+        self.ser = serial_for_url(port, do_not_open=True, baudrate=baud_rate, timeout=timeout, write_timeout=write_timeout)
+        if port is not None:
+            self.ser.open()
         
         self.tx_buf = bytearray(self.BUF_SIZE)  # Transmit buffer
         self.tx_buf_pos = 0                     # Current position in transmit buffer
         self.rxm = RxMessage()                  # Current received message info
+        self.framed = framed                    # Wrap batches into frames with sync marker and CRC
+        self.rx = FramedDecoder() if framed else RxDecoder()  # Buffered decoder for received bytes
+        self.tx_lock = threading.RLock()        # Transmit buffer is shared between GUI and acquisition thread
+        self.schemas = registry                 # Payload layouts of all messages
+        self.outbox = {}                        # Queued commands, newest value per message id
+        self.urgent_buf = bytearray(8)          # Transmit buffer for urgent commands
+        self.capture = None                     # TraceWriter recording all raw bytes, see capture.py
+        self.pending = PendingCommands()        # Commands waiting for their ACK/NACK, see request()
     
-    def available_ports(self):
+    @staticmethod
+    def available_ports():
         return serial.tools.list_ports.comports()
 
     def connect(self, port):
@@ -64,7 +531,10 @@ class Comm:
         if(self.ser.is_open):
             self.ser.close()
 
-        self.ser.port = port
+        # Recreate port object with the same settings, the port may be a URL with a different handler
+        settings = self.ser.get_settings()
+        self.ser = serial_for_url(port, do_not_open=True)
+        self.ser.apply_settings(settings)
 
         # Open serial port and flush buffers
         try:
@@ -79,173 +549,230 @@ class Comm:
     def disconnect(self):
         self.ser.close()
 
+    def start_capture(self, filename):
+        """Record all bytes read from and written to the port in a trace file"""
+        self.stop_capture()
+        self.capture = TraceWriter(filename, framed=self.framed)
+
+    def stop_capture(self):
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            capture.close()
+        return capture
+
+    def _write_port(self, data):
+        t0 = time.perf_counter()
+        self.ser.write(data)
+        WRITE_TIME.observe(time.perf_counter() - t0)
+        FRAMES_OUT.inc()
+        BYTES_OUT.inc(len(data))
+        if self.capture is not None:
+            self.capture.write(TX, data)
+
     def add_flag_token(self, identifier):
         """Add a flag message with no payload to the transmit buffer"""
-        prefix = (MSG_TYPE.MSG_FLAG << 6) | identifier
-        return self.append_token(bytes([prefix]), 1)
+        return self.put_token(identifier)
     
     def add_variable_token(self, data, identifier):
         """Add a variable message with a 32-bit payload to the transmit buffer"""
-        # Ensure data fits in a 32-bit value
-        data_bytes = None
-        if isinstance(data, int):
-            data_bytes = struct.pack('<i', data)  # 32-bit int
-        elif isinstance(data, float):
-            data_bytes = struct.pack('<f', data)  # 32-bit float
-        else:
-            raise TypeError("Variable tokens must be int or float")
-        
-        size = len(data_bytes)
-        if size > 255:
-            return False
-            
-        # Prepare token prefix
-        prefix = (MSG_TYPE.MSG_VARIABLE << 6) | identifier
-        
-        # Create token
-        token = bytes([prefix]) + data_bytes
-        
-        return self.append_token(token, len(token))
+        return self.put_token(identifier, data)
     
     def add_custom_token(self, data, identifier, size):
         """Add a custom message with a variable length payload to the transmit buffer"""
         if size > 255:
             return False
-            
-        # Convert data to bytes if it's not already
-        if isinstance(data, bytes):
-            data_bytes = data
-        elif isinstance(data, bytearray):
-            data_bytes = bytes(data)
-        elif isinstance(data, (int, float, str, list, tuple)):
-            if isinstance(data, str):
-                data_bytes = data.encode('utf-8')
-            elif isinstance(data, (int, float)):
-                data_bytes = struct.pack('<f', float(data))
-            elif isinstance(data, (list, tuple)):
-                if all(isinstance(item, int) for item in data):
-                    data_bytes = struct.pack(f'<{len(data)}i', *data)
-                elif all(isinstance(item, float) for item in data):
-                    data_bytes = struct.pack(f'<{len(data)}f', *data)
-                else:
-                    raise TypeError("List must contain only ints or only floats")
-        else:
-            raise TypeError("Unsupported data type for custom token")
-        
-        # Ensure the data matches the specified size
-        if len(data_bytes) != size:
-            data_bytes = data_bytes[:size].ljust(size, b'\x00')
-            
-        # Prepare token
-        prefix = (MSG_TYPE.MSG_CUSTOM << 6) | identifier
-        token = bytes([prefix, size]) + data_bytes
-        
-        return self.append_token(token, len(token))
+
+        return self.put_token(identifier, data, size)
+
+    def put_token(self, identifier, data=None, size=None):
+        """Encode a token directly into the transmit buffer"""
+        schema = self.schemas[identifier]
+        length = schema.token_size()
+        if length is None:
+            token = schema.encode(data, size)
+            if not self.append_token(token, len(token)):
+                return False
+            TOKENS_OUT.inc()
+            return True
+
+        with self.tx_lock:
+            # Check that token fits into tx buffer, while leaving space for END Token
+            if self.tx_buf_pos + length >= self.BUF_SIZE:
+                return False
+
+            schema.encode_into(self.tx_buf, self.tx_buf_pos, data)
+            self.tx_buf_pos += length
+            TOKENS_OUT.inc()
+            return True
     
     def append_token(self, token, length):
         """Add a token to the transmit buffer"""
-        # Check that token fits into tx buffer, while leaving space for END Token
-        if self.tx_buf_pos + length >= self.BUF_SIZE:
-            return False
+        with self.tx_lock:
+            # Check that token fits into tx buffer, while leaving space for END Token
+            if self.tx_buf_pos + length >= self.BUF_SIZE:
+                return False
+                
+            # Append token at end of tx buffer
+            self.tx_buf[self.tx_buf_pos:self.tx_buf_pos + length] = token
+            self.tx_buf_pos += length
             
-        # Append token at end of tx buffer
-        self.tx_buf[self.tx_buf_pos:self.tx_buf_pos + length] = token
-        self.tx_buf_pos += length
-        
-        return True
+            return True
     
-    def transmit(self):
-        """Transmit the contents of the transmit buffer"""
-        if self.tx_buf_pos > 0:
+    def wrap(self, batch):
+        """Return the bytes to transmit for a batch of tokens"""
+        if self.framed:
+            return frame_batch(batch)
+        return batch
+
+    def take_frame(self):
+        """Terminate the transmit buffer and return a copy of its contents as one frame. Clears the transmit buffer"""
+        with self.tx_lock:
+            if self.tx_buf_pos == 0:
+                return b''
+
             # Terminate message
             self.tx_buf[self.tx_buf_pos] = MSG.MSG_END
-            
-            # Send over Serial
+            frame = bytes(self.wrap(memoryview(self.tx_buf)[:self.tx_buf_pos + 1]))
+            self.tx_buf_pos = 0
+
+            return frame
+
+    def transmit(self):
+        """Transmit the contents of the transmit buffer"""
+        with self.tx_lock:
+            if self.tx_buf_pos > 0:
+                # Terminate message
+                self.tx_buf[self.tx_buf_pos] = MSG.MSG_END
+                length = self.tx_buf_pos + 1
+
+                # Clear transmit buffer. The buffer itself is reused
+                self.tx_buf_pos = 0
+                
+                # Send over Serial
+                try:
+                    self._write_port(self.wrap(memoryview(self.tx_buf)[:length]))
+                except:
+                    raise Exception("Failed to write data to serial port")
+
+    def post(self, identifier, data=None):
+        """Queue a command for the next flush(). A queued command of the same message id is replaced,
+        so only the newest value is sent. Urgent commands (STOP, RESET) are sent immediately"""
+        with self.tx_lock:
+            if identifier in self.URGENT:
+                self.send_urgent(identifier, data)
+            else:
+                self.outbox[identifier] = data
+
+    def request(self, identifier, data=None, timeout=None, retries=None, callback=None):
+        """Post a command that the controller acknowledges and track it until its ACK or NACK arrives, see commands.py.
+        Returns the Command, which can be waited for or awaited"""
+        with self.tx_lock:
+            command = self.pending.add(identifier, data, timeout, retries, callback)
+            self.post(identifier, data)
+        return command
+
+    def send_urgent(self, identifier, data=None):
+        """Send a command in its own frame, ahead of everything in the outbox"""
+        with self.tx_lock:
+            # Drop queued commands that the urgent command supersedes
+            if identifier == MSG.RESET:
+                self.outbox.clear()
+                self.pending.drop()
+            elif identifier == MSG.STOP:
+                self.outbox.pop(MSG.START, None)
+                self.pending.drop(MSG.START)
+
+            length = self.schemas[identifier].encode_into(self.urgent_buf, 0, data)
+            self.urgent_buf[length] = MSG.MSG_END
+            TOKENS_OUT.inc()
             try:
-                self.ser.write(self.tx_buf[:self.tx_buf_pos + 1])
+                self._write_port(self.wrap(memoryview(self.urgent_buf)[:length + 1]))
             except:
                 raise Exception("Failed to write data to serial port")
-            
-            # Clear transmit buffer
-            self.tx_buf = bytearray(self.BUF_SIZE)
-            self.tx_buf_pos = 0
+            self.pending.sent(identifier)
+
+    def pack_outbox(self):
+        """Move queued commands into the transmit buffer.
+        Returns False if the buffer filled up before the outbox was empty"""
+        with self.tx_lock:
+            while self.outbox:
+                identifier = next(iter(self.outbox))
+                if not self.put_token(identifier, self.outbox[identifier]):
+                    if self.tx_buf_pos == 0:
+                        del self.outbox[identifier]
+                        raise ValueError("Token does not fit into the transmit buffer")
+                    return False
+                del self.outbox[identifier]
+                self.pending.sent(identifier)
+            return True
+
+    def flush(self):
+        """Transmit all queued commands together with the contents of the transmit buffer as one frame
+        (or several, if they do not fit into one)"""
+        with self.tx_lock:
+            while not self.pack_outbox():
+                self.transmit()
+            self.transmit()
     
     def msg_available(self):
-        return self.ser.in_waiting != 0
+        return self.rx.pending() != 0 or self.ser.in_waiting != 0
 
     def clear_input_buffer(self):
         self.ser.reset_input_buffer()
+        self.rx.clear()
+
+    def read_available(self, min_bytes=0):
+        """Read everything waiting on the serial port with a single read call.
+        With min_bytes > 0, block (up to the port timeout) until at least that many bytes arrived"""
+        n = max(self.ser.in_waiting, min_bytes)
+        if n == 0:
+            return 0
+
+        data = self.ser.read(n)
+        READS.inc()
+        BYTES_IN.inc(len(data))
+        READ_SIZE.observe(len(data))
+        if self.capture is not None and data:
+            self.capture.write(RX, data)
+        self.rx.feed(data)
+        return len(data)
+
+    def read_messages(self):
+        """Read all waiting bytes and yield every complete message received so far"""
+        self.read_available()
+        yield from self.rx.messages()
 
     def get_next_msg(self):
         """Get the next message from the serial port"""
-        # Check if data is available
-        if self.ser.in_waiting == 0:
-            self.rxm = RxMessage()
-            return self.rxm
-            
-        # Read prefix byte
-        prefix_bytes = self.ser.read(1)
-        if not prefix_bytes:
-            self.rxm = RxMessage()
-            return self.rxm
-            
-        prefix = prefix_bytes[0]
-        
-        # Extract message type and identifier
-        msg_type = (prefix >> 6) & 0b11
-        msg = prefix & 0b00111111
-        
-        # Update rx_message structure
-        self.rxm.msg = msg
-        self.rxm.msg_type = msg_type
-        
-        # Handle different message types
-        if msg_type == MSG_TYPE.MSG_FLAG:
-            self.rxm.size = 0
-        elif msg_type == MSG_TYPE.MSG_VARIABLE:
-            self.rxm.size = 4  # 32-bit value
-        elif msg_type == MSG_TYPE.MSG_CUSTOM:
-            size_bytes = self.ser.read(1)
-            if size_bytes:
-                self.rxm.size = size_bytes[0]
-            else:
-                self.rxm.size = 0
-        
+        rxm = self.rx.next_msg()
+
+        if rxm is None:
+            # Token not (completely) in the buffer yet. Read everything that is waiting,
+            # and wait for the rest of a token that was only partially received.
+            # The size of a custom token is only known once its size byte arrived, so this may take two reads.
+            missing = self.rx.missing()
+            while self.read_available(missing) >= missing:
+                rxm = self.rx.next_msg()
+                missing = self.rx.missing()
+                if rxm is not None or missing == 0:
+                    break
+
+        if rxm is None:
+            rxm = RxMessage()
+
+        self.rxm = rxm
         return self.rxm
     
     def get_payload(self, expected_type=None):
-        """Read and return the payload for the current message"""
-        if self.rxm.msg_type == MSG_TYPE.MSG_FLAG or self.rxm.size == 0:
-            return None
-
-        # Read the payload data
-        data = self.ser.read(self.rxm.size)
-        
-        # For variable messages, interpret as either int or float
-        if self.rxm.msg_type == MSG_TYPE.MSG_VARIABLE:
-            if expected_type == int:
-                return struct.unpack('<i', data)[0]
-            elif expected_type == float:
-                return struct.unpack('<f', data)[0]
-            else:
-                # Default to float for variable messages
-                return struct.unpack('<f', data)[0]
-        
-        # For custom messages, return bytes by default
-        if expected_type == int and self.rxm.size == 4:
-            return struct.unpack('<i', data)[0]
-        elif expected_type == float and self.rxm.size == 4:
-            return struct.unpack('<f', data)[0]
-        elif expected_type == str:
-            try:
-                return data.decode('utf-8')
-            except UnicodeDecodeError:
-                return data
-        
-        # Return raw bytes for custom messages with no expected type
-        return data
+        """Return the payload of the current message, decoded according to its schema.
+        Raises TypeError if expected_type is given and the value is not of this type"""
+        value = self.schemas.decode(self.rxm)
+        if expected_type is not None and not isinstance(value, expected_type):
+            raise TypeError(f"Payload of message {self.rxm.msg} is {type(value).__name__}, expected {expected_type.__name__}")
+        return value
     
     def close(self):
         """Close the serial connection"""
+        self.stop_capture()
         if self.ser and self.ser.is_open:
             self.ser.close()
\ No newline at end of file
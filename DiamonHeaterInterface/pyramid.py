@@ -0,0 +1,145 @@
+"""
+Multi-resolution min/max pyramid for plotting long records.
+Level 0 is the record itself, each higher level holds the minimum and maximum of two buckets of the
+level below. For a visible x-range the coarsest level that still has enough points for the pixel
+width of the plot is returned, so zooming in shows full detail and spikes are never averaged away.
+"""
+
+import numpy as np
+from record import ChunkedArray
+
+
+class RecordLevel:
+    """Level 0: the samples of the record, read from its ChunkedArray columns without copying"""
+
+    def __init__(self, x, channels):
+        self.x = x
+        self.channels = channels
+
+    @property
+    def n(self):
+        # Only samples present in all columns
+        return min(len(self.x), *(len(c) for c in self.channels))
+
+    def search(self, x, side):
+        return self.x.searchsorted(x, side)
+
+    def take(self, start, stop):
+        values = np.array([c.slice(start, stop) for c in self.channels])
+        return self.x.slice(start, stop), values, values
+
+
+class Level:
+    """Buckets of one higher pyramid level in ChunkedArray columns, so growing never copies the level.
+    x is the first x-value of each bucket"""
+
+    def __init__(self, channels, chunk_size, dtype):
+        self.x = ChunkedArray(np.float64, chunk_size)
+        self.lo = [ChunkedArray(dtype, chunk_size) for _ in range(channels)]
+        self.hi = [ChunkedArray(dtype, chunk_size) for _ in range(channels)]
+
+    @property
+    def n(self):
+        return len(self.x)
+
+    def extend(self, x, lo, hi):
+        self.x.extend(x)
+        for column, values in zip(self.lo, lo):
+            column.extend(values)
+        for column, values in zip(self.hi, hi):
+            column.extend(values)
+
+    def search(self, x, side):
+        return self.x.searchsorted(x, side)
+
+    def take(self, start, stop):
+        lo = np.array([c.slice(start, stop) for c in self.lo])
+        hi = np.array([c.slice(start, stop) for c in self.hi])
+        return self.x.slice(start, stop), lo, hi
+
+
+class MinMaxPyramid:
+    """Min/max pyramid over a record with increasing x (time), kept up to date with update().
+    x and every channel (e.g. temperature and setpoint) are ChunkedArray columns of the record."""
+
+    def __init__(self, x, channels, chunk_size=1024):
+        self.record = RecordLevel(x, channels)
+        self.chunk_size = chunk_size    # Smallest chunk size of the higher levels
+        self.clear()
+
+    def __len__(self):
+        return self.merged
+
+    def clear(self):
+        self.levels = [self.record]     # Level 0 followed by the higher levels
+        self.merged = 0                 # Samples of the record already merged into the higher levels
+
+    def _add_level(self):
+        channels = len(self.record.channels)
+        dtype = np.result_type(*(c.dtype for c in self.record.channels))
+        # Chunks halve from level to level like the number of buckets, down to chunk_size
+        k = len(self.levels)
+        level = Level(channels, max(self.record.x.chunk_size >> k, self.chunk_size), dtype)
+        self.levels.append(level)
+        return level
+
+    def update(self):
+        """Merge the samples appended to the record since the last update. Starts over if it was cleared"""
+        n = self.record.n
+        if n < self.merged:
+            self.clear()
+
+        # Old and new number of buckets per level. Completed pairs of buckets form the next level
+        old, new = self.merged, n
+        self.merged = n
+        k = 0
+        while new // 2 > old // 2:
+            if k + 1 == len(self.levels):
+                self._add_level()
+            x, lo, hi = self.levels[k].take(old - old % 2, new - new % 2)
+            self.levels[k + 1].extend(x[0::2],
+                                      np.minimum(lo[:, 0::2], lo[:, 1::2]),
+                                      np.maximum(hi[:, 0::2], hi[:, 1::2]))
+            old, new = old // 2, new // 2
+            k += 1
+
+    def x_range(self):
+        if self.merged == 0:
+            return 0.0, 0.0
+        return float(self.record.x[0]), float(self.record.x[self.merged - 1])
+
+    def query(self, x0, x1, max_points):
+        """Return x of shape (m,) and values of shape (channels, m) for the range [x0, x1],
+        with m at most about max_points. Buckets of higher levels contribute their min and max.
+        One bucket on either side of the range is included, so lines reach the edges of the plot"""
+        # Coarsest level needed: the finest one that fits into max_points
+        for k, level in enumerate(self.levels):
+            n = self.merged if k == 0 else level.n
+            i0 = min(max(level.search(x0, 'right') - 1, 0), n)
+            i1 = min(level.search(x1, 'right') + 1, n)
+            count = (i1 - i0) * (1 if k == 0 else 2)
+            if count <= max_points or k == len(self.levels) - 1:
+                break
+
+        parts = [level.take(i0, i1)]
+
+        # Range reaches the end of the record: the last samples are not merged into this level yet.
+        # They are the unpaired last bucket of each finer level, in order of time.
+        if i1 == n:
+            for j in range(k - 1, -1, -1):
+                finer = self.levels[j].n if j > 0 else self.merged
+                if finer % 2 == 1:
+                    parts.append(self.levels[j].take(finer - 1, finer))
+
+        x = np.concatenate([p[0] for p in parts])
+        lo = np.concatenate([p[1] for p in parts], axis=1)
+        hi = np.concatenate([p[2] for p in parts], axis=1)
+        if k == 0:
+            return x, lo
+
+        # Interleave minimum and maximum of every bucket, so spikes stay visible
+        x = np.repeat(x, 2)
+        values = np.empty((lo.shape[0], x.size), lo.dtype)
+        values[:, 0::2] = lo
+        values[:, 1::2] = hi
+        return x, values
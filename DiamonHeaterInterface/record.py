@@ -0,0 +1,105 @@
+"""
+Compact storage for the acquisition record.
+A ChunkedArray keeps one channel (e.g. temperature or timestamps) in fixed-size NumPy chunks. Appending
+never copies existing data, a full chunk is simply followed by a new one, and the filled part of every
+chunk is available as a view without copying.
+"""
+
+import numpy as np
+
+
+class ChunkedArray:
+    """Growable one-dimensional array made of NumPy chunks of chunk_size elements"""
+
+    def __init__(self, dtype=np.float64, chunk_size=65536):
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.n = 0          # Number of elements
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        for view in self.views():
+            yield from view
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("ChunkedArray index out of range")
+        return self.chunks[i // self.chunk_size][i % self.chunk_size]
+
+    def __array__(self, dtype=None, copy=None):
+        """Concatenation of all chunks. This copies, use views() to avoid it"""
+        data = np.concatenate(self.views()) if self.n else np.empty(0, self.dtype)
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+    @property
+    def nbytes(self):
+        return len(self.chunks) * self.chunk_size * self.dtype.itemsize
+
+    def append(self, value):
+        i = self.n % self.chunk_size
+        if i == 0 and self.n // self.chunk_size == len(self.chunks):
+            self.chunks.append(np.empty(self.chunk_size, self.dtype))
+        self.chunks[-1][i] = value
+        self.n += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        pos = 0
+        while pos < values.size:
+            i = self.n % self.chunk_size
+            if i == 0 and self.n // self.chunk_size == len(self.chunks):
+                self.chunks.append(np.empty(self.chunk_size, self.dtype))
+            count = min(self.chunk_size - i, values.size - pos)
+            self.chunks[-1][i:i + count] = values[pos:pos + count]
+            self.n += count
+            pos += count
+
+    def clear(self):
+        self.chunks = []
+        self.n = 0
+
+    def views(self):
+        """Views of the filled part of every chunk, oldest first"""
+        full, rest = divmod(self.n, self.chunk_size)
+        views = self.chunks[:full]
+        if rest:
+            views.append(self.chunks[full][:rest])
+        return views
+
+    def slice(self, start, stop):
+        """Elements start to stop as one array. Zero-copy if the range lies within one chunk"""
+        start = max(start, 0)
+        stop = min(stop, self.n)
+        if start >= stop:
+            return np.empty(0, self.dtype)
+
+        parts = []
+        while start < stop:
+            k, i = divmod(start, self.chunk_size)
+            count = min(self.chunk_size - i, stop - start)
+            parts.append(self.chunks[k][i:i + count])
+            start += count
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def searchsorted(self, value, side='left'):
+        """Like numpy.searchsorted for ascending data, e.g. timestamps"""
+        # Bisect for the first chunk ending after value, then search within it
+        count = -(-self.n // self.chunk_size)
+        lo, hi = 0, count
+        while lo < hi:
+            k = (lo + hi) // 2
+            last = self.chunks[k][min(self.chunk_size, self.n - k*self.chunk_size) - 1]
+            if value < last or (side == 'left' and value == last):
+                hi = k
+            else:
+                lo = k + 1
+        if lo == count:
+            return self.n
+
+        view = self.chunks[lo][:min(self.chunk_size, self.n - lo*self.chunk_size)]
+        return lo * self.chunk_size + int(np.searchsorted(view, value, side))
@@ -0,0 +1,186 @@
+"""
+Continuous recording of the acquisition record.
+A recorder thread appends the rows added to the record of a device to a session file while the
+acquisition runs. Rows are written in batches every flush_interval, synced to disk every fsync_interval
+and a new file is started after max_rows rows, so long runs are on disk without ever blocking the GUI.
+CsvRecorder writes CSV files, SessionRecorder binary session files (see session.py).
+"""
+
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+from export import BLOCK_ROWS, CSV_HEADER, format_block, record_block, record_length
+from session import SessionWriter, RECORD
+
+
+class Recorder:
+    """Streams the record of a device to files prefix.ext, prefix_2.ext, ... Subclasses implement the file format.
+    Rows are the temperature data points with the current as of their timestamps, see export.py.
+
+    The record must only grow while recording. To clear it, stop the recorder first.
+    """
+
+    extension = ""
+
+    def __init__(self, device, prefix, flush_interval=1.0, fsync_interval=10.0, max_rows=1000000):
+        self.device = device
+        self.prefix = prefix
+        self.flush_interval = flush_interval    # Seconds between writes
+        self.fsync_interval = fsync_interval    # Seconds between syncs to disk
+        self.max_rows = max_rows                # Rows per file before starting the next one
+
+        self.files = []         # Names of all files of this session, the last one is being written
+        self.rows = 0           # Rows of the record written so far
+        self.error = None       # Exception that stopped the recorder
+        self.finished = deque() # Files finished by rotate() and closed, not drained yet
+
+        self._file = None
+        self._file_rows = 0
+        self._t_sync = 0.0
+        self._rotate = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    @property
+    def filename(self):
+        return self.files[-1] if self.files else None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._open()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write the remaining rows and close the file"""
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def rotate(self):
+        """Finish the current file with all rows recorded so far and continue in a new one.
+        Returns the name of the file to finish. It is finished by the recorder thread and appears in
+        drain_finished() once it was closed, or self.error is set if this failed"""
+        filename = self.filename
+        self._rotate = True
+        self._wake.set()
+        return filename
+
+    def drain_finished(self):
+        """Names of the files finished by rotate() since the last call"""
+        files = []
+        while self.finished:
+            files.append(self.finished.popleft())
+        return files
+
+    # File format
+    def _open_file(self, name):
+        """Create the file, returns the file object"""
+        raise NotImplementedError
+
+    def _write_block(self, block):
+        raise NotImplementedError
+
+    def _finish_file(self):
+        """Write what the format needs at the end of a file, before it is synced to disk"""
+        pass
+
+    def _open(self):
+        name = f"{self.prefix}{self.extension}" if not self.files else f"{self.prefix}_{len(self.files) + 1}{self.extension}"
+        self._file = self._open_file(name)
+        self._file_rows = 0
+        self._t_sync = time.monotonic()
+        self.files.append(name)
+
+    def _close(self):
+        self._finish_file()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def _write(self):
+        stop = record_length(self.device)
+        while self.rows < stop:
+            if self._file_rows >= self.max_rows:
+                self._close()
+                self._open()
+
+            end = min(stop, self.rows + self.max_rows - self._file_rows, self.rows + BLOCK_ROWS)
+            self._write_block(record_block(self.device, self.rows, end))
+            self._file_rows += end - self.rows
+            self.rows = end
+
+        self._file.flush()
+        now = time.monotonic()
+        if now - self._t_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._t_sync = now
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self._write()
+
+                if self._rotate:
+                    self._rotate = False
+                    filename = self.filename
+                    self._close()
+                    self.finished.append(filename)
+                    self._open()
+
+            self._write()
+            self._close()
+        except Exception as e:
+            # Disk full or file removed. Reported to the GUI through self.error
+            self.error = e
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+
+
+class CsvRecorder(Recorder):
+    """Records to CSV files in the layout of the Save button"""
+
+    extension = ".csv"
+
+    def _open_file(self, name):
+        file = open(name, mode='w', newline='')
+        file.write(",".join(CSV_HEADER) + "\r\n")
+        return file
+
+    def _write_block(self, block):
+        self._file.write(format_block(block))
+
+
+class SessionRecorder(Recorder):
+    """Records to binary session files"""
+
+    extension = ".dhs"
+
+    def _open_file(self, name):
+        return SessionWriter(name, created=time.time())
+
+    def _write_block(self, block):
+        records = np.empty(len(block['timestamp']), RECORD)
+        for name in RECORD.names:
+            records[name] = block[name]
+        self._file.append(records)
+
+    def _finish_file(self):
+        self._file.finish()
@@ -0,0 +1,212 @@
+"""
+Binary session format.
+A session file holds fixed-width little-endian records of the temperature, setpoint, current and status
+channels. It is written append-only in chunks and read back with numpy.memmap, so opening a multi-GB
+session does not read it. Convert to the CSV layout of the Save button with:
+
+    python session.py SESSION [CSV] [--rate HZ]
+
+Layout:
+    file header     magic, version, record size, rows per chunk, creation time
+    chunk           chunk header (magic, rows, first and last timestamp) followed by the records
+    ...
+    chunk index     offset, rows, first and last timestamp of every chunk
+    trailer         offset of the chunk index, index magic
+
+The chunk index and trailer are written when the session is closed. Without them (crash), the chunks
+are found by following the chunk headers.
+"""
+
+import argparse
+import os
+from struct import Struct
+import numpy as np
+from export import resample, write_csv
+
+MAGIC = b'DHSESS\r\n'
+VERSION = 1
+
+# One record per temperature data point with the status at that time and the current as of its timestamp
+RECORD = np.dtype([('temperature', '<f4'), ('setpoint', '<f4'), ('timestamp', '<f8'),
+                   ('current', '<f4'), ('status', '<i4'), ('current_timestamp', '<f8')])
+
+FILE_HEADER  = Struct('<8sHHId')   # magic, version, record size, rows per chunk, creation time
+CHUNK_HEADER = Struct('<4sIdd')    # magic, rows, first timestamp, last timestamp
+CHUNK_MAGIC  = b'CHNK'
+TRAILER      = Struct('<Q8s')      # offset of the chunk index, index magic
+INDEX_MAGIC  = b'DHINDEX\n'
+INDEX_ENTRY  = np.dtype([('offset', '<u8'), ('rows', '<u8'), ('t_first', '<f8'), ('t_last', '<f8')])
+
+
+class SessionWriter:
+    """Appends records to a session file. The rows of the last chunk are updated on every flush(),
+    so a crashed session can be read up to the last flush"""
+
+    def __init__(self, filename, chunk_rows=65536, created=0.0):
+        self.filename = filename
+        self.chunk_rows = chunk_rows
+        self.index = []         # Chunk index entries (offset, rows, t_first, t_last)
+        self.finished = False   # Chunk index and trailer written
+
+        self.file = open(filename, 'wb')
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, RECORD.itemsize, chunk_rows, created))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return sum(entry[1] for entry in self.index)
+
+    def append(self, records):
+        """Append a structured array of RECORD"""
+        if self.finished:
+            raise ValueError("Session file is already finished")
+        pos = 0
+        while pos < len(records):
+            if not self.index or self.index[-1][1] == self.chunk_rows:
+                self._write_chunk_header()
+                self.index.append([self.file.tell(), 0, 0.0, 0.0])
+
+            entry = self.index[-1]
+            count = min(self.chunk_rows - entry[1], len(records) - pos)
+            part = records[pos:pos + count]
+            self.file.write(part.tobytes())
+
+            if entry[1] == 0:
+                entry[2] = part['timestamp'][0]
+            entry[3] = part['timestamp'][-1]
+            entry[1] += count
+            pos += count
+
+    def _write_chunk_header(self):
+        if self.index:
+            self._update_chunk_header()
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, 0, 0.0, 0.0))
+
+    def _update_chunk_header(self):
+        offset, rows, t_first, t_last = self.index[-1]
+        end = self.file.tell()
+        self.file.seek(offset - CHUNK_HEADER.size)
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, rows, t_first, t_last))
+        self.file.seek(end)
+
+    def flush(self):
+        if self.index:
+            self._update_chunk_header()
+        self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def finish(self):
+        """Write the chunk index and trailer. Nothing can be appended afterwards"""
+        if self.finished:
+            return
+
+        self.flush()
+        offset = self.file.tell()
+        self.file.write(np.array([tuple(entry) for entry in self.index], dtype=INDEX_ENTRY).tobytes())
+        self.file.write(TRAILER.pack(offset, INDEX_MAGIC))
+        self.file.flush()
+        self.finished = True
+
+    def close(self):
+        """Write the chunk index and close the file"""
+        if self.file.closed:
+            return
+
+        self.finish()
+        self.file.close()
+
+
+class Session:
+    """Read-only session file. Chunks are views into one memory map of the file"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        size = os.path.getsize(filename)
+        if size < FILE_HEADER.size:
+            raise ValueError(f"{filename} is not a session file")
+
+        self.map = np.memmap(filename, dtype=np.uint8, mode='r')
+        magic, self.version, record_size, self.chunk_rows, self.created = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a session file")
+        if self.version != VERSION or record_size != RECORD.itemsize:
+            raise ValueError(f"Unsupported session file version {self.version}")
+
+        self.index = self._read_index(size)
+        self.chunks = [self.map[offset:offset + rows*RECORD.itemsize].view(RECORD)
+                       for offset, rows, _, _ in self.index.tolist()]
+
+    def _read_index(self, size):
+        if size >= FILE_HEADER.size + TRAILER.size:
+            offset, magic = TRAILER.unpack_from(self.map, size - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                return self.map[offset:size - TRAILER.size].view(INDEX_ENTRY)
+
+        # Not closed: follow the chunk headers
+        entries = []
+        pos = FILE_HEADER.size
+        while pos + CHUNK_HEADER.size <= size:
+            magic, rows, t_first, t_last = CHUNK_HEADER.unpack_from(self.map, pos)
+            if magic != CHUNK_MAGIC:
+                break
+            pos += CHUNK_HEADER.size
+            rows = min(rows, (size - pos) // RECORD.itemsize)
+            entries.append((pos, rows, t_first, t_last))
+            pos += rows * RECORD.itemsize
+        return np.array(entries, dtype=INDEX_ENTRY)
+
+    def __len__(self):
+        return int(self.index['rows'].sum())
+
+    def __getitem__(self, field):
+        """All values of one field. This copies, iterate over chunks to avoid it"""
+        if not self.chunks:
+            return np.empty(0, RECORD[field])
+        return np.concatenate([chunk[field] for chunk in self.chunks])
+
+    def select(self, t0, t1):
+        """Records with a timestamp from t0 to t1. Only the chunks overlapping the range are read"""
+        parts = []
+        for chunk, (t_first, t_last) in zip(self.chunks, self.index[['t_first', 't_last']].tolist()):
+            if t_last < t0 or t_first > t1:
+                continue
+            t = chunk['timestamp']
+            parts.append(chunk[np.searchsorted(t, t0, 'left'):np.searchsorted(t, t1, 'right')])
+        return np.concatenate(parts) if parts else np.empty(0, RECORD)
+
+    def to_csv(self, filename, rate=None):
+        """Write the session in the CSV layout of the Save button. With a rate, resampled like export.resample()"""
+        if rate is None:
+            blocks = self.chunks
+        else:
+            # Current samples are repeated in every record until the next one, keep each sample once
+            t_current, i = np.unique(self['current_timestamp'], return_index=True)
+            valid = ~np.isnan(t_current)
+            blocks = resample(self['timestamp'], self['temperature'], self['setpoint'],
+                              t_current[valid], self['current'][i[valid]], rate)
+
+        with open(filename, mode='w', newline='') as file:
+            write_csv(file, blocks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a diamond heater session file to CSV")
+    parser.add_argument("session", help="session file")
+    parser.add_argument("csv", nargs="?", help="output file (default: session name with .csv)")
+    parser.add_argument("--rate", type=float, default=None, help="resample to this many rows per second")
+    args = parser.parse_args()
+
+    output = args.csv or os.path.splitext(args.session)[0] + ".csv"
+    session = Session(args.session)
+    session.to_csv(output, args.rate)
+    print(f"Wrote {len(session)} rows to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Virtual heater controller for testing without hardware.
+VirtualHeater speaks the pycomm protocol of the Teensy firmware and runs a first-order thermal plant
+under PID control. PtyHeater serves it on a Linux pseudo terminal, so heater.py and Comm can connect
+to it like to a real board, e.g.:
+
+    python simulator.py --rate 1000
+"""
+
+import argparse
+import os
+import select
+import threading
+import time
+import tty
+from pycomm import MSG, RxDecoder, FramedDecoder, frame_batch, schemas, FRAME_MAX_LENGTH
+import config as cfg
+
+# Status bits as transmitted in MSG.STATUS
+STATUS_ACTIVE = 0b1
+STATUS_OT     = 0b10
+STATUS_OC     = 0b100
+STATUS_FAULT  = 0b1000
+
+
+class VirtualHeater:
+    """Protocol and plant model of the heater controller, independent of the transport.
+
+    receive() takes the bytes sent by the host, step() advances the simulation and returns the
+    next batch of tokens (terminated by MSG_END) to send back.
+    """
+
+    WATCHDOG_TIMEOUT = 5.0  # Controller resets if the host does not send an ACK for this long
+
+    def __init__(self, samples_per_batch=1, error_interval=None, registry=schemas, framed=False):
+        self.framed = framed                        # Wrap batches into frames with sync marker and CRC
+        self.rx = FramedDecoder() if framed else RxDecoder()
+        self.schemas = registry
+        self.samples_per_batch = samples_per_batch  # T_ACTUAL/CURRENT samples per batch
+        self.error_interval = error_interval        # Send an ERROR_MSG every error_interval seconds (None: never)
+
+        # Thermal plant: C dT/dt = R I^2 - k (T - T_ambient)
+        self.T_ambient = 22.0       # °C
+        self.heat_capacity = 2.0    # J/K
+        self.loss = 0.05            # W/K
+        self.resistance = 2.0       # Ohm
+        self.I_max = 3.0            # A, current limit of the driver
+        self.I_trip = 3.5           # A, over-current threshold
+        self.T_trip = cfg.T_max + 20.0  # °C, over-temperature threshold
+
+        # PID gains
+        self.P = cfg.P_default
+        self.I = cfg.I_default
+        self.D = cfg.D_default
+
+        self.replies = []           # Tokens to send with the next batch
+        self.reset(time.monotonic())
+
+    def reset(self, now):
+        self.active = False
+        self.status = 0
+        self.setpoint = 0.0
+        self.T = self.T_ambient
+        self.current = 0.0
+        self.integral = 0.0
+        self.error_prev = 0.0
+        self.t_last = now
+        self.t_ack = now
+        self.t_error = now
+
+    def receive(self, data, now):
+        """Process bytes sent by the host"""
+        self.rx.feed(data)
+        for rxm in self.rx.messages():
+            msg = rxm.msg
+            if msg == MSG.ACK:
+                self.t_ack = now
+            elif msg == MSG.RESET:
+                self.reset(now)
+            elif msg == MSG.START:
+                if self.status & (STATUS_OT | STATUS_OC | STATUS_FAULT):
+                    self.reply_nack(MSG.START)
+                else:
+                    self.active = True
+                    self.integral = 0.0
+                    self.reply_ack(MSG.START)
+            elif msg == MSG.STOP:
+                self.active = False
+                self.reply_ack(MSG.STOP)
+            elif msg == MSG.T_SETPOINT:
+                value = self.schemas.decode(rxm)
+                if cfg.T_min <= value <= cfg.T_max:
+                    self.setpoint = value
+                    self.reply_ack(MSG.T_SETPOINT)
+                else:
+                    self.reply_nack(MSG.T_SETPOINT)
+            elif msg == MSG.PID_P:
+                self.P = self.schemas.decode(rxm)
+            elif msg == MSG.PID_I:
+                self.I = self.schemas.decode(rxm)
+            elif msg == MSG.PID_D:
+                self.D = self.schemas.decode(rxm)
+
+    # ACK/NACK is followed by the id of the acknowledged command as a flag token
+    def reply_ack(self, cmd):
+        self.replies.append(bytes([MSG.ACK, cmd]))
+
+    def reply_nack(self, cmd):
+        self.replies.append(bytes([MSG.NACK, cmd]))
+
+    def advance(self, now):
+        """Integrate the plant and run the PID controller up to now"""
+        dt = now - self.t_last
+        self.t_last = now
+        if dt <= 0:
+            return
+
+        if self.active:
+            error = self.setpoint - self.T
+            self.integral += error * dt
+            derivative = (error - self.error_prev) / dt
+            self.error_prev = error
+            self.current = min(max(self.P*error + self.I*self.integral + self.D*derivative, 0.0), self.I_max)
+        else:
+            self.current = 0.0
+
+        self.T += dt * (self.resistance*self.current**2 - self.loss*(self.T - self.T_ambient)) / self.heat_capacity
+
+        # Protection
+        if self.T > self.T_trip:
+            self.status |= STATUS_OT
+        if self.current > self.I_trip:
+            self.status |= STATUS_OC
+        if self.status & (STATUS_OT | STATUS_OC):
+            self.active = False
+
+        if self.active:
+            self.status |= STATUS_ACTIVE
+        else:
+            self.status &= ~STATUS_ACTIVE
+
+    def step(self, now):
+        """Advance the simulation to now and return the next batch of tokens"""
+        tokens = self.replies
+        self.replies = []
+
+        # Watchdog: host stopped acknowledging, reset the controller
+        if now - self.t_ack > self.WATCHDOG_TIMEOUT:
+            self.reset(now)
+            tokens.append(self.schemas[MSG.ERROR_MSG].encode("Watchdog timeout"))
+            tokens.append(self.schemas[MSG.RESET].encode())
+
+        t_prev = self.t_last
+        for i in range(self.samples_per_batch):
+            self.advance(t_prev + (now - t_prev) * (i + 1) / self.samples_per_batch)
+            tokens.append(self.schemas[MSG.T_ACTUAL].encode(self.T))
+            tokens.append(self.schemas[MSG.CURRENT].encode(self.current))
+        tokens.append(self.schemas[MSG.STATUS].encode(self.status))
+
+        if self.error_interval is not None and now - self.t_error >= self.error_interval:
+            self.t_error = now
+            tokens.append(self.schemas[MSG.ERROR_MSG].encode(f"Simulated error at T = {self.T:.1f}"))
+
+        if self.framed:
+            return self.frame_tokens(tokens)
+
+        tokens.append(self.schemas[MSG.MSG_END].encode())
+        return b''.join(tokens)
+
+    def frame_tokens(self, tokens):
+        """Split the tokens into frames that fit the transmit buffer, like the firmware sends a full buffer"""
+        end = self.schemas[MSG.MSG_END].encode()
+        frames = []
+        batch = bytearray()
+        for token in tokens:
+            if batch and len(batch) + len(token) + len(end) > FRAME_MAX_LENGTH:
+                frames.append(frame_batch(batch + end))
+                batch = bytearray()
+            batch += token
+        frames.append(frame_batch(batch + end))
+        return b''.join(frames)
+
+
+class PtyHeater:
+    """Serves a VirtualHeater on a pseudo terminal (Linux/macOS only).
+    Connect Comm to the path in self.port."""
+
+    MAX_UNWRITTEN = 65536   # Bytes kept while the host does not read, later batches are dropped
+
+    def __init__(self, rate=10.0, samples_per_batch=1, error_interval=None, framed=False):
+        self.rate = rate    # Batches per second
+        self.heater = VirtualHeater(samples_per_batch=samples_per_batch, error_interval=error_interval, framed=framed)
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+        self.batches = 0    # Number of batches sent
+        self.dropped = 0    # Batches dropped because the host did not read
+        self._unwritten = bytearray()   # Tail of the batches the pty did not accept yet
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="PtyHeater", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _write(self):
+        """Write as much of the unwritten data as the pty accepts"""
+        try:
+            n = os.write(self.master, self._unwritten)
+        except BlockingIOError:
+            return
+        del self._unwritten[:n]
+
+    def _run(self):
+        period = 1.0 / self.rate
+        t_next = time.monotonic()
+
+        while not self._stop.is_set():
+            # Receive host data until the next batch is due, write the rest of the previous batches when possible
+            timeout = max(t_next - time.monotonic(), 0.0)
+            readable, writable, _ = select.select([self.master], [self.master] if self._unwritten else [], [], timeout)
+            now = time.monotonic()
+            if readable:
+                try:
+                    self.heater.receive(os.read(self.master, 4096), now)
+                except BlockingIOError:
+                    pass
+            if writable:
+                self._write()
+
+            if now < t_next:
+                continue
+
+            batch = self.heater.step(now)
+            if len(self._unwritten) + len(batch) > self.MAX_UNWRITTEN:
+                self.dropped += 1   # Host is not reading, drop the whole batch like a full USB buffer would
+            else:
+                self._unwritten += batch
+                self._write()
+            self.batches += 1
+
+            # Catch up without bursting when the host or the scheduler fell behind
+            t_next = max(t_next + period, now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual diamond heater controller on a pseudo terminal")
+    parser.add_argument("--rate", type=float, default=10.0, help="batches per second")
+    parser.add_argument("--batch", type=int, default=1, help="temperature/current samples per batch")
+    parser.add_argument("--error-interval", type=float, default=None, help="send an ERROR_MSG every N seconds")
+    parser.add_argument("--framed", action="store_true", help="wrap batches with sync marker and CRC")
+    args = parser.parse_args()
+
+    sim = PtyHeater(rate=args.rate, samples_per_batch=args.batch, error_interval=args.error_interval, framed=args.framed)
+    sim.start()
+    print(f"Virtual heater running on {sim.port}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.close()
+
+
+if __name__ == "__main__":
+    main()
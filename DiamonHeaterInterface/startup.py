@@ -0,0 +1,42 @@
+"""
+Startup instrumentation.
+The GUI marks the phases of its startup (imports, viewport, widgets, first frame, deferred fonts and
+textures) with the time since this module was imported, which __main__.py does first. With
+--startup-profile or the environment variable DH_STARTUP_PROFILE=1 the phases are printed once startup
+is complete. Time spent by the PyInstaller bootloader before Python starts is not included.
+"""
+
+import os
+import sys
+import time
+
+
+class StartupTimer:
+    """Time of named startup phases, relative to the creation of the timer"""
+
+    def __init__(self, enabled=False):
+        self.t_start = time.perf_counter()
+        self.enabled = enabled
+        self.phases = []        # (name, seconds since start) in order of marking
+
+    def mark(self, name):
+        self.phases.append((name, time.perf_counter() - self.t_start))
+
+    def elapsed(self, name):
+        """Seconds from start to the end of a phase, None if it was not marked"""
+        for phase, t in self.phases:
+            if phase == name:
+                return t
+        return None
+
+    def report(self, file=None):
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        previous = 0.0
+        for name, t in self.phases:
+            print(f"{name:<24}{(t - previous)*1e3:8.1f} ms{t*1e3:10.1f} ms", file=file)
+            previous = t
+
+
+timer = StartupTimer(enabled=os.environ.get("DH_STARTUP_PROFILE", "") not in ("", "0"))
@@ -0,0 +1,145 @@
+"""
+Timebase for timestamping received samples.
+Timebase reads the monotonic clock and adds an offset to wall-clock time that is sampled by sync(), instead
+of asking the wall clock and time zone database for every timestamp. Timestamps are cheap and strictly
+increasing. The DeviceManager syncs its clock every cfg.clock_sync_interval seconds, so timestamps follow
+adjustments of the system clock and daylight saving time changes with that delay. Steps forward are applied
+at once, steps back are slewed, so stored timestamps never go backwards.
+TickClock maps a tick counter of the controller to host time with drift correction.
+"""
+
+import time
+from collections import deque
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+
+class Timebase:
+    """Clock returning seconds since the epoch from time.monotonic_ns().
+
+    With a time zone, timestamps are shifted by its UTC offset at the time of the last sync, so the time
+    axis of the plot shows local time. The offset is only updated by sync(), which the DeviceManager calls
+    periodically. When the offset decreases (wall clock set back, end of daylight saving time), timestamps
+    advance at 1 - slew_rate of real time until they caught up, instead of jumping back.
+    """
+
+    def __init__(self, timezone=None, slew_rate=0.5):
+        self.timezone = ZoneInfo(timezone) if timezone else None
+        self.slew_rate = slew_rate      # Decrease of the offset per elapsed second while slewing, below 1
+        self.offset_ns = None           # Offset at the last sync, reached at _slew_end
+        self._slew_from = 0             # Offset at the start of the slew
+        self._slew_start = 0            # Monotonic time of the start of the slew
+        self._slew_end = 0              # Monotonic time at which the offset reaches offset_ns
+        self.sync()
+
+    def _offset_at(self, t):
+        if t >= self._slew_end:
+            return self.offset_ns
+        return self._slew_from - int((t - self._slew_start) * self.slew_rate)
+
+    def sync(self):
+        """Sample the offset between the monotonic clock and wall-clock time. Returns the change in seconds"""
+        previous = self.offset_ns
+
+        # Take the wall clock between two monotonic readings, assume it was read halfway
+        t0 = time.monotonic_ns()
+        wall = time.time_ns()
+        t1 = time.monotonic_ns()
+        offset = wall - (t0 + t1) // 2
+        if self.timezone is not None:
+            offset += int(datetime.now(self.timezone).utcoffset().total_seconds()) * 1_000_000_000
+
+        if previous is not None:
+            current = self._offset_at(t1)
+            if offset < current:
+                # Slew down to the new offset from where the timestamps are now
+                self._slew_from = current
+                self._slew_start = t1
+                self._slew_end = t1 + int((current - offset) / self.slew_rate)
+            else:
+                self._slew_end = 0
+
+        self.offset_ns = offset
+        return 0.0 if previous is None else (offset - previous) * 1e-9
+
+    @property
+    def offset(self):
+        """Offset in seconds applied to the monotonic clock now"""
+        return self._offset_at(time.monotonic_ns()) * 1e-9
+
+    def __call__(self):
+        t = time.monotonic_ns()
+        if t >= self._slew_end:
+            return (t + self.offset_ns) * 1e-9
+        return (t + self._offset_at(t)) * 1e-9
+
+    def now_ns(self):
+        t = time.monotonic_ns()
+        return t + self._offset_at(t)
+
+
+class TickClock:
+    """Maps a tick counter of the controller to host time.
+
+    Each observation pairs a tick count with the host time it was received. Transmission only ever delays,
+    so the mapping follows the lower envelope of host time - tick time: observations are grouped into
+    windows, the earliest one of each window is kept, and a line through the kept points gives the offset
+    and the actual tick period (drift of the controller crystal).
+    """
+
+    def __init__(self, tick_rate, window=64, history=16, bits=32):
+        self.period = 1.0 / tick_rate   # Seconds per tick, corrected for drift
+        self.window = window            # Observations per window
+        self.wrap = 1 << bits           # Counter range, for unwrapping
+
+        self._minima = deque(maxlen=history)    # (ticks, host time) with the lowest delay of each window
+        self._best = None                       # Lowest delay observation of the current window
+        self._count = 0
+        self._ticks = None                      # Last unwrapped tick count
+        self._offset = None                     # Host time at tick 0
+
+    def unwrap(self, ticks):
+        if self._ticks is None:
+            self._ticks = ticks
+            return ticks
+        self._ticks += (ticks - self._ticks) % self.wrap
+        return self._ticks
+
+    def observe(self, ticks, host_time):
+        """Add an observation and return the host time of the tick count"""
+        ticks = self.unwrap(ticks)
+        delay = host_time - ticks * self.period
+        if self._best is None or delay < self._best[1] - self._best[0] * self.period:
+            self._best = (ticks, host_time)
+            if self._offset is None or delay < self._offset:
+                self._offset = delay
+
+        self._count += 1
+        if self._count == self.window:
+            self._minima.append(self._best)
+            self._best = None
+            self._count = 0
+            self._fit()
+
+        return self._offset + ticks * self.period
+
+    def _fit(self):
+        if len(self._minima) < 2:
+            self._offset = self._minima[-1][1] - self._minima[-1][0] * self.period
+            return
+
+        import numpy as np  # Not imported at startup, only needed for the fit
+
+        ticks, host = np.array(self._minima).T
+        period, offset = np.polyfit(ticks - ticks[0], host, 1)
+        self.period = period
+        self._offset = offset - ticks[0] * period
+
+        # The fitted line runs through the middle of the minima, move it down onto the lowest one
+        self._offset += min(host - (self._offset + ticks * period))
+
+    def to_host(self, ticks):
+        """Host time of a tick count near the last observation, without adding an observation"""
+        half = self.wrap // 2
+        ticks = self._ticks + (ticks - self._ticks + half) % self.wrap - half
+        return self._offset + ticks * self.period
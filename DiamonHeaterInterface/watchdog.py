@@ -0,0 +1,97 @@
+"""
+Keep-alive of the controller watchdog.
+The controller resets if it receives no ACK for five seconds. Besides the ACK sent after every received batch,
+Watchdog sends an ACK to every open device at a fixed period from its own thread, so the controller is kept
+alive whatever the GUI, the I/O thread or the data stream are doing. Devices are fed one after another, so each
+keep-alive is bounded: a device whose transmit buffer stays busy for write_timeout seconds is skipped for this
+tick and the port fails writes after cfg.write_timeout, so one hung port can not starve the other boards. Ports
+the I/O thread stopped servicing after a failure are skipped. The lateness of every tick of the scheduler and
+the time between consecutive ACKs of a device are recorded in the metrics. When the time between two ACKs
+leaves less than margin seconds to the controller timeout, an alarm is queued for the thread processing the
+samples, see drain_alarms().
+"""
+
+import threading
+import time
+from collections import deque
+from metrics import metrics
+
+JITTER   = metrics.histogram("watchdog.jitter", "s")        # Lateness of the ticks of the keep-alive scheduler
+SENT     = metrics.counter("watchdog.keepalives")
+FAILURES = metrics.counter("watchdog.failures")             # Keep-alive ACKs that could not be written
+ALARMS   = metrics.counter("watchdog.alarms")
+
+
+class Watchdog:
+    """Sends an ACK to each open device of devices every period seconds in a background thread"""
+
+    def __init__(self, devices, period=0.5, timeout=5.0, margin=2.5, write_timeout=0.1):
+        self.devices = devices          # Iterable of Device, e.g. a DeviceManager
+        self.period = period
+        self.timeout = timeout          # Controller resets after this many seconds without ACK
+        self.margin = margin            # Raise an alarm when less time than this was left to the timeout
+        self.write_timeout = write_timeout  # Longest wait for the transmit buffer of a device
+
+        self.alarms = deque(maxlen=100) # (device, message) of alarms not drained yet
+        self._thread = None
+        self._stop = threading.Event()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="Watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def drain_alarms(self):
+        """Alarms raised since the last call, as a list of (device, message)"""
+        alarms = []
+        while self.alarms:
+            alarms.append(self.alarms.popleft())
+        return alarms
+
+    def tick(self):
+        """Send an ACK to every open device and check the time since the previous ACK"""
+        is_serviced = getattr(self.devices, "is_serviced", None)
+        for device in self.devices:
+            if not device.is_open():
+                continue
+            if is_serviced is not None and not is_serviced(device):
+                continue    # Port failed, the I/O thread stopped reading it
+
+            try:
+                device.feed_watchdog(self.write_timeout)
+                SENT.inc()
+            except Exception:
+                # Port busy, closed or unplugged, handled by the I/O thread
+                FAILURES.inc()
+
+            gap = device.take_ack_gap()
+            if gap > self.timeout - self.margin:
+                ALARMS.inc()
+                self.alarms.append((device, f"Watchdog ACK delayed by {gap:.1f} s, "
+                                            f"{max(self.timeout - gap, 0.0):.1f} s before the controller resets"))
+
+    def _run(self):
+        deadline = time.perf_counter() + self.period
+        while not self._stop.wait(max(deadline - time.perf_counter(), 0.0)):
+            now = time.perf_counter()
+            JITTER.observe(now - deadline)
+            self.tick()
+
+            # Skip the ticks missed while the thread was not scheduled
+            deadline += self.period
+            if deadline < now:
+                deadline = now + self.period
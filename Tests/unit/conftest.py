@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of the application import each other as top-level modules, like in __main__.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "DiamonHeaterInterface"))
@@ -0,0 +1,50 @@
+import threading
+import time
+from acquisition import SampleRing
+
+
+def test_drain_order_across_wraparound():
+    ring = SampleRing(8)
+    expected = []
+    for n in (5, 6, 8, 3, 7):
+        values = list(range(len(expected), len(expected) + n))
+        for value in values:
+            assert ring.push(value)
+        assert len(ring) == n
+        assert ring.drain() == values
+        expected += values
+    assert ring.drain() == []
+    assert ring.overruns == 0
+
+
+def test_full_ring_drops_newest():
+    ring = SampleRing(4)
+    assert all(ring.push(i) for i in range(4))
+    assert not ring.push(4)
+    assert not ring.push(5)
+    assert ring.overruns == 2
+    assert ring.drain() == [0, 1, 2, 3]
+    assert ring.push(6)
+    assert ring.drain() == [6]
+
+
+def test_single_producer_single_consumer():
+    ring = SampleRing(64)
+    n = 20000
+    received = []
+
+    def produce():
+        i = 0
+        while i < n:
+            if ring.push(i):
+                i += 1
+            else:
+                time.sleep(0)   # Ring full, let the consumer run
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    while len(received) < n:
+        received += ring.drain()
+        time.sleep(0)
+    producer.join()
+    assert received == list(range(n))
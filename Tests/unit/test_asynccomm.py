@@ -0,0 +1,93 @@
+import asyncio
+import os
+import tty
+import pytest
+from asynccomm import AsyncComm
+from commands import Outcome
+from pycomm import MSG, schemas
+
+simulator = pytest.importorskip("simulator")
+pytestmark = pytest.mark.skipif(not hasattr(simulator.os, "openpty"), reason="needs a pseudo terminal")
+
+
+def run_request(heater, msg, data=None, timeout=0.5, retries=2):
+    async def main():
+        comm = AsyncComm()
+        await comm.open(heater.port)
+        reader = asyncio.create_task(consume(comm))
+        try:
+            command = comm.request(msg, data, timeout=timeout, retries=retries)
+            await comm.send()
+            return await asyncio.wait_for(command, 5.0), command
+        finally:
+            reader.cancel()
+            comm.close()
+
+    async def consume(comm):
+        async for rxm in comm.messages():
+            pass
+
+    return asyncio.run(main())
+
+
+def test_request_is_acknowledged():
+    heater = simulator.PtyHeater(rate=20)
+    heater.start()
+    try:
+        outcome, command = run_request(heater, MSG.T_SETPOINT, 50.0)
+    finally:
+        heater.close()
+    assert outcome == Outcome.ACK
+    assert command.attempts == 1
+
+
+def test_request_is_rejected():
+    heater = simulator.PtyHeater(rate=20)
+    heater.start()
+    try:
+        outcome, command = run_request(heater, MSG.T_SETPOINT, 10000.0)
+    finally:
+        heater.close()
+    assert outcome == Outcome.NACK
+
+
+def test_request_without_reply_is_retried():
+    heater = simulator.PtyHeater(rate=20)
+    heater.heater.reply_ack = lambda cmd: None
+    heater.start()
+    try:
+        outcome, command = run_request(heater, MSG.START, timeout=0.1, retries=2)
+    finally:
+        heater.close()
+    assert outcome == Outcome.TIMEOUT
+    assert command.attempts == 3
+
+
+def test_data_read_while_checking_commands_is_not_missed():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+
+    async def main():
+        comm = AsyncComm()
+        await comm.open(os.ttyname(slave))
+        check_commands = comm.check_commands
+
+        async def write_while_checking():
+            # A batch arrives while messages() awaits check_commands(), once
+            comm.check_commands = check_commands
+            os.write(master, schemas[MSG.T_ACTUAL].encode(21.5) + schemas[MSG.MSG_END].encode())
+            await asyncio.sleep(0.05)
+            await check_commands()
+
+        comm.check_commands = write_while_checking
+        try:
+            return await asyncio.wait_for(comm.recv(), 1.0)
+        finally:
+            comm.close()
+
+    try:
+        rxm = asyncio.run(main())
+    finally:
+        os.close(master)
+        os.close(slave)
+    assert rxm.msg == MSG.T_ACTUAL
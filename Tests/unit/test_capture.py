@@ -0,0 +1,143 @@
+import time
+import pytest
+from capture import Trace, TraceWriter, ReplaySerial, RX, TX, parse_replay_url, serial_for_url
+from devices import DeviceManager
+from pycomm import Comm, MSG, schemas
+
+
+def telemetry(n):
+    """n batches of temperature, current and MSG_END"""
+    return [schemas[MSG.T_ACTUAL].encode(20.0 + i) + schemas[MSG.CURRENT].encode(i / 10.0) +
+            schemas[MSG.MSG_END].encode() for i in range(n)]
+
+
+def write_trace(filename, batches, framed=False):
+    trace = TraceWriter(filename, framed=framed)
+    for batch in batches:
+        trace.write(RX, batch)
+        trace.write(TX, bytes([MSG.ACK, MSG.MSG_END]))
+    trace.close()
+
+
+def test_trace_round_trip(tmp_path):
+    filename = str(tmp_path / "trace.dht")
+    batches = telemetry(10)
+    write_trace(filename, batches, framed=True)
+
+    trace = Trace(filename)
+    assert trace.framed
+    assert len(trace.chunks) == 20
+    assert [bytes(data) for _, _, data in trace.received()] == batches
+    times = [t for t, _, _ in trace.chunks]
+    assert times == sorted(times)
+
+
+def test_truncated_trace(tmp_path):
+    filename = str(tmp_path / "trace.dht")
+    write_trace(filename, telemetry(10))
+    with open(filename, 'r+b') as file:
+        file.truncate(file.seek(0, 2) - 3)
+    assert len(Trace(filename).chunks) == 19
+
+
+def test_not_a_trace(tmp_path):
+    filename = tmp_path / "trace.dht"
+    filename.write_bytes(b'not a trace file')
+    with pytest.raises(ValueError):
+        Trace(str(filename))
+
+
+def test_parse_replay_url():
+    assert parse_replay_url("replay://a/b.dht") == ("a/b.dht", 1.0)
+    assert parse_replay_url("replay://a/b.dht?speed=100") == ("a/b.dht", 100.0)
+    assert parse_replay_url("replay://a/b.dht?speed=max") == ("a/b.dht", None)
+    assert parse_replay_url("replay://a/b.dht?speed=0") == ("a/b.dht", None)
+
+
+def test_replay_through_comm(tmp_path):
+    filename = str(tmp_path / "trace.dht")
+    write_trace(filename, telemetry(100))
+
+    comm = Comm(f"replay://{filename}?speed=max", timeout=0)
+    assert isinstance(comm.ser, ReplaySerial)
+    values = []
+    while not comm.ser.done or comm.rx.pending():
+        for rxm in comm.read_messages():
+            if rxm.msg == MSG.T_ACTUAL:
+                values.append(schemas.decode(rxm))
+    comm.close()
+    assert values == [20.0 + i for i in range(100)]
+
+
+def test_capture_and_replay(tmp_path):
+    # Capture what Comm reads from a port, then replay it through a new Comm
+    filename = str(tmp_path / "trace.dht")
+    comm = Comm("loop://", timeout=0)
+    comm.start_capture(filename)
+    data = b''.join(telemetry(20))
+    comm.ser.write(data)
+    received = [(rxm.msg, bytes(rxm.payload)) for rxm in comm.read_messages()]
+    comm.close()
+
+    replay = Comm(f"replay://{filename}?speed=max", timeout=0)
+    replayed = []
+    while not replay.ser.done:
+        replayed += [(rxm.msg, bytes(rxm.payload)) for rxm in replay.read_messages()]
+    replay.close()
+    assert len(received) == 60
+    assert replayed == received
+
+
+def test_replay_in_real_time(tmp_path):
+    filename = str(tmp_path / "trace.dht")
+    trace = TraceWriter(filename)
+    trace.write(RX, b'\x01')
+    time.sleep(0.2)
+    trace.write(RX, b'\x02')
+    trace.close()
+
+    port = serial_for_url(f"replay://{filename}?speed=2", timeout=1.0)
+    assert port.read(1) == b'\x01'
+    assert port.in_waiting == 0
+    t0 = time.monotonic()
+    assert port.read(1) == b'\x02'
+    assert 0.05 < time.monotonic() - t0 < 0.5
+    assert port.done
+    port.close()
+
+
+def test_replay_at_max_speed_through_device_manager(tmp_path):
+    filename = str(tmp_path / "trace.dht")
+    write_trace(filename, telemetry(500))
+
+    manager = DeviceManager(poll_interval=0.02)
+    device = manager.add("replay", f"replay://{filename}?speed=max")
+    manager.connect(device)
+    manager.start()
+    try:
+        values = []
+        t0 = time.monotonic()
+        while len(values) < 500 and time.monotonic() - t0 < 5.0:
+            values += [value for _, msg, value in device.drain() if msg == MSG.T_ACTUAL]
+            time.sleep(0.01)
+        elapsed = time.monotonic() - t0
+    finally:
+        manager.close()
+    assert values == [20.0 + i for i in range(500)]
+    assert elapsed < 0.5
+
+
+def test_max_speed_reads_are_bounded(tmp_path):
+    filename = str(tmp_path / "trace.dht")
+    batches = telemetry(20000)
+    write_trace(filename, batches)
+
+    port = serial_for_url(f"replay://{filename}?speed=max", timeout=0)
+    waiting = port.in_waiting
+    assert ReplaySerial.MAX_WAITING - len(batches[0]) < waiting <= ReplaySerial.MAX_WAITING
+    assert len(port.read(waiting)) == waiting
+    total = waiting
+    while not port.done:
+        total += len(port.read(port.in_waiting))
+    assert total == sum(len(b) for b in batches)
+    port.close()
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from commands import PendingCommands, Outcome
+from devices import DeviceManager
+from pycomm import Comm, MSG, schemas
+
+
+def test_cancelled_await_keeps_command():
+    pending = PendingCommands(timeout=0.01, retries=0)
+
+    async def wait():
+        command = pending.add(MSG.T_SETPOINT, 50.0)
+        pending.sent(MSG.T_SETPOINT)
+        try:
+            await asyncio.wait_for(command, 0.001)
+        except asyncio.TimeoutError:
+            pass
+        return command
+
+    command = asyncio.run(wait())
+    assert not command.future.cancelled()
+
+    time.sleep(0.02)
+    assert pending.expire() == []
+    assert command.outcome == Outcome.TIMEOUT
+
+
+def test_cancelled_future_is_not_completed():
+    pending = PendingCommands()
+    command = pending.add(MSG.START)
+    pending.sent(MSG.START)
+    command.future.cancel()
+
+    assert pending.complete(MSG.START, True) is command
+    assert command.outcome is None
+
+
+def test_io_thread_survives_cancelled_command():
+    manager = DeviceManager()
+    device = manager.add("loop://")
+    device.comm.pending.timeout = 0.05
+    device.comm.pending.retries = 0
+    manager.connect(device)
+    manager.start()
+    try:
+        command = device.set_setpoint(50.0)
+        command.future.cancel()
+        time.sleep(0.3)
+        assert manager._thread.is_alive()
+        assert not device.comm.pending
+    finally:
+        manager.close()
+
+
+def sent(comm):
+    """Messages written to a loop:// port since the last call, as (msg, value)"""
+    return [(rxm.msg, schemas.decode(rxm)) for rxm in comm.read_messages()]
+
+
+def test_outbox_keeps_newest_value():
+    comm = Comm("loop://", timeout=0)
+    try:
+        first = comm.request(MSG.T_SETPOINT, 40.0)
+        comm.post(MSG.START)
+        second = comm.request(MSG.T_SETPOINT, 50.0)
+        assert first.outcome == Outcome.SUPERSEDED
+        assert sent(comm) == []
+
+        comm.flush()
+        assert sent(comm) == [(MSG.T_SETPOINT, 50.0), (MSG.START, None), (MSG.MSG_END, None)]
+        assert not second.done()
+        assert not comm.outbox
+    finally:
+        comm.close()
+
+
+def test_stop_removes_queued_start():
+    comm = Comm("loop://", timeout=0)
+    try:
+        start = comm.request(MSG.START)
+        comm.post(MSG.T_SETPOINT, 50.0)
+        comm.post(MSG.STOP)
+        assert sent(comm) == [(MSG.STOP, None), (MSG.MSG_END, None)]
+        assert start.outcome == Outcome.SUPERSEDED
+        assert list(comm.outbox) == [MSG.T_SETPOINT]
+    finally:
+        comm.close()
+
+
+def test_reset_clears_outbox():
+    comm = Comm("loop://", timeout=0)
+    try:
+        commands = [comm.request(MSG.START), comm.request(MSG.T_SETPOINT, 50.0)]
+        comm.post(MSG.RESET)
+        assert sent(comm) == [(MSG.RESET, None), (MSG.MSG_END, None)]
+        assert not comm.outbox
+        assert [command.outcome for command in commands] == [Outcome.SUPERSEDED] * 2
+
+        comm.flush()
+        assert sent(comm) == []
+    finally:
+        comm.close()
+
+
+def test_send_urgent_bypasses_outbox():
+    comm = Comm("loop://", timeout=0)
+    try:
+        comm.post(MSG.T_SETPOINT, 50.0)
+        command = comm.pending.add(MSG.STOP)
+        comm.send_urgent(MSG.STOP)
+        assert sent(comm) == [(MSG.STOP, None), (MSG.MSG_END, None)]
+        assert command.sent
+        assert list(comm.outbox) == [MSG.T_SETPOINT]
+    finally:
+        comm.close()
+
+
+def test_drop_supersedes_unsent_commands():
+    pending = PendingCommands()
+    in_flight = pending.add(MSG.START)
+    pending.sent(MSG.START)
+    queued = [pending.add(MSG.START), pending.add(MSG.T_SETPOINT, 50.0)]
+
+    pending.drop(MSG.START)
+    assert queued[0].outcome == Outcome.SUPERSEDED
+    assert not queued[1].done()
+    assert not in_flight.done()
+
+    pending.drop()
+    assert queued[1].outcome == Outcome.SUPERSEDED
+    assert not in_flight.done()
+    assert len(pending) == 1
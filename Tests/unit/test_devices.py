@@ -0,0 +1,75 @@
+import time
+import pytest
+from devices import DeviceManager
+
+simulator = pytest.importorskip("simulator")
+needs_pty = pytest.mark.skipif(not hasattr(simulator.os, "openpty"), reason="needs a pseudo terminal")
+
+
+@needs_pty
+def test_gui_calls_do_not_wait_for_io_thread():
+    heater = simulator.PtyHeater(rate=0.5)
+    manager = DeviceManager(poll_interval=2.0)
+    manager.connect(manager.add("heater", heater.port))
+    device = manager.add("loop://")
+    manager.start()
+    try:
+        time.sleep(0.05)    # I/O thread is waiting in select()
+        t0 = time.perf_counter()
+        assert not manager.is_serviced(device)
+        manager.connect(device)
+        assert manager.is_serviced(device)
+        manager.disconnect(device)
+        assert not manager.is_serviced(device)
+        assert time.perf_counter() - t0 < 0.2
+    finally:
+        manager.close()
+        heater.close()
+
+
+@needs_pty
+def test_device_connected_while_waiting_is_serviced():
+    heater = simulator.PtyHeater(rate=100)
+    heater.start()
+    manager = DeviceManager(poll_interval=5.0)
+    device = manager.add("heater", heater.port)
+    manager.start()
+    try:
+        time.sleep(0.05)
+        manager.connect(device)
+        deadline = time.monotonic() + 2.0
+        while not device.drain() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert time.monotonic() < deadline
+    finally:
+        manager.close()
+        heater.close()
+
+
+@needs_pty
+def test_reconnected_device_is_serviced():
+    heater = simulator.PtyHeater(rate=100)
+    heater.start()
+    manager = DeviceManager()
+    device = manager.add("heater", heater.port)
+    manager.start()
+    try:
+        manager.connect(device)
+        manager.disconnect(device)
+        manager.connect(device)
+        time.sleep(0.05)
+        device.drain()
+        time.sleep(0.2)
+        assert device.drain()
+    finally:
+        manager.close()
+        heater.close()
+
+
+def test_stop_does_not_wait_for_poll_interval():
+    manager = DeviceManager(poll_interval=5.0)
+    manager.start()
+    time.sleep(0.05)
+    t0 = time.perf_counter()
+    manager.close()
+    assert time.perf_counter() - t0 < 1.0
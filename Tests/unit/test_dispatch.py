@@ -0,0 +1,76 @@
+from dispatch import Dispatcher
+from pycomm import MSG
+
+
+def collect(calls, name):
+    def handler(device, batch):
+        calls.append((name, device, batch))
+    return handler
+
+
+SAMPLES = [(0.0, MSG.T_ACTUAL, 20.0), (0.0, MSG.CURRENT, 1.0), (0.1, MSG.T_ACTUAL, 20.1),
+           (0.1, MSG.STATUS, 3), (0.2, MSG.CURRENT, 1.1)]
+
+
+def test_batches_by_message_id():
+    dispatcher = Dispatcher()
+    calls = []
+    dispatcher.subscribe(MSG.CURRENT, collect(calls, "current"))
+    dispatcher.subscribe(MSG.T_ACTUAL, collect(calls, "temperature"))
+    dispatcher.dispatch("dev", SAMPLES)
+
+    # In order of the first sample of each message id, STATUS has no handler
+    assert calls == [("temperature", "dev", [SAMPLES[0], SAMPLES[2]]),
+                     ("current", "dev", [SAMPLES[1], SAMPLES[4]])]
+
+
+def test_several_handlers_and_subscribe_all():
+    dispatcher = Dispatcher()
+    calls = []
+    dispatcher.subscribe(MSG.STATUS, collect(calls, "a"))
+    dispatcher.subscribe(MSG.STATUS, collect(calls, "b"))
+    dispatcher.subscribe_all(collect(calls, "all"))
+    dispatcher.dispatch("dev", SAMPLES)
+    assert [name for name, _, _ in calls] == ["a", "b", "all"]
+    assert calls[2][2] == SAMPLES
+
+    calls.clear()
+    dispatcher.dispatch("dev", [])
+    assert calls == []
+
+
+def test_unsubscribe():
+    dispatcher = Dispatcher()
+    calls = []
+    a = dispatcher.subscribe(MSG.T_ACTUAL, collect(calls, "a"))
+    b = dispatcher.subscribe(MSG.T_ACTUAL, collect(calls, "b"))
+    every = dispatcher.subscribe_all(collect(calls, "all"))
+
+    dispatcher.unsubscribe(MSG.T_ACTUAL, a)
+    dispatcher.unsubscribe_all(every)
+    dispatcher.dispatch("dev", SAMPLES)
+    assert [name for name, _, _ in calls] == ["b"]
+
+    dispatcher.unsubscribe(MSG.T_ACTUAL, b)
+    dispatcher.unsubscribe(MSG.CURRENT, b)      # Not subscribed
+    assert MSG.T_ACTUAL not in dispatcher.handlers
+    calls.clear()
+    dispatcher.dispatch("dev", SAMPLES)
+    assert calls == []
+
+
+def test_subscribe_during_dispatch():
+    dispatcher = Dispatcher()
+    calls = []
+    later = collect(calls, "later")
+
+    def first(device, batch):
+        calls.append(("first", device, batch))
+        dispatcher.subscribe(MSG.T_ACTUAL, later)
+
+    dispatcher.subscribe(MSG.T_ACTUAL, first)
+    dispatcher.dispatch("dev", SAMPLES)
+    assert [name for name, _, _ in calls] == ["first"]
+    dispatcher.unsubscribe(MSG.T_ACTUAL, first)
+    dispatcher.dispatch("dev", SAMPLES)
+    assert [name for name, _, _ in calls] == ["first", "later"]
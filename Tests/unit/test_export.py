@@ -0,0 +1,83 @@
+import csv
+import numpy as np
+from devices import Device
+from export import export_csv, record_blocks, resample_record, format_block
+
+
+def device_with_record(n=1000):
+    """Temperature every 0.1 s, current every 0.25 s starting at 0.05 s"""
+    device = Device("test", None)
+    t = np.arange(n) * 0.1
+    device.temperature.extend(20.0 + t)
+    device.setpoint.extend(np.where(t < 50.0, 25.0, 30.0))
+    device.timestamp.extend(t)
+    device.status_history.extend(np.ones(n))
+    t_current = 0.05 + np.arange(int(n * 0.4)) * 0.25
+    device.current.extend(t_current / 10.0)
+    device.current_timestamp.extend(t_current)
+    return device
+
+
+def concat(blocks, field):
+    return np.concatenate([block[field] for block in blocks])
+
+
+def test_current_as_of_temperature_timestamps():
+    device = device_with_record()
+    blocks = list(record_blocks(device, block_rows=64))
+    t = concat(blocks, 'timestamp')
+    t_current = concat(blocks, 'current_timestamp')
+    current = concat(blocks, 'current')
+
+    assert t.size == 1000
+    assert np.isnan(current[0]) and np.isnan(t_current[0])  # No current sample before 0.05 s
+
+    t_src = np.asarray(device.current_timestamp)
+    for i in range(1, 1000):
+        j = np.searchsorted(t_src, t[i], 'right') - 1
+        assert t_current[i] == t_src[j]
+        assert current[i] == device.current[j]
+        assert t_current[i] <= t[i]
+
+
+def test_resampled_export():
+    device = device_with_record()
+    blocks = list(resample_record(device, rate=2.0, block_rows=16))
+    grid = concat(blocks, 'timestamp')
+    assert np.array_equal(grid, np.arange(0, 200) / 2.0)
+    assert np.array_equal(concat(blocks, 'current_timestamp'), grid)
+
+    # Linear channels are interpolated, the setpoint steps
+    temperature = concat(blocks, 'temperature')
+    assert np.allclose(temperature, 20.0 + grid, atol=1e-4)
+    current = concat(blocks, 'current')
+    assert np.isnan(current[0])
+    assert np.allclose(current[1:-1], grid[1:-1] / 10.0, atol=1e-6)
+    setpoint = concat(blocks, 'setpoint')
+    assert np.all(setpoint[grid < 50.0] == 25.0)
+    assert np.all(setpoint[grid >= 50.0] == 30.0)
+
+
+def test_float32_values_round_trip(tmp_path):
+    device = device_with_record(100)
+    values = np.random.default_rng(0).uniform(0, 300, 100).astype(np.float32)
+    device.temperature.clear()
+    device.temperature.extend(values)
+
+    filename = tmp_path / "export.csv"
+    export_csv(filename, device)
+    with open(filename, newline='') as file:
+        rows = list(csv.reader(file))
+
+    assert rows[0][0] == 'Temperature'
+    assert len(rows) == 101
+    assert np.array_equal(np.array([r[0] for r in rows[1:]], dtype=np.float32), values)
+    assert np.allclose([float(r[2]) for r in rows[1:]], np.arange(100) * 0.1, rtol=1e-15)
+
+
+def test_empty_record():
+    device = Device("test", None)
+    assert list(record_blocks(device)) == []
+    assert list(resample_record(device, 10.0)) == []
+    assert format_block({field: np.empty(0) for field in
+                         ('temperature', 'setpoint', 'timestamp', 'current', 'current_timestamp')}) == ""
@@ -0,0 +1,94 @@
+import random
+import struct
+import pytest
+from pycomm import MSG, FramedDecoder, frame_batch, schemas, FRAME_MAX_LENGTH
+
+
+def batch(value):
+    return schemas[MSG.T_ACTUAL].encode(value) + schemas[MSG.MSG_END].encode()
+
+
+def values(decoder):
+    return [schemas.decode(rxm) for rxm in decoder.messages() if rxm.msg == MSG.T_ACTUAL]
+
+
+def test_valid_frames():
+    decoder = FramedDecoder()
+    decoder.feed(b''.join(frame_batch(batch(float(i))) for i in range(5)))
+    assert values(decoder) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert decoder.frames == 5
+    assert decoder.crc_errors == 0
+    assert decoder.discarded == 0
+    assert decoder.pending() == 0
+
+
+def test_frame_split_across_feeds():
+    decoder = FramedDecoder()
+    data = frame_batch(batch(1.0)) + frame_batch(batch(2.0))
+    received = []
+    for i in range(len(data)):
+        decoder.feed(data[i:i + 1])
+        received += values(decoder)
+    assert received == [1.0, 2.0]
+    assert decoder.discarded == 0
+
+
+def test_bad_crc_is_counted_and_skipped():
+    decoder = FramedDecoder()
+    corrupt = bytearray(frame_batch(batch(2.0)))
+    corrupt[5] ^= 0xFF
+    decoder.feed(frame_batch(batch(1.0)) + bytes(corrupt) + frame_batch(batch(3.0)))
+    assert values(decoder) == [1.0, 3.0]
+    assert decoder.frames == 2
+    assert decoder.crc_errors == 1
+    assert decoder.discarded == len(corrupt)
+
+
+def test_garbage_between_frames_is_discarded():
+    decoder = FramedDecoder()
+    decoder.feed(b'\x01\x02\x03' + frame_batch(batch(1.0)) + b'\xa5\x00' + frame_batch(batch(2.0)))
+    assert values(decoder) == [1.0, 2.0]
+    assert decoder.discarded == 5
+
+
+@pytest.mark.parametrize("length", [FRAME_MAX_LENGTH, FRAME_MAX_LENGTH + 1, 4000])
+def test_resync_after_corrupt_length(length):
+    decoder = FramedDecoder()
+    corrupt = bytearray(frame_batch(batch(0.0)))
+    struct.pack_into('<H', corrupt, 2, length)
+    decoder.feed(bytes(corrupt))
+    for i in range(1, 50):
+        decoder.feed(frame_batch(batch(float(i))))
+    assert values(decoder) == [float(i) for i in range(1, 50)]
+    assert decoder.frames == 49
+    assert decoder.discarded == len(corrupt)
+    assert decoder.pending() == 0
+
+
+def test_batch_larger_than_frame_is_rejected():
+    with pytest.raises(ValueError):
+        frame_batch(bytes(FRAME_MAX_LENGTH + 1))
+
+
+def test_lost_and_corrupted_frames():
+    rng = random.Random(1)
+    for trial in range(50):
+        decoder = FramedDecoder()
+        expected = []
+        received = []
+        for i in range(200):
+            frame = bytearray(frame_batch(batch(float(i))))
+            p = rng.random()
+            if p < 0.1:
+                continue
+            if p < 0.2:
+                frame[rng.randrange(len(frame))] ^= 1 << rng.randrange(8)
+            else:
+                expected.append(float(i))
+            decoder.feed(bytes(frame))
+            received += values(decoder)
+        # A frame following a corrupted length is only decoded once the next valid frame arrived
+        decoder.feed(frame_batch(batch(-1.0)))
+        received += values(decoder)
+        assert received[-1] == -1.0
+        assert received[:-1] == expected
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("dearpygui")
+from logger import LogBuffer, text_filter
+
+INFO, WARNING, ERROR = 2, 3, 4
+
+
+def test_oldest_records_are_dropped():
+    buffer = LogBuffer(capacity=3)
+    for i in range(5):
+        buffer.append(INFO, f"message {i}", t=float(i))
+    assert len(buffer) == 3
+    assert [record.message for record in buffer.records] == ["message 2", "message 3", "message 4"]
+    assert [record.seq for record in buffer.records] == [2, 3, 4]
+    assert buffer.seq == 5
+
+
+def test_repeated_message_is_counted():
+    buffer = LogBuffer()
+    first = buffer.append(ERROR, "Sensor fault", t=1.0)
+    assert buffer.append(ERROR, "Sensor fault", t=2.0) is first
+    assert first.count == 2
+    assert first.time == 2.0
+    assert first.text == "[ERROR] Sensor fault (x2)"
+
+    # Same text at another level or after another message is a new record
+    buffer.append(WARNING, "Sensor fault")
+    buffer.append(ERROR, "Sensor fault")
+    assert len(buffer) == 3
+    assert buffer.seq == 3
+
+
+def test_clear():
+    buffer = LogBuffer()
+    buffer.append(INFO, "a")
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.cleared == 1
+    assert buffer.append(INFO, "a").seq == 1
+
+
+def test_select():
+    buffer = LogBuffer()
+    buffer.append(INFO, "Connected to /dev/ttyACM0")
+    buffer.append(WARNING, "Watchdog ACK delayed")
+    buffer.append(ERROR, "Failed to connect to /dev/ttyACM1")
+    assert [r.message for r in buffer.select(level=WARNING)] == ["Watchdog ACK delayed",
+                                                                 "Failed to connect to /dev/ttyACM1"]
+    assert [r.seq for r in buffer.select("ttyacm")] == [0, 2]
+    assert [r.seq for r in buffer.select("ttyacm, watchdog, -failed")] == [0, 1]
+    assert [r.seq for r in buffer.select("error", level=ERROR)] == [2]
+
+
+def test_text_filter():
+    assert text_filter("")("anything")
+    assert text_filter("-")("anything")
+    assert not text_filter("-debug")("[DEBUG] x")
+    assert text_filter("a, b")("xbx")
+    assert not text_filter("a, b")("xcx")
@@ -0,0 +1,76 @@
+import json
+import math
+import pytest
+from metrics import BUCKET_OFFSET, BUCKETS, Histogram, Metrics, MetricsExporter
+
+
+def test_power_of_two_buckets():
+    histogram = Histogram("test")
+    for value in (1.0, 1.5, 1.999, 2.0, 0.75, 0.0, -1.0, 1e-20, 1e30):
+        histogram.observe(value)
+    assert histogram.buckets[BUCKET_OFFSET + 1] == 3    # [1, 2)
+    assert histogram.buckets[BUCKET_OFFSET + 2] == 1    # [2, 4)
+    assert histogram.buckets[BUCKET_OFFSET] == 1        # [0.5, 1)
+    assert histogram.buckets[0] == 3                    # Zero, negative and below the smallest bucket
+    assert histogram.buckets[BUCKETS - 1] == 1          # Above the largest bucket
+    assert sum(histogram.buckets) == histogram.count == 9
+
+
+def test_statistics():
+    histogram = Histogram("test", "s")
+    assert histogram.mean == 0.0
+    assert histogram.quantile(0.5) == 0.0
+    assert histogram.snapshot() == {"count": 0}
+
+    for value in (0.001, 0.002, 0.003, 0.004):
+        histogram.observe(value)
+    assert histogram.mean == pytest.approx(0.0025)
+    assert (histogram.min, histogram.max) == (0.001, 0.004)
+    assert histogram.snapshot()["count"] == 4
+
+
+def test_quantiles_are_bucket_upper_bounds():
+    histogram = Histogram("test")
+    for _ in range(99):
+        histogram.observe(0.01)
+    histogram.observe(3.0)
+
+    # 0.01 lies in [2**-7, 2**-6), 3.0 in [2, 4), bounded by the maximum
+    assert histogram.quantile(0.5) == math.ldexp(1.0, -6)
+    assert histogram.quantile(0.99) == math.ldexp(1.0, -6)
+    assert histogram.quantile(1.0) == 3.0
+    for q in (0.1, 0.5, 0.9, 0.99):
+        assert histogram.quantile(q) >= 0.01
+
+
+def test_registry():
+    registry = Metrics()
+    counter = registry.counter("a.count")
+    assert registry.counter("a.count") is counter
+    histogram = registry.histogram("b.time", "s")
+    counter.inc()
+    counter.inc(2)
+    histogram.observe(0.5)
+    snapshot = registry.snapshot()
+    assert list(snapshot) == ["a.count", "b.time"]
+    assert snapshot["a.count"] == {"value": 3}
+    assert snapshot["b.time"]["p50"] == 0.5
+
+    registry.reset()
+    assert registry.histogram("b.time") is histogram
+    assert histogram.count == 0 and histogram.unit == "s"
+    assert counter.value == 0
+
+
+def test_exporter_appends_snapshots(tmp_path):
+    registry = Metrics()
+    registry.counter("a.count").inc(5)
+    filename = str(tmp_path / "metrics.jsonl")
+    exporter = MetricsExporter(filename, interval=0.01, registry=registry)
+    exporter.start()
+    exporter.stop()
+    with open(filename) as file:
+        lines = [json.loads(line) for line in file]
+    assert exporter.error is None
+    assert lines
+    assert lines[-1]["metrics"] == {"a.count": {"value": 5}}
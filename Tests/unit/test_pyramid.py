@@ -0,0 +1,98 @@
+import numpy as np
+from pyramid import MinMaxPyramid
+from record import ChunkedArray
+
+
+def record(n, chunk_size=4096):
+    x = ChunkedArray(np.float64, chunk_size)
+    y = ChunkedArray(np.float32, chunk_size)
+    x.extend(np.arange(n, dtype=float))
+    y.extend(np.zeros(n))
+    return x, y
+
+
+def test_spikes_survive_as_bucket_min_max():
+    x, y = record(100000)
+    y.chunks[1][1234] = 50.0
+    y.chunks[20][7] = -50.0
+    pyramid = MinMaxPyramid(x, [y])
+    pyramid.update()
+
+    xs, values = pyramid.query(0, 99999, 1000)
+    assert xs.size <= 1100
+    assert values.max() == 50.0
+    assert values.min() == -50.0
+    assert np.all(np.diff(xs) >= 0)
+
+
+def test_zoom_in_returns_raw_samples():
+    x, y = record(100000)
+    y.extend(np.arange(10, dtype=np.float32))   # Samples 100000 to 100009
+    x.extend(np.arange(100000, 100010, dtype=float))
+    pyramid = MinMaxPyramid(x, [y])
+    pyramid.update()
+
+    xs, values = pyramid.query(100002, 100005, 1000)
+    assert list(xs) == [100002.0, 100003.0, 100004.0, 100005.0, 100006.0]
+    assert list(values[0]) == [2.0, 3.0, 4.0, 5.0, 6.0]
+
+
+def test_incremental_update_matches_full_build():
+    x, y = record(0)
+    incremental = MinMaxPyramid(x, [y])
+    rng = np.random.default_rng(0)
+    for i in range(50):
+        n = int(rng.integers(1, 3000))
+        x.extend(np.arange(len(x), len(x) + n, dtype=float))
+        y.extend(rng.normal(size=n))
+        incremental.update()
+
+    full = MinMaxPyramid(x, [y])
+    full.update()
+    for max_points in (100, 1000, 100000):
+        xi, vi = incremental.query(0, len(x), max_points)
+        xf, vf = full.query(0, len(x), max_points)
+        assert np.array_equal(xi, xf)
+        assert np.array_equal(vi, vf)
+        assert vi.max() == np.asarray(y).max()
+
+
+def test_latest_samples_are_included():
+    x, y = record(10001)
+    y.chunks[2][10000 - 8192] = 7.0     # Last sample, not merged into any higher level yet
+    pyramid = MinMaxPyramid(x, [y])
+    pyramid.update()
+
+    xs, values = pyramid.query(0, 10000, 100)
+    assert xs[-1] == 10000.0
+    assert values[0, -1] == 7.0
+
+
+def test_levels_grow_without_copying():
+    x, y = record(0)
+    pyramid = MinMaxPyramid(x, [y], chunk_size=16)
+    x.extend(np.arange(64, dtype=float))
+    y.extend(np.zeros(64))
+    pyramid.update()
+    first = pyramid.levels[1].x.chunks[0]
+
+    x.extend(np.arange(64, 100000, dtype=float))
+    y.extend(np.zeros(100000 - 64))
+    pyramid.update()
+    assert pyramid.levels[1].x.chunks[0] is first
+    assert pyramid.levels[1].n == 50000
+
+
+def test_clear_starts_over():
+    x, y = record(1000)
+    pyramid = MinMaxPyramid(x, [y])
+    pyramid.update()
+    x.clear()
+    y.clear()
+    x.extend([0.0, 1.0])
+    y.extend([3.0, 4.0])
+    pyramid.update()
+
+    assert len(pyramid) == 2
+    xs, values = pyramid.query(0, 1, 1000)
+    assert list(values[0]) == [3.0, 4.0]
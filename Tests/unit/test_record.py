@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from record import ChunkedArray
+
+
+def filled(n, chunk_size=8):
+    array = ChunkedArray(np.float64, chunk_size)
+    array.extend(np.arange(n, dtype=float))
+    return array
+
+
+def test_append_across_chunk_boundaries():
+    array = ChunkedArray(np.float32, 8)
+    for i in range(20):
+        array.append(i)
+    assert len(array) == 20
+    assert len(array.chunks) == 3
+    assert np.array_equal(np.asarray(array), np.arange(20, dtype=np.float32))
+    assert array.nbytes == 3 * 8 * 4
+
+
+@pytest.mark.parametrize("sizes", [(3, 5, 8, 1, 20), (8, 8), (17,), (1,) * 10])
+def test_extend_across_chunk_boundaries(sizes):
+    array = ChunkedArray(np.float64, 8)
+    expected = []
+    for size in sizes:
+        values = np.arange(len(expected), len(expected) + size, dtype=float)
+        array.extend(values)
+        expected.extend(values)
+    assert np.array_equal(np.asarray(array), expected)
+    assert list(array) == expected
+
+
+def test_growth_does_not_copy():
+    array = filled(8)
+    first = array.chunks[0]
+    array.extend(np.arange(100.0))
+    assert array.chunks[0] is first
+    assert len(array.chunks) == 14
+
+
+def test_indexing():
+    array = filled(20)
+    assert array[0] == 0.0
+    assert array[7] == 7.0
+    assert array[8] == 8.0
+    assert array[-1] == 19.0
+    with pytest.raises(IndexError):
+        array[20]
+    with pytest.raises(IndexError):
+        array[-21]
+
+
+def test_views_are_not_copies():
+    array = filled(20)
+    views = array.views()
+    assert [v.size for v in views] == [8, 8, 4]
+    assert all(np.shares_memory(view, chunk) for view, chunk in zip(views, array.chunks))
+    array.extend([20.0])
+    assert views[2].size == 4     # Views do not grow with the array
+    assert array.views()[2].size == 5
+
+
+def test_slice():
+    array = filled(20)
+    within = array.slice(9, 14)
+    assert np.array_equal(within, np.arange(9, 14))
+    assert np.shares_memory(within, array.chunks[1])
+    assert np.array_equal(array.slice(5, 18), np.arange(5, 18))
+    assert np.array_equal(array.slice(-5, 100), np.arange(20))
+    assert array.slice(10, 10).size == 0
+
+
+@pytest.mark.parametrize("side", ["left", "right"])
+def test_searchsorted(side):
+    array = ChunkedArray(np.float64, 8)
+    values = np.repeat(np.arange(10.0), 3)
+    array.extend(values)
+    for x in (-1.0, 0.0, 2.5, 2.0, 7.0, 8.0, 9.0, 10.0):
+        assert array.searchsorted(x, side) == np.searchsorted(values, x, side)
+
+
+def test_clear():
+    array = filled(20)
+    array.clear()
+    assert len(array) == 0
+    assert np.asarray(array).size == 0
+    assert array.views() == []
+    array.append(1.0)
+    assert list(array) == [1.0]
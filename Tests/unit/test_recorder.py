@@ -0,0 +1,97 @@
+import csv
+import os
+import time
+import numpy as np
+from devices import Device
+from recorder import CsvRecorder
+
+
+def append_rows(device, start, stop):
+    t = np.arange(start, stop, dtype=float)
+    device.temperature.extend(20.0 + t)
+    device.setpoint.extend(np.full(t.size, 25.0))
+    device.timestamp.extend(t)
+    device.status_history.extend(np.ones(t.size))
+    device.current.extend(np.full(t.size, 1.5))
+    device.current_timestamp.extend(t)
+
+
+def read_rows(filename):
+    with open(filename, newline='') as file:
+        rows = list(csv.reader(file))
+    assert rows[0][0] == 'Temperature'
+    return rows[1:]
+
+
+def test_rows_roll_over_at_max_rows(tmp_path):
+    device = Device("test", None)
+    append_rows(device, 0, 250)
+    recorder = CsvRecorder(device, str(tmp_path / "session"), flush_interval=0.01, max_rows=100)
+    recorder.start()
+    append_rows(device, 250, 320)
+    time.sleep(0.05)
+    recorder.stop()
+
+    assert recorder.error is None
+    assert recorder.rows == 320
+    assert [os.path.basename(f) for f in recorder.files] == \
+        ["session.csv", "session_2.csv", "session_3.csv", "session_4.csv"]
+    rows = [read_rows(f) for f in recorder.files]
+    assert [len(r) for r in rows] == [100, 100, 100, 20]
+    timestamps = [float(row[2]) for part in rows for row in part]
+    assert timestamps == list(np.arange(320.0))
+
+
+def test_rotate_while_recording(tmp_path):
+    device = Device("test", None)
+    append_rows(device, 0, 50)
+    recorder = CsvRecorder(device, str(tmp_path / "session"), flush_interval=10.0)
+    recorder.start()
+
+    # Save button: the current file is finished with all rows so far, recording continues in a new one
+    filename = recorder.rotate()
+    deadline = time.monotonic() + 2.0
+    finished = []
+    while not finished and time.monotonic() < deadline:
+        finished = recorder.drain_finished()
+        time.sleep(0.01)
+    assert finished == [filename] == recorder.files[:1]
+    assert len(read_rows(filename)) == 50
+
+    append_rows(device, 50, 80)
+    recorder.stop()
+    assert len(recorder.files) == 2
+    assert [float(row[2]) for row in read_rows(recorder.files[1])] == list(np.arange(50.0, 80.0))
+
+
+def test_write_error_stops_recorder(tmp_path):
+    device = Device("test", None)
+    append_rows(device, 0, 10)
+    recorder = CsvRecorder(device, str(tmp_path / "session"), flush_interval=0.01)
+    recorder.start()
+    recorder._file.close()      # Like a removed drive
+    deadline = time.monotonic() + 2.0
+    append_rows(device, 10, 20)
+    while recorder.is_running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not recorder.is_running()
+    assert isinstance(recorder.error, ValueError)
+    recorder.stop()
+
+
+def test_failed_rotate_is_not_reported_finished(tmp_path):
+    class FailingRecorder(CsvRecorder):
+        def _finish_file(self):
+            raise OSError("No space left on device")
+
+    device = Device("test", None)
+    append_rows(device, 0, 10)
+    recorder = FailingRecorder(device, str(tmp_path / "session"), flush_interval=10.0)
+    recorder.start()
+    recorder.rotate()
+    deadline = time.monotonic() + 2.0
+    while recorder.is_running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert isinstance(recorder.error, OSError)
+    assert recorder.drain_finished() == []
+    recorder.stop()
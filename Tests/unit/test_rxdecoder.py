@@ -0,0 +1,130 @@
+import random
+import threading
+from pycomm import Comm, MSG, MSG_TYPE, RxDecoder, schemas
+
+
+def stream(n):
+    """Tokens of all three types and the (msg, payload) pairs they decode to"""
+    tokens = []
+    expected = []
+    for i in range(n):
+        kind = i % 4
+        if kind == 0:
+            token = schemas[MSG.T_ACTUAL].encode(float(i))
+        elif kind == 1:
+            token = schemas[MSG.STATUS].encode(i)
+        elif kind == 2:
+            token = schemas[MSG.ERROR_MSG].encode("x" * (i % 40))
+        else:
+            token = schemas[MSG.MSG_END].encode()
+        tokens.append(token)
+        payload = token[2:] if kind == 2 else token[1:]
+        expected.append((token[0] & 0b00111111, payload))
+    return b''.join(tokens), expected
+
+
+def decoded(decoder):
+    return [(rxm.msg, rxm.payload) for rxm in decoder.messages()]
+
+
+def test_variable_token_split_across_feeds():
+    decoder = RxDecoder()
+    token = schemas[MSG.T_ACTUAL].encode(21.5)
+    decoder.feed(token[:3])
+    assert decoded(decoder) == []
+    assert decoder.missing() == 2
+    decoder.feed(token[3:])
+    rxm = decoder.next_msg()
+    assert rxm.msg == MSG.T_ACTUAL
+    assert rxm.msg_type == MSG_TYPE.MSG_VARIABLE
+    assert schemas.decode(rxm) == 21.5
+    assert decoder.pending() == 0
+
+
+def test_custom_token_with_size_byte_alone():
+    decoder = RxDecoder()
+    token = schemas[MSG.ERROR_MSG].encode("Overtemperature")
+    decoder.feed(token[:1])
+    assert decoder.next_msg() is None
+    assert decoder.missing() == 1
+    decoder.feed(token[1:2])
+    assert decoder.next_msg() is None
+    assert decoder.missing() == len("Overtemperature")
+    decoder.feed(token[2:])
+    rxm = decoder.next_msg()
+    assert rxm.msg == MSG.ERROR_MSG
+    assert schemas.decode(rxm) == "Overtemperature"
+
+
+def test_empty_custom_token():
+    decoder = RxDecoder()
+    decoder.feed(schemas[MSG.ERROR_MSG].encode("") + schemas[MSG.MSG_END].encode())
+    assert decoded(decoder) == [(MSG.ERROR_MSG, b''), (MSG.MSG_END, b'')]
+
+
+def test_buffer_compaction():
+    decoder = RxDecoder(size=16)
+    token = schemas[MSG.T_ACTUAL].encode(1.0)
+    received = []
+    for _ in range(100):
+        # Leave a partial token behind, so the unread rest is moved to the front of the buffer
+        decoder.feed(token + token[:2])
+        received += decoded(decoder)
+        decoder.feed(token[2:])
+        received += decoded(decoder)
+    assert len(received) == 200
+    assert len(decoder.buf) == 16
+    assert decoder.pending() == 0
+
+
+def test_buffer_grows_for_large_reads():
+    decoder = RxDecoder(size=16)
+    data, expected = stream(100)
+    decoder.feed(data)
+    assert len(decoder.buf) >= len(data)
+    assert decoded(decoder) == expected
+
+
+def test_random_fragmentation():
+    rng = random.Random(0)
+    data, expected = stream(400)
+    for trial in range(200):
+        decoder = RxDecoder(size=rng.choice((8, 64, 4096)))
+        received = []
+        pos = 0
+        while pos < len(data):
+            n = rng.randint(1, 20)
+            decoder.feed(data[pos:pos + n])
+            pos += n
+            received += decoded(decoder)
+        assert received == expected
+        assert decoder.pending() == 0
+
+
+def test_get_next_msg_waits_for_rest_of_token():
+    comm = Comm("loop://", timeout=1.0)
+    try:
+        token = schemas[MSG.ERROR_MSG].encode("Sensor fault")
+        comm.ser.write(token[:1])
+        timer = threading.Timer(0.05, comm.ser.write, (token[1:],))
+        timer.start()
+        rxm = comm.get_next_msg()
+        timer.join()
+        assert rxm.msg == MSG.ERROR_MSG
+        assert comm.get_payload(str) == "Sensor fault"
+    finally:
+        comm.close()
+
+
+def test_get_next_msg_reads_stream():
+    comm = Comm("loop://", timeout=0.1)
+    try:
+        data, expected = stream(40)
+        comm.ser.write(data)
+        received = []
+        while comm.msg_available():
+            rxm = comm.get_next_msg()
+            received.append((rxm.msg, rxm.payload))
+        assert received == expected
+    finally:
+        comm.close()
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from pycomm import Comm, MSG, schemas
+
+
+def test_round_trip():
+    assert schemas[MSG.T_ACTUAL].decode(schemas[MSG.T_ACTUAL].encode(21.5)[1:]) == 21.5
+    assert schemas[MSG.STATUS].decode(schemas[MSG.STATUS].encode(3)[1:]) == 3
+    assert schemas[MSG.ERROR_MSG].decode(schemas[MSG.ERROR_MSG].encode("Sensor fault")[2:]) == "Sensor fault"
+
+
+def test_invalid_utf8_string_is_decoded_lossy():
+    comm = Comm("loop://", timeout=0.1)
+    try:
+        comm.ser.write(bytes([schemas[MSG.ERROR_MSG].prefix, 4]) + b'ab\xff\x00')
+        assert comm.get_next_msg().msg == MSG.ERROR_MSG
+        assert comm.get_payload(str) == "ab�"
+    finally:
+        comm.close()
+
+
+def test_decode_batch_of_one_message():
+    schema = schemas[MSG.T_ACTUAL]
+    values = np.arange(100, dtype=np.float32) / 4
+    buffer = b''.join(schema.encode(float(v)) for v in values)
+    assert np.array_equal(schema.decode_batch(buffer), values)
+    with pytest.raises(ValueError):
+        schema.decode_batch(buffer + schemas[MSG.CURRENT].encode(1.0))
+
+
+def test_decode_batch_of_interleaved_messages():
+    buffer = b''.join(schemas[MSG.T_ACTUAL].encode(20.0 + i) + schemas[MSG.CURRENT].encode(i / 2)
+                      for i in range(50))
+    result = schemas.decode_batch(buffer)
+    assert set(result) == {MSG.T_ACTUAL, MSG.CURRENT}
+    assert np.array_equal(result[MSG.T_ACTUAL], 20.0 + np.arange(50))
+    assert np.array_equal(result[MSG.CURRENT], np.arange(50) / 2)
+    with pytest.raises(ValueError):
+        schemas.decode_batch(buffer + schemas[MSG.MSG_END].encode() * 5)
@@ -0,0 +1,117 @@
+import csv
+import os
+import subprocess
+import sys
+import numpy as np
+import recorder
+from devices import Device
+from session import Session, SessionWriter, RECORD, TRAILER, INDEX_MAGIC
+
+
+def records(start, stop):
+    r = np.zeros(stop - start, RECORD)
+    r['timestamp'] = np.arange(start, stop) * 0.5
+    r['temperature'] = 20.0 + np.arange(start, stop) % 100
+    r['setpoint'] = 25.0
+    r['current'] = 1.5
+    r['current_timestamp'] = r['timestamp']
+    r['status'] = 1
+    return r
+
+
+def write_session(filename, n=1000, chunk_rows=128):
+    with SessionWriter(filename, chunk_rows=chunk_rows, created=1.0e9) as writer:
+        for start in range(0, n, 300):
+            writer.append(records(start, min(start + 300, n)))
+    return records(0, n)
+
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / "test.dhs")
+    expected = write_session(filename)
+
+    session = Session(filename)
+    assert len(session) == 1000
+    assert session.created == 1.0e9
+    assert len(session.chunks) == 8
+    for field in RECORD.names:
+        assert np.array_equal(session[field], expected[field])
+
+
+def test_crash_recovery(tmp_path):
+    filename = str(tmp_path / "test.dhs")
+    expected = write_session(filename)
+
+    # Chunk index and trailer lost: the chunks are found by their headers
+    size = os.path.getsize(filename)
+    with open(filename, 'r+b') as file:
+        file.truncate(size - TRAILER.size - 10)
+    assert np.array_equal(Session(filename)['timestamp'], expected['timestamp'])
+
+    # Last records partially written
+    with open(filename, 'r+b') as file:
+        file.truncate(size - TRAILER.size - 8*32 - RECORD.itemsize // 2)
+    session = Session(filename)
+    assert len(session) == 999
+    assert np.array_equal(session['timestamp'], expected['timestamp'][:999])
+
+
+def test_unclosed_writer_is_readable_after_flush(tmp_path):
+    filename = str(tmp_path / "test.dhs")
+    writer = SessionWriter(filename, chunk_rows=128)
+    writer.append(records(0, 200))
+    writer.flush()
+    try:
+        assert np.array_equal(Session(filename)['timestamp'], records(0, 200)['timestamp'])
+    finally:
+        writer.close()
+
+
+def test_select(tmp_path):
+    filename = str(tmp_path / "test.dhs")
+    write_session(filename)
+    session = Session(filename)
+
+    selected = session.select(100.0, 200.0)
+    assert selected['timestamp'][0] == 100.0
+    assert selected['timestamp'][-1] == 200.0
+    assert len(selected) == 201
+    assert len(session.select(1000.0, 2000.0)) == 0
+
+
+def test_convert_to_csv(tmp_path):
+    filename = str(tmp_path / "test.dhs")
+    expected = write_session(filename, n=100)
+    script = os.path.join(os.path.dirname(recorder.__file__), "session.py")
+    subprocess.run([sys.executable, script, filename], check=True, capture_output=True)
+
+    with open(str(tmp_path / "test.csv"), newline='') as file:
+        rows = list(csv.reader(file))
+    assert len(rows) == 101
+    assert [float(r[0]) for r in rows[1:]] == list(expected['temperature'])
+    assert [float(r[2]) for r in rows[1:]] == list(expected['timestamp'])
+
+
+def test_recorder_writes_index_before_sync(tmp_path, monkeypatch):
+    device = Device("test", None)
+    device.temperature.extend(np.full(10, 20.0))
+    device.setpoint.extend(np.full(10, 25.0))
+    device.timestamp.extend(np.arange(10.0))
+    device.status_history.extend(np.ones(10))
+
+    # Contents of the file when it is synced to disk
+    synced = []
+    fsync = os.fsync
+
+    def check_fsync(fd):
+        with open(rec.filename, 'rb') as file:
+            synced.append(file.read())
+        fsync(fd)
+
+    monkeypatch.setattr(recorder.os, "fsync", check_fsync)
+    rec = recorder.SessionRecorder(device, str(tmp_path / "session"), fsync_interval=1000.0)
+    rec.start()
+    rec.stop()
+
+    assert synced[-1].endswith(INDEX_MAGIC)
+    assert len(Session(rec.filename)) == 10
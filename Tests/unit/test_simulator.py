@@ -0,0 +1,30 @@
+import time
+import pytest
+from pycomm import Comm, MSG
+
+simulator = pytest.importorskip("simulator")
+needs_pty = pytest.mark.skipif(not hasattr(simulator.os, "openpty"), reason="needs a pseudo terminal")
+
+
+@needs_pty
+def test_batches_are_not_cut_when_host_is_slow():
+    heater = simulator.PtyHeater(rate=500, samples_per_batch=50, framed=True)
+    comm = Comm(heater.port, timeout=0, framed=True)
+    heater.start()
+    try:
+        time.sleep(0.3)     # Host does not read, the pty fills up
+
+        statuses = 0
+        deadline = time.monotonic() + 0.3
+        while time.monotonic() < deadline:
+            statuses += sum(rxm.msg == MSG.STATUS for rxm in comm.read_messages())
+            time.sleep(0.01)
+        heater.stop()
+        statuses += sum(rxm.msg == MSG.STATUS for rxm in comm.read_messages())
+    finally:
+        comm.close()
+        heater.close()
+
+    assert comm.rx.crc_errors == 0
+    assert comm.rx.discarded == 0
+    assert statuses > 0
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import timebase
+from pyramid import MinMaxPyramid
+from record import ChunkedArray
+
+
+class FakeTime:
+    """Monotonic and wall clock in nanoseconds, advanced by the test"""
+
+    def __init__(self):
+        self.mono = 1_000_000_000
+        self.wall = 1_700_000_000_000_000_000
+
+    def monotonic_ns(self):
+        return self.mono
+
+    def time_ns(self):
+        return self.wall
+
+    def advance(self, seconds):
+        self.mono += int(seconds * 1e9)
+        self.wall += int(seconds * 1e9)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(timebase, "time", fake)
+    return fake
+
+
+def test_follows_wall_clock(clock):
+    tb = timebase.Timebase()
+    assert tb() == pytest.approx(1.7e9)
+    clock.advance(1.5)
+    assert tb() == pytest.approx(1.7e9 + 1.5)
+
+
+def test_step_forward_is_applied_at_once(clock):
+    tb = timebase.Timebase()
+    clock.wall += 3600 * 10**9
+    assert tb.sync() == pytest.approx(3600.0)
+    assert tb() == pytest.approx(1.7e9 + 3600)
+
+
+def test_step_back_is_slewed(clock):
+    tb = timebase.Timebase(slew_rate=0.5)
+    stamps = []
+    for _ in range(3600):
+        clock.advance(1.0)
+        stamps.append(tb())
+
+    # Wall clock set back by an hour, like the end of daylight saving time
+    clock.wall -= 3600 * 10**9
+    assert tb.sync() == pytest.approx(-3600.0)
+    for i in range(3 * 3600):
+        clock.advance(1.0)
+        if i % 600 == 0:
+            tb.sync()
+        stamps.append(tb())
+
+    assert np.all(np.diff(stamps) > 0)
+    # Caught up after 7200 s at half speed, then back to real time
+    assert stamps[-1] == pytest.approx(clock.wall * 1e-9)
+    assert stamps[3600 + 7199] == pytest.approx(clock.wall * 1e-9 - 3600, abs=1.0)
+    assert stamps[3600 + 100] - stamps[3600 + 99] == pytest.approx(0.5)
+
+
+def test_records_stay_ascending(clock):
+    tb = timebase.Timebase()
+    x = ChunkedArray(np.float64)
+    y = ChunkedArray(np.float32)
+    for i in range(7200):
+        if i == 3600:
+            clock.wall -= 3600 * 10**9
+            tb.sync()
+        clock.advance(1.0)
+        x.append(tb())
+        y.append(i)
+
+    pyramid = MinMaxPyramid(x, [y])
+    pyramid.update()
+    assert pyramid.x_range() == (x[0], x[7199])
+    assert x.searchsorted(x[5000]) == 5000
@@ -0,0 +1,103 @@
+import threading
+import time
+from devices import DeviceManager
+from watchdog import Watchdog
+
+KEEPALIVE = 2   # ACK and MSG_END
+
+
+def acks(device):
+    """Keep-alives written to a loop:// port since the last call"""
+    return len(device.comm.ser.read(device.comm.ser.in_waiting)) // KEEPALIVE
+
+
+def test_period():
+    manager = DeviceManager()
+    device = manager.add("loop://")
+    manager.connect(device)
+    acks(device)    # PID gains sent on connect
+    watchdog = Watchdog(manager, period=0.05)
+    watchdog.start()
+    time.sleep(0.525)
+    watchdog.stop()
+    assert 8 <= acks(device) <= 11
+    manager.close()
+
+
+def test_gap_measurement():
+    manager = DeviceManager()
+    device = manager.add("loop://")
+    manager.connect(device)
+    device.feed_watchdog()
+    time.sleep(0.1)
+    device.feed_watchdog()
+    assert 0.1 <= device.take_ack_gap() < 0.2
+    assert device.take_ack_gap() < 0.05
+
+    # Time since the last ACK counts, even if no ACK could be written since
+    time.sleep(0.1)
+    assert device.take_ack_gap() >= 0.1
+    manager.close()
+
+
+def test_alarm():
+    manager = DeviceManager()
+    device = manager.add("loop://")
+    manager.connect(device)
+    watchdog = Watchdog(manager, timeout=0.2, margin=0.1)
+    watchdog.tick()
+    time.sleep(0.05)
+    watchdog.tick()
+    assert watchdog.drain_alarms() == []
+
+    time.sleep(0.15)
+    watchdog.tick()
+    alarms = watchdog.drain_alarms()
+    assert len(alarms) == 1
+    assert alarms[0][0] is device
+    assert "before the controller resets" in alarms[0][1]
+    assert watchdog.drain_alarms() == []
+    manager.close()
+
+
+def test_skips_devices_not_serviced():
+    manager = DeviceManager()
+    device = manager.add("loop://")
+    manager.connect(device)
+    manager._unregister(device)     # Like the I/O thread after a failed read
+    assert device.is_open()
+    acks(device)
+    Watchdog(manager).tick()
+    assert acks(device) == 0
+    manager.close()
+
+
+def test_busy_device_does_not_delay_others():
+    manager = DeviceManager()
+    hung = manager.add("hung", "loop://")
+    device = manager.add("loop://")
+    manager.connect(hung)
+    manager.connect(device)
+    acks(device)
+
+    # Another thread stuck writing to the hung port holds its transmit buffer
+    held, release = threading.Event(), threading.Event()
+
+    def write():
+        with hung.comm.tx_lock:
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    held.wait()
+    try:
+        watchdog = Watchdog(manager, write_timeout=0.05)
+        t0 = time.perf_counter()
+        watchdog.tick()
+        assert time.perf_counter() - t0 < 0.2
+        assert acks(device) == 1
+    finally:
+        release.set()
+        thread.join()
+        manager.close()